@@ -1,18 +1,38 @@
 import asyncio
 import contextlib
 import logging
-import sys
+import signal
+from aiohttp import web
 from aiogram.client.default import DefaultBotProperties
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
 from aiogram.enums import ParseMode
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 # Importa as nossas configurações (o Token!)
 from core.config import settings
+from core.logging_config import LogContextMiddleware, setup_logging
 
 # Importa os nossos manipuladores de comandos
 from handlers import common, wallet, catalog, purchase, support, giftcard, suggestions, admin, affiliate
+from keyboards.callback_data import callback_tokens
+from services.api_client import api_client
+from services.broadcast import broadcast_engine
+from services.expiration_acks import expiration_acks
 from services.expiration_notifier import run_expiration_notifier
+from services.fsm_storage import create_fsm_storage
+from services.local_db import local_db
+from services.metrics import HandlerMetricsMiddleware, monitor_loop_lag, start_metrics_server
+from services.outbound import OutboundMiddleware, outbound_limiter
+from services.recharge_poller import recharge_poller
+from services.scheduler import scheduler
+from services.sharding import ShardingDispatcher, WorkerPool
+from services.supervisor import InFlightMiddleware, supervisor
+from services.suppression import SuppressionMiddleware, suppression_list
+from services.tracing import HandlerSpanMiddleware, TracingMiddleware, tracer
+from services.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
 
 # Seta a lista dos comandos, para exibir o menu azul
 async def set_bot_commands(bot: Bot):
@@ -29,18 +49,71 @@ async def set_bot_commands(bot: Bot):
     ]
     await bot.set_my_commands(commands)
 
-async def main():
-    # 1. Cria o objeto Bot com o nosso token
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Recebe os updates por webhook num servidor aiohttp embutido
+    (em vez de long polling).
+    """
+    if not settings.WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET não definido, os pedidos ao webhook não são autenticados.")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET
+    ).register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    # Para o health check do load balancer
+    async def healthz(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+    app.router.add_get("/healthz", healthz)
+
+    if settings.WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
+    await site.start()
+    logger.info(
+        "Bot a ouvir o webhook em %s:%s%s", settings.WEBHOOK_HOST, settings.WEBHOOK_PORT, settings.WEBHOOK_PATH
+    )
+
+    # SIGTERM/SIGINT: deixa de aceitar updates (o resto do encerramento é feito em main)
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sinal, parar.set)
+    try:
+        await parar.wait()
+    finally:
+        await runner.cleanup()
+
+def create_bot() -> Bot:
+    """
+    Cria o objeto Bot com o nosso token (usado também pelos workers).
+    """
     bot = Bot(
-    token=settings.TELEGRAM_BOT_TOKEN, 
-    default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
-)
-    
-    # 2. Cria o Dispatcher (distribuidor de mensagens)
-    dp = Dispatcher()
+        token=settings.TELEGRAM_BOT_TOKEN, 
+        default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
+    )
+    # Todos os envios passam pelo limitador central (limites do Telegram + RetryAfter)
+    bot.session.middleware(
+        OutboundMiddleware(outbound_limiter, max_retries=settings.TELEGRAM_RETRY_AFTER_MAX_RETRIES)
+    )
+    return bot
 
-    # 3. Regista os nossos roteadores (handlers)
-    # (Por agora, apenas os comandos comuns como /start)
+def include_routers(dp: Dispatcher) -> Dispatcher:
+    """
+    Regista os nossos roteadores (handlers) no Dispatcher.
+    """
     dp.include_router(admin.router)
     dp.include_router(affiliate.router)
     dp.include_router(common.router)
@@ -50,29 +123,127 @@ async def main():
     dp.include_router(support.router)
     dp.include_router(giftcard.router)
     dp.include_router(suggestions.router)
+    return dp
+
+def create_dispatcher() -> Dispatcher:
+    """
+    Cria o Dispatcher (distribuidor de mensagens), com o estado das
+    conversas guardado fora da memória (sobrevive a reinícios).
+    """
+    dp = Dispatcher(storage=create_fsm_storage())
+    # Updates em tratamento: o encerramento espera que terminem
+    dp.update.outer_middleware(InFlightMiddleware(supervisor))
+    # user_id/update_id em todos os registos de log feitos durante o tratamento
+    dp.update.outer_middleware(LogContextMiddleware())
+    # Um trace por update (amostrado), com os pedidos à API e à Bot API como filhos
+    dp.update.outer_middleware(TracingMiddleware(tracer))
+    # Quem volta a falar com o bot (qualquer update) sai da lista de inativos
+    dp.update.outer_middleware(SuppressionMiddleware(suppression_list))
+    # Latência e erros por handler (propaga-se aos roteadores incluídos)
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+        observer.middleware(HandlerSpanMiddleware(tracer))
+    return include_routers(dp)
+
+async def main():
+    # 1. Cria o objeto Bot
+    bot = create_bot()
+
+    # 2. Cria o Dispatcher. Com BOT_WORKERS > 0, este processo só recebe os
+    # updates e distribui-os pelos workers (cada usuário fica sempre no mesmo)
+    worker_pool = None
+    if settings.BOT_WORKERS > 0:
+        worker_pool = WorkerPool(settings.BOT_WORKERS, create_bot, create_dispatcher)
+        worker_pool.start()
+        # Os workers ficam com uma parte da quota global da Bot API (respostas
+        # interativas); este processo fica com o resto (broadcasts, avisos)
+        outbound_limiter.scale(1 - settings.BOT_WORKERS_RATE_SHARE)
+        # Os roteadores só servem para saber que tipos de update pedir ao Telegram
+        dp = include_routers(ShardingDispatcher(worker_pool))
+    else:
+        dp = create_dispatcher()
+
+    # 3. Abre o pool de ligações HTTP com a nossa API
+    await api_client.start()
 
-    # 4. Limpa webhooks pendentes (boa prática)
-    await bot.delete_webhook(drop_pending_updates=True)
+    # Endpoint /metrics (se METRICS_PORT estiver definido) e atraso do event loop
+    metrics_runner = await start_metrics_server()
+    await tracer.start()
+    supervisor.supervise(
+        "loop_lag", lambda: monitor_loop_lag(settings.METRICS_LOOP_LAG_INTERVAL_SECONDS)
+    )
+    if worker_pool is not None:
+        # Reinicia os workers que morram (mesmo sem updates para eles)
+        supervisor.supervise("worker_pool_monitor", lambda: worker_pool.monitor(intervalo=5.0))
+
+    modo_webhook = settings.BOT_RUN_MODE == "webhook"
+
+    # 4. Limpa webhooks pendentes (boa prática, só em polling)
+    if not modo_webhook:
+        await bot.delete_webhook(drop_pending_updates=True)
 
     await set_bot_commands(bot)
 
-    expiration_notifier_task = asyncio.create_task(run_expiration_notifier(bot))
+    # Carrega a lista de usuários inativos (filtra broadcasts e avisos)
+    # e o registo local das confirmações de avisos de expiração
+    await suppression_list.load()
+    await expiration_acks.start()
+    await user_cache.purge()
+    await callback_tokens.purge()
+
+    if settings.BOT_BACKGROUND_JOBS:
+        supervisor.supervise("expiration_notifier", lambda: run_expiration_notifier(bot))
+
+        # Tarefas agendadas (ex: avisos de expiração de recargas PIX)
+        await scheduler.start(bot)
+        # Acompanha as recargas em aberto e avisa quando o pagamento é confirmado
+        await recharge_poller.start(bot)
+
+        # Retoma os broadcasts que foram interrompidos por um reinício
+        await broadcast_engine.start(bot)
+    else:
+        # Só guarda o Bot (os broadcasts iniciados aqui correm neste processo)
+        await broadcast_engine.start(bot, retomar=False)
+    if worker_pool is not None:
+        # Os broadcasts pedidos pelo admin (num worker) correm neste processo
+        supervisor.supervise(
+            "broadcast_watch", lambda: broadcast_engine.watch(intervalo=settings.BROADCAST_CHECKPOINT_SECONDS)
+        )
     
-    # 5. Inicia o "polling" (o bot começa a "ouvir" o Telegram)
-    print("Bot a iniciar...")
+    # 5. Começa a receber updates (polling ou webhook)
+    logger.info("Bot a iniciar...")
     try:
-        await dp.start_polling(bot)
+        if modo_webhook:
+            await run_webhook(bot, dp)
+        else:
+            # (o polling pára sozinho em SIGTERM/SIGINT)
+            await dp.start_polling(bot, close_bot_session=False)
     finally:
-        expiration_notifier_task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await expiration_notifier_task
+        # Já não entram updates: deixa terminar os que estão a meio (ex: compras),
+        # neste processo e nos workers em simultâneo, com um único prazo
+        drenagem = [supervisor.drain(timeout=settings.SHUTDOWN_DRAIN_SECONDS)]
+        if worker_pool is not None:
+            drenagem.append(worker_pool.stop(timeout=settings.SHUTDOWN_DRAIN_SECONDS))
+        await asyncio.gather(*drenagem)
+
+        await scheduler.stop()
+        await recharge_poller.stop()
+        await broadcast_engine.stop()
+        await expiration_acks.stop()
+        await tracer.stop()
+        await supervisor.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await api_client.close()
+        await local_db.close()
+        await bot.session.close()
 
 if __name__ == "__main__":
-    # Configura o logging para vermos o que se passa
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    
+    # Configura o logging (JSON, escrito numa thread à parte)
+    setup_logging()
+
     try:
         # Inicia a função 'main' assíncrona
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("Bot desligado.")
+        logger.info("Bot desligado.")
@@ -18,8 +18,219 @@ class Settings(BaseSettings):
     # Telegram id do admin (@nathampa)
     ADMIN_TELEGRAM_ID: int = 1792589341
 
+    # --- Modo de execução ---
+    # "polling" (padrão, para desenvolvimento) ou "webhook" (servidor aiohttp
+    # embutido; permite vários processos atrás de um load balancer)
+    BOT_RUN_MODE: str = "polling"
+    # Tarefas de fundo (notificador, scheduler, recargas, broadcasts): com vários
+    # processos, deixe ativo em apenas um deles
+    BOT_BACKGROUND_JOBS: bool = True
+    # Processos worker que tratam os updates (0 = tudo neste processo). Cada
+    # usuário é sempre tratado pelo mesmo worker, por ordem de chegada
+    BOT_WORKERS: int = 0
+    # Com BOT_WORKERS > 0: fração da quota global da Bot API repartida pelos
+    # workers (respostas aos usuários). O resto fica no processo principal,
+    # que corre os broadcasts e os avisos em massa
+    BOT_WORKERS_RATE_SHARE: float = 0.3
+
+    # --- Estado das conversas (FSM) ---
+    # "memory" (perde-se ao reiniciar), "sqlite" (base local, um host) ou
+    # "redis" (vários hosts; requer o pacote opcional 'redis')
+    FSM_STORAGE: str = "sqlite"
+    FSM_REDIS_URL: str = "redis://localhost:6379/0"
+    # Conversas sem atividade há mais do que isto (segundos) são descartadas (0 = nunca)
+    FSM_TTL_SECONDS: int = 24 * 3600
+
+    # --- Tarefas de fundo e encerramento ---
+    # Backoff (segundos) antes de reiniciar um loop de fundo que falhou
+    SUPERVISOR_RESTART_BACKOFF_BASE_SECONDS: float = 1.0
+    SUPERVISOR_RESTART_BACKOFF_MAX_SECONDS: float = 60.0
+    # Prazo (segundos) para terminar as operações em curso ao encerrar (SIGTERM)
+    SHUTDOWN_DRAIN_SECONDS: float = 25.0
+
+    # --- Webhook (BOT_RUN_MODE="webhook") ---
+    # URL pública (https) onde o Telegram entrega os updates; se vazia, o
+    # webhook não é registado no arranque (ex: registado por outro processo)
+    WEBHOOK_BASE_URL: str | None = None
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    # Validado no cabeçalho X-Telegram-Bot-Api-Secret-Token de cada pedido
+    WEBHOOK_SECRET: str | None = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+
     # Intervalo (em minutos) para checar expirações pendentes e notificar usuários
     EXPIRACAO_CHECK_INTERVAL_MINUTES: int = 30
+    # Itens pedidos à API por página (o notificador lê páginas até esvaziar)
+    EXPIRACAO_PAGE_SIZE: int = 200
+    # Avisos de expiração enviados em paralelo
+    EXPIRACAO_NOTIFIER_CONCURRENCY: int = 10
+    # Confirmações de aviso enviadas à API em lote: tamanho do lote e
+    # intervalo máximo (segundos) até enviar um lote incompleto
+    EXPIRACAO_ACK_BATCH_SIZE: int = 50
+    EXPIRACAO_ACK_FLUSH_SECONDS: float = 5.0
+
+    # --- Pool HTTP com a API (APIClient) ---
+    # Máximo de ligações simultâneas e de ligações mantidas abertas (keep-alive)
+    API_MAX_CONNECTIONS: int = 100
+    API_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    API_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+
+    # HTTP/2 (requer o pacote opcional 'h2': pip install "httpx[http2]")
+    API_HTTP2: bool = False
+
+    # Timeouts (em segundos). API_ENDPOINT_TIMEOUTS sobrepõe o padrão por endpoint,
+    # ex: API_ENDPOINT_TIMEOUTS='{"compras": 20, "all_ids": 30}'
+    API_TIMEOUT_SECONDS: float = 10.0
+    API_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    API_ENDPOINT_TIMEOUTS: dict[str, float] = {"compras": 20.0, "all_ids": 30.0}
+
+    # --- Resiliência dos pedidos à API ---
+    # Tentativas (incluindo a primeira) para leituras GET em erros de rede/5xx,
+    # com backoff exponencial com jitter entre elas
+    API_RETRY_ATTEMPTS: int = 3
+    API_RETRY_BACKOFF_BASE_SECONDS: float = 0.2
+    API_RETRY_BACKOFF_MAX_SECONDS: float = 2.0
+    # Tentativas para compras, recargas e resgates (POST com Idempotency-Key).
+    # 1 = sem repetições. Com mais de 1, só se repetem pedidos que de certeza
+    # não chegaram à API (erro ao ligar), a menos que a opção seguinte esteja ativa
+    API_WRITE_RETRY_ATTEMPTS: int = 1
+    # Ativar APENAS se o backend confirmadamente deduplicar as escritas pelo
+    # cabeçalho Idempotency-Key: permite repetir também depois de um timeout
+    # de leitura ou de um 5xx (a compra pode já ter sido feita do lado da API)
+    API_IDEMPOTENCY_KEYS_SUPPORTED: bool = False
+    # Tempo (segundos) e número máximo de resultados guardados por chave de
+    # idempotência (um toque repetido recebe o resultado original)
+    API_IDEMPOTENCY_RESULT_TTL_SECONDS: float = 600.0
+    API_IDEMPOTENCY_MAX_RESULTS: int = 5000
+
+    # Circuit breaker por endpoint: abre após N falhas seguidas
+    # e volta a testar a API depois de X segundos
+    API_BREAKER_FAILURE_THRESHOLD: int = 5
+    API_BREAKER_RESET_SECONDS: float = 30.0
+
+    # --- Envios ao Telegram (limites de taxa) ---
+    # Limite global (mensagens/segundo) e rajada máxima permitida
+    TELEGRAM_GLOBAL_RATE_PER_SECOND: float = 30.0
+    TELEGRAM_GLOBAL_BURST: int = 30
+    # Intervalo mínimo entre mensagens para o mesmo chat
+    # (privado: 1 msg/s; grupos: 20 msg/min) e rajada curta permitida
+    TELEGRAM_PRIVATE_CHAT_INTERVAL_SECONDS: float = 1.0
+    TELEGRAM_GROUP_CHAT_INTERVAL_SECONDS: float = 3.0
+    TELEGRAM_PER_CHAT_BURST: int = 3
+    # Quantas vezes repetir um envio após um TelegramRetryAfter
+    TELEGRAM_RETRY_AFTER_MAX_RETRIES: int = 3
+
+    # --- Base de dados local (SQLite) ---
+    # Guarda o estado que precisa de sobreviver a reinícios (ex: broadcasts)
+    LOCAL_DB_PATH: str = "data/bot.sqlite3"
+
+    # --- Tarefas agendadas (ex: aviso de expiração de recargas PIX) ---
+    # Jobs vencidos lidos por lote e executados em simultâneo (no máximo)
+    SCHEDULER_BATCH_SIZE: int = 100
+    SCHEDULER_CONCURRENCY: int = 10
+    # Tentativas por job e atraso base (segundos) antes de repetir um job que falhou
+    SCHEDULER_MAX_ATTEMPTS: int = 5
+    SCHEDULER_RETRY_DELAY_SECONDS: float = 30.0
+
+    # --- QR Code dos PIX de recarga ---
+    # Gera o QR localmente a partir do "copia e cola" e pede à API para não
+    # enviar a imagem (requer o pacote opcional 'qrcode': pip install "qrcode[png]")
+    PIX_QR_LOCAL_RENDER: bool = False
+    # Quantos 'file_id' de QR Codes já enviados guardar para reutilizar
+    PIX_QR_FILE_ID_CACHE_SIZE: int = 1000
+
+    # --- Acompanhamento de recargas PIX em aberto ---
+    # Recargas consultadas por lote e consultas em simultâneo (sem endpoint em lote)
+    RECHARGE_POLL_BATCH_SIZE: int = 100
+    RECHARGE_POLL_CONCURRENCY: int = 10
+    # Intervalo entre consultas de uma recarga: começa no mínimo e cresce até ao máximo
+    RECHARGE_POLL_MIN_INTERVAL_SECONDS: float = 5.0
+    RECHARGE_POLL_MAX_INTERVAL_SECONDS: float = 60.0
+    # Tempo (segundos) que ainda se acompanha uma recarga depois do prazo do PIX
+    RECHARGE_POLL_GRACE_SECONDS: float = 300.0
+    # Valores de 'status_pagamento' (GET /recargas/{id}) que significam
+    # "saldo creditado" e disparam o aviso ao usuário. Devem coincidir com
+    # os da API; status desconhecidos ficam registados no log (uma vez cada)
+    RECHARGE_PAID_STATUSES: list[str] = ["PAGO", "APROVADO", "CONCLUIDO"]
+
+    # --- Logging ---
+    LOG_LEVEL: str = "INFO"
+    # "json" (um objeto por linha, para o coletor de logs) ou "text"
+    LOG_FORMAT: str = "json"
+    # Ficheiro opcional, além do stdout
+    LOG_FILE: str | None = None
+    # Registos à espera da thread de escrita (acima disto são descartados)
+    LOG_QUEUE_SIZE: int = 10000
+    # Avisos/erros repetidos: só os primeiros LOG_DUPLICATE_BURST por janela
+    LOG_DUPLICATE_WINDOW_SECONDS: float = 60.0
+    LOG_DUPLICATE_BURST: int = 5
+
+    # --- Métricas ---
+    # Porta do endpoint /metrics (formato Prometheus); 0 = desativado
+    METRICS_PORT: int = 0
+    # Só local por omissão: o endpoint não tem autenticação
+    METRICS_HOST: str = "127.0.0.1"
+    # Intervalo (segundos) da medição do atraso do event loop
+    METRICS_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+
+    # --- Tracing ---
+    # Fração dos updates com trace (0 = desativado, 1 = todos)
+    TRACING_SAMPLE_RATE: float = 0.0
+    # Destino dos spans: "jsonl" (ficheiro local) ou "otlp" (coletor OpenTelemetry)
+    TRACING_EXPORTER: str = "jsonl"
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    TRACING_OTLP_URL: str = "http://127.0.0.1:4318/v1/traces"
+    TRACING_SERVICE_NAME: str = "telegram-bot"
+    # Intervalo (segundos) entre exportações dos spans
+    TRACING_FLUSH_SECONDS: float = 5.0
+    # Spans em memória à espera de exportação (acima disto são descartados)
+    TRACING_MAX_BUFFERED_SPANS: int = 10000
+
+    # --- Broadcast ---
+    # Workers de envio em paralelo (a taxa real é limitada pelo limitador central)
+    BROADCAST_WORKERS: int = 8
+    # Destinatários por página (leitura da API e da base local)
+    BROADCAST_PAGE_SIZE: int = 500
+    # Intervalo (segundos) entre checkpoints e atualizações da mensagem de progresso
+    BROADCAST_CHECKPOINT_SECONDS: float = 3.0
+    # Falhas seguidas ao ler a lista de usuários da API antes de desistir
+    BROADCAST_LOAD_MAX_RETRIES: int = 5
+    # Se a API não tiver GET /usuarios/ids (paginado), permite usar
+    # /usuarios/all-ids e paginar a lista em memória. Desligado por omissão:
+    # com muitos usuários, a lista inteira fica em memória durante o envio
+    API_USER_IDS_FULL_LIST_FALLBACK: bool = False
+
+    # --- Usuários inativos (bloquearam o bot / chat inexistente) ---
+    # Se ativo, a lista local também é reportada à API (POST /usuarios/inativos)
+    SUPPRESSION_REPORT_TO_BACKEND: bool = False
+
+    # --- Cache do catálogo de produtos ---
+    # Tempo (segundos) em que o catálogo é servido da memória sem consultar a API
+    CATALOG_CACHE_TTL_SECONDS: int = 60
+    # Tempo extra (segundos) em que a versão antiga ainda é servida
+    # enquanto o catálogo é atualizado em segundo plano
+    CATALOG_CACHE_MAX_STALE_SECONDS: int = 600
+    # Intervalo mínimo (segundos) entre idas à API por um produto que não
+    # está no catálogo em memória (ex: confirmação de um produto novo)
+    CATALOG_CACHE_MISS_REFRESH_SECONDS: float = 5.0
+
+    # --- Compras ---
+    # Depois de tratada uma confirmação de compra, cliques repetidos no mesmo
+    # botão durante este tempo (segundos) também são ignorados
+    PURCHASE_DEDUP_COOLDOWN_SECONDS: float = 5.0
+
+    # --- Cache dos usuários (registo e último saldo conhecido) ---
+    # Tempo (segundos) em que /start e a carteira usam o perfil em cache
+    # em vez de chamar POST /usuarios/register
+    USER_CACHE_TTL_SECONDS: float = 300.0
+    USER_CACHE_MAX_ENTRIES: int = 10000
+
+    # --- Botões inline (callback data) ---
+    # Botões cujos dados não cabem nos 64 bytes do callback_data levam um
+    # token; os dados ficam na base local durante este tempo (segundos)
+    CALLBACK_TOKENS_TTL_SECONDS: float = 7 * 24 * 3600
+    # Tokens mantidos também em memória (os mais recentes)
+    CALLBACK_TOKENS_MAX_ENTRIES: int = 50000
 
     # Configuração para ler do ficheiro .env
     model_config = SettingsConfigDict(env_file=".env")
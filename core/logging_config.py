@@ -0,0 +1,188 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.config import settings
+
+# Contexto do update em tratamento, acrescentado a todos os registos
+_user_id: ContextVar[int | None] = ContextVar("log_user_id", default=None)
+_update_id: ContextVar[int | None] = ContextVar("log_update_id", default=None)
+
+# Atributos que todos os LogRecord têm (o resto veio de extra={...})
+_ATRIBUTOS_PADRAO = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copia o contexto do update (user_id, update_id) para o registo. Corre
+    na thread de quem registou, antes de o registo ir para a fila.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "user_id"):
+            record.user_id = _user_id.get()
+        if not hasattr(record, "update_id"):
+            record.update_id = _update_id.get()
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+    """
+    Limita registos repetidos (mesmo logger, nível e mensagem-modelo, ex:
+    "Falha ao enviar broadcast #%s para %s: %s"): em cada janela passam só
+    os primeiros 'rajada'; o primeiro da janela seguinte indica quantos
+    foram suprimidos.
+    """
+    def __init__(self, janela_segundos: float, rajada: int, nivel_minimo: int = logging.WARNING):
+        super().__init__()
+        self.janela_segundos = janela_segundos
+        self.rajada = max(rajada, 1)
+        self.nivel_minimo = nivel_minimo
+        self._janelas: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.nivel_minimo or self.janela_segundos <= 0:
+            return True
+
+        chave = (record.name, record.levelno, record.msg)
+        agora = time.monotonic()
+        janela = self._janelas.get(chave)
+        if janela is None or agora - janela[0] >= self.janela_segundos:
+            if janela is not None and janela[1] > self.rajada:
+                record.suprimidos = janela[1] - self.rajada
+            self._janelas[chave] = [agora, 1]
+            if len(self._janelas) > 10_000:
+                self._limpar(agora)
+            return True
+
+        janela[1] += 1
+        return janela[1] <= self.rajada
+
+    def _limpar(self, agora: float) -> None:
+        self._janelas = {c: j for c, j in self._janelas.items() if agora - j[0] < self.janela_segundos}
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Põe os registos numa fila limitada, sem nunca esperar: se a thread de
+    escrita não acompanhar, o registo é descartado (e contado).
+
+    A formatação é feita pela thread de escrita, não por quem registou.
+    """
+    def __init__(self, fila: queue.Queue):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.descartados:
+            record.descartados_antes = self.descartados
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+        else:
+            self.descartados = 0
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Um objeto JSON por linha, com o contexto do update e os campos extra
+    (ex: endpoint, duration_ms).
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        registo = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for chave, valor in record.__dict__.items():
+            if chave not in _ATRIBUTOS_PADRAO and valor is not None:
+                registo[chave] = valor
+        if record.exc_info:
+            registo["exc"] = self.formatException(record.exc_info)
+        return json.dumps(registo, ensure_ascii=False, default=str)
+
+
+def setup_logging() -> None:
+    """
+    Configura o logging do processo: os registos vão para uma fila e são
+    escritos (stdout e, opcionalmente, ficheiro) por uma thread à parte,
+    por isso um coletor lento nunca bloqueia o event loop.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if settings.LOG_FORMAT.lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    destinos: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        destinos.append(logging.FileHandler(settings.LOG_FILE, encoding="utf-8"))
+    for destino in destinos:
+        destino.setFormatter(formatter)
+
+    fila: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(fila)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(DuplicateFilter(
+        janela_segundos=settings.LOG_DUPLICATE_WINDOW_SECONDS,
+        rajada=settings.LOG_DUPLICATE_BURST
+    ))
+
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [handler]
+    raiz.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """
+    Escreve o que ainda está na fila e pára a thread de escrita.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Middleware externo do Dispatcher: associa o usuário e o update em
+    tratamento a todos os registos feitos durante o tratamento.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        usuario = data.get("event_from_user")
+        token_usuario = _user_id.set(usuario.id if usuario is not None else None)
+        token_update = _update_id.set(event.update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            _user_id.reset(token_usuario)
+            _update_id.reset(token_update)
@@ -1,12 +1,11 @@
-import asyncio
-from aiogram import Router, types, F, Bot
-from aiogram.filters import Command, StateFilter, Filter
+from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject, StateFilter, Filter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
 # Importa nossas configs (para saber quem é o admin)
 from core.config import settings
-from services.api_client import api_client
+from services.broadcast import broadcast_engine, broadcast_store
 from states.user_states import BroadcastStates
 from keyboards.inline_keyboards import get_broadcast_confirmation_keyboard
 from keyboards.reply_keyboards import get_main_menu_keyboard, get_cancel_keyboard
@@ -84,9 +83,10 @@ async def handle_broadcast_message_received(message: Message, state: FSMContext)
     StateFilter(BroadcastStates.awaiting_confirmation), 
     IsAdmin()
 )
-async def handle_broadcast_confirm(query: types.CallbackQuery, state: FSMContext, bot: Bot):
+async def handle_broadcast_confirm(query: types.CallbackQuery, state: FSMContext):
     """
-    [ADMIN] O admin clicou em "Sim, enviar". Inicia o envio em massa.
+    [ADMIN] O admin clicou em "Sim, enviar". Cria um job de broadcast
+    (persistido na base local) e entrega-o ao motor de envio.
     Determina se usa COPY ou FORWARD.
     """
     
@@ -95,10 +95,8 @@ async def handle_broadcast_confirm(query: types.CallbackQuery, state: FSMContext
 
     if send_method_str == "copy":
         await query.message.edit_text("Iniciando envio (Modo Cópia Limpa)... ⏳")
-        send_function = bot.copy_message
     elif send_method_str == "forward":
         await query.message.edit_text("Iniciando envio (Modo Encaminhar)... ⏳")
-        send_function = bot.forward_message
     else:
         await query.message.edit_text("❌ Erro de método. Tente /broadcast novamente.")
         await state.clear()
@@ -113,61 +111,24 @@ async def handle_broadcast_confirm(query: types.CallbackQuery, state: FSMContext
         await state.clear()
         return
 
-    # 1. Buscar a lista de IDs da API
-    user_ids = await api_client.get_all_user_ids()
-    
-    if user_ids is None:
-        await query.message.edit_text("❌ Falha ao buscar lista de usuários na API.")
-        await state.clear()
-        return
-        
-    if not user_ids:
-        await query.message.edit_text("Nenhum cliente encontrado para enviar.")
-        await state.clear()
-        return
+    # 2. Cria o job e inicia o envio em segundo plano.
+    #    A lista de IDs é lida da API em páginas (sem os usuários inativos)
+    #    enquanto o envio já decorre; esta mensagem passa a mostrar o progresso.
+    job_id = await broadcast_engine.create_job(
+        metodo=send_method_str,
+        from_chat_id=msg_chat_id,
+        message_id=msg_id,
+        admin_chat_id=query.message.chat.id,
+        status_message_id=query.message.message_id
+    )
+    await state.clear()
 
-    # 2. Loop de envio
-    sucessos = 0
-    falhas = 0
-    total = len(user_ids)
-    
-    await query.message.edit_text(f"Enviando para {total} clientes... (0%)")
-
-    for i, user_id in enumerate(user_ids):
-        try:
-            # Usa a função (copy ou forward)
-            await send_function(
-                chat_id=user_id,
-                from_chat_id=msg_chat_id,
-                message_id=msg_id
-            )
-            sucessos += 1
-        except Exception as e:
-            # A falha mais comum é o usuário ter bloqueado o bot
-            print(f"Falha ao enviar broadcast para {user_id}: {e}")
-            falhas += 1
-            
-        # Edita a mensagem de status a cada 25 envios
-        if (i + 1) % 25 == 0 or (i + 1) == total:
-            percentual = int(((i + 1) / total) * 100)
-            await query.message.edit_text(
-                f"Enviando para {total} clientes... ({percentual}%)\n\n"
-                f"Enviados: {sucessos}\n"
-                f"Falhas: {falhas}"
-            )
-        
-        # Pausa de segurança para evitar Rate Limit do Telegram
-        # (100ms = 10 mensagens por segundo)
-        await asyncio.sleep(0.1) 
-
-    # 3. Relatório Final
     await query.message.edit_text(
-        f"✅ **Broadcast Concluído!**\n\n"
-        f"Enviado com sucesso: {sucessos}\n"
-        f"Falhas (bot bloqueado): {falhas}\n"
-        f"Total de Clientes: {total}"
+        f"Broadcast #{job_id}: a carregar a lista de clientes... ⏳\n\n"
+        f"Use /broadcast\\_status, /broadcast\\_pausar {job_id}, "
+        f"/broadcast\\_retomar {job_id} ou /broadcast\\_cancelar {job_id}."
     )
-    await state.clear()
+    await broadcast_engine.start_job(job_id)
 
 # --- 5. Cancelamento do Envio (Callback) ---
 @router.callback_query(F.data == "broadcast:cancel", StateFilter(BroadcastStates.awaiting_confirmation), IsAdmin())
@@ -176,4 +137,65 @@ async def handle_broadcast_cancel_callback(query: types.CallbackQuery, state: FS
     [ADMIN] O admin clicou em "Cancelar" no teclado inline.
     """
     await state.clear()
-    await query.message.edit_text("Broadcast cancelado.")
\ No newline at end of file
+    await query.message.edit_text("Broadcast cancelado.")
+
+# --- 6. Gestão dos jobs de broadcast ---
+ROTULOS_STATUS = {
+    "running": "▶️ a enviar",
+    "paused": "⏸ pausado",
+    "cancelled": "❌ cancelado",
+    "done": "✅ concluído",
+}
+
+@router.message(Command("broadcast_status"), IsAdmin())
+async def handle_broadcast_status(message: Message):
+    """
+    [ADMIN] Mostra o progresso dos últimos jobs de broadcast.
+    """
+    jobs = await broadcast_store.list_jobs(limite=5)
+    if not jobs:
+        await message.answer("Nenhum broadcast registado.")
+        return
+
+    linhas = []
+    for job in jobs:
+        # O progresso em memória é mais atual que o último checkpoint
+        progresso = broadcast_engine.progress(job["id"]) or job
+        processados = progresso["enviados"] + progresso["falhas"]
+        total = progresso["total"]
+        percentual = int(processados / total * 100) if total else 0
+        total_texto = str(total) if progresso["carregado"] else f"{total}+"
+        linhas.append(
+            f"#{job['id']} - {ROTULOS_STATUS.get(job['status'], job['status'])} - {percentual}%\n"
+            f"Enviados: {progresso['enviados']} | Falhas: {progresso['falhas']} | Total: {total_texto}"
+        )
+
+    await message.answer("**Broadcasts recentes:**\n\n" + "\n\n".join(linhas))
+
+def _parse_job_id(command: CommandObject) -> int | None:
+    try:
+        return int(command.args.strip())
+    except (AttributeError, ValueError):
+        return None
+
+@router.message(Command("broadcast_pausar", "broadcast_retomar", "broadcast_cancelar"), IsAdmin())
+async def handle_broadcast_control(message: Message, command: CommandObject):
+    """
+    [ADMIN] Pausa, retoma ou cancela um job de broadcast (ex: /broadcast_pausar 3).
+    """
+    job_id = _parse_job_id(command)
+    if job_id is None:
+        await message.answer(f"Uso: /{command.command} <id do broadcast>", parse_mode=None)
+        return
+
+    if command.command == "broadcast_pausar":
+        ok = await broadcast_engine.pause_job(job_id)
+        texto = f"⏸ Broadcast #{job_id} pausado." if ok else f"Não foi possível pausar o broadcast #{job_id}."
+    elif command.command == "broadcast_retomar":
+        ok = await broadcast_engine.resume_job(job_id)
+        texto = f"▶️ Broadcast #{job_id} retomado." if ok else f"Não foi possível retomar o broadcast #{job_id}."
+    else:
+        ok = await broadcast_engine.cancel_job(job_id)
+        texto = f"❌ Broadcast #{job_id} cancelado." if ok else f"Não foi possível cancelar o broadcast #{job_id}."
+
+    await message.answer(texto)
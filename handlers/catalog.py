@@ -1,7 +1,7 @@
 from aiogram import Router, types, F
 from aiogram.filters import Command
 
-from services.api_client import api_client
+from services.catalog_cache import catalog_cache
 from keyboards.inline_keyboards import build_product_grid
 
 router = Router()
@@ -10,11 +10,11 @@ router = Router()
 @router.message(Command("produtos"))
 async def handle_list_products(message: types.Message):
     """
-    Busca produtos na API e exibe como uma grade de botões inline.
+    Busca produtos (via cache do catálogo) e exibe como uma grade de botões inline.
     """
     await message.answer("Buscando produtos disponíveis... ⏳")
     
-    produtos = await api_client.get_produtos()
+    produtos = await catalog_cache.get_produtos()
     
     if not produtos:
         await message.answer(
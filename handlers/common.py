@@ -1,16 +1,58 @@
-from aiogram import Router, types
-from aiogram.filters import Command, CommandStart, CommandObject
+import logging
+from aiogram import F, Router, types
+from aiogram.filters import KICKED, MEMBER, ChatMemberUpdatedFilter, Command, CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
 from typing import Optional
 
-# Importa a nossa "ponte" da API
-from services.api_client import api_client
+# Perfis dos usuários já registados (evita chamar a API em cada /start)
+from services.user_cache import user_cache
+from services.suppression import suppression_list
+from keyboards.callback_data import (
+    Buy, ConfirmBuy, ExpiredToken, ShowProduct, SupportOrder, SupportReason
+)
 # Importa o nosso novo teclado
 from keyboards.reply_keyboards import get_main_menu_keyboard
 
+logger = logging.getLogger(__name__)
+
 # Criamos um "Roteador" para este ficheiro.
 router = Router()
 
+# Resposta aos botões expirados, conforme o fluxo a que pertenciam
+MENSAGENS_BOTAO_EXPIRADO = {
+    ShowProduct: "Este botão expirou. Abra o catálogo novamente com /produtos.",
+    ConfirmBuy: "Este botão expirou. Abra o catálogo novamente com /produtos.",
+    Buy: "Este botão expirou. Abra o catálogo novamente com /produtos.",
+    SupportOrder: "Este botão expirou. Abra o suporte novamente com /suporte.",
+    SupportReason: "Este botão expirou. Abra o suporte novamente com /suporte.",
+}
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def handle_bot_blocked(event: types.ChatMemberUpdated):
+    """
+    O usuário bloqueou o bot: deixa de receber broadcasts e avisos.
+    (Ter este handler faz o Telegram enviar os updates my_chat_member.)
+    """
+    await suppression_list.add(event.from_user.id, "blocked")
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def handle_bot_unblocked(event: types.ChatMemberUpdated):
+    """
+    O usuário desbloqueou o bot: volta a receber broadcasts e avisos.
+    """
+    await suppression_list.discard(event.from_user.id)
+
+@router.callback_query(ExpiredToken())
+async def handle_expired_button(query: types.CallbackQuery, tipo_botao: type | None):
+    """
+    Os dados deste botão já não estão no servidor: pede para recomeçar
+    (registado aqui para valer para os botões de todos os roteadores).
+    """
+    mensagem = MENSAGENS_BOTAO_EXPIRADO.get(
+        tipo_botao, "Este botão expirou. Use o menu para recomeçar."
+    )
+    await query.answer(mensagem, show_alert=True)
+
 @router.message(CommandStart())
 async def handle_start(message: types.Message, command: CommandObject, state: FSMContext):
     """
@@ -24,7 +66,7 @@ async def handle_start(message: types.Message, command: CommandObject, state: FS
     nome_completo = message.from_user.full_name
     
     referrer_id: Optional[int] = None
-    
+
     # Verifica se há um payload no comando (ex: /start ref_123456)
     if command.args:
         payload = command.args
@@ -37,18 +79,22 @@ async def handle_start(message: types.Message, command: CommandObject, state: FS
                 # Usuário não pode indicar a si mesmo
                 if ref_id_int != telegram_id:
                     referrer_id = ref_id_int
-                    print(f"Novo usuário {telegram_id} foi indicado por {referrer_id}")
+                    logger.info("Novo usuário %s foi indicado por %s", telegram_id, referrer_id)
                 
             except ValueError:
-                print(f"Payload de indicação inválido: {payload}")
+                logger.warning("Payload de indicação inválido: %s", payload)
                 
     try:
-        # 1. Tenta registar/encontrar o utilizador na API
-        usuario_api = await api_client.register_user(
-            telegram_id=telegram_id,
-            nome_completo=nome_completo,
-            referrer_id=referrer_id # <-- Envia o novo ID (ou None)
-        )
+        # 1. Tenta registar/encontrar o utilizador na API (um usuário que já
+        # conhecemos vem da cache; com convite, a API tem sempre de o ver)
+        if referrer_id:
+            usuario_api = await user_cache.register(
+                telegram_id=telegram_id,
+                nome_completo=nome_completo,
+                referrer_id=referrer_id # <-- Envia o novo ID
+            )
+        else:
+            usuario_api = await user_cache.get_or_register(telegram_id, nome_completo)
 
         if usuario_api is None:
             # Se o api_client retornou None, a API está offline
@@ -74,7 +120,7 @@ async def handle_start(message: types.Message, command: CommandObject, state: FS
 
     except Exception as e:
         # 3. Se falhou (API offline ou outro erro)
-        print(f"Erro no /start ao tentar registar usuário: {e}")
+        logger.exception("Erro no /start ao tentar registar usuário: %s", e)
         await message.answer(
             "❌ Ups! Estou com dificuldades para me ligar aos nossos servidores agora.\n"
             "A nossa equipa já foi notificada. Por favor, tente novamente mais tarde."
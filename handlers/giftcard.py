@@ -3,6 +3,8 @@ from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 
 from services.api_client import api_client
+from services.idempotency import make_idempotency_key
+from services.user_cache import user_cache
 from states.user_states import GiftCardStates # O nosso FSM
 from keyboards.reply_keyboards import get_main_menu_keyboard, get_cancel_keyboard
 
@@ -43,7 +45,8 @@ async def handle_code_received(message: types.Message, state: FSMContext):
     # Chama a API para tentar o resgate
     resultado = await api_client.redeem_gift_card(
         telegram_id=message.from_user.id,
-        codigo=codigo
+        codigo=codigo,
+        idempotency_key=make_idempotency_key("giftcard", message.from_user.id, message.message_id)
     )
 
     # Limpa o estado, quer tenha funcionado ou não
@@ -54,6 +57,7 @@ async def handle_code_received(message: types.Message, state: FSMContext):
         dados = resultado.get("data", {})
         valor = dados.get('valor_resgatado', '0.00')
         novo_saldo = dados.get('novo_saldo_total', '0.00')
+        user_cache.update_balance(message.from_user.id, dados.get('novo_saldo_total'))
 
         await message.answer(
             f"✅ **Código resgatado com sucesso!**\n\n"
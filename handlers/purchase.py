@@ -1,10 +1,17 @@
+import logging
 import re
 from aiogram import Router, types, F, Bot
 from aiogram.filters import StateFilter, Command
 from aiogram.fsm.context import FSMContext
 
 from services.api_client import api_client
+from services.catalog_cache import catalog_cache
+from services.idempotency import make_idempotency_key
+from services.inflight import purchase_inflight
+from services.outbound import Lane, outbound_lane
+from services.user_cache import user_cache
 from states.user_states import PurchaseStates
+from keyboards.callback_data import Buy, CallbackIs, ConfirmBuy, ShowProduct
 from keyboards.inline_keyboards import (
     get_email_confirmation_keyboard,
     get_purchase_confirmation_keyboard,
@@ -14,15 +21,34 @@ from keyboards.inline_keyboards import (
 from keyboards.reply_keyboards import get_main_menu_keyboard, get_cancel_keyboard
 from core.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
 # Regex simples para validar e-mail (só para filtrar lixo)
 EMAIL_REGEX = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
 
 
+# --- Textos de cada produto (formatados uma vez e guardados no catalog_cache) ---
+def _texto_detalhes(produto: dict) -> str:
+    return (
+        f"📺 **{produto['nome']}**\n\n"
+        f"📝 {produto['descricao']}\n\n"
+        f"💰 **Preço: R$ {produto['preco']}**"
+    )
+
+
+def _texto_confirmacao(produto: dict) -> str:
+    texto = f"Confirmar compra de **{produto['nome']}** por **R$ {produto['preco']}**?"
+    # O estoque só aparece se a API o enviar
+    if produto.get("estoque") is not None:
+        texto += f"\n\n📦 Em estoque: {produto['estoque']}"
+    return texto
+
+
 # --- Mostra os detalhes do produto ---
-@router.callback_query(F.data.startswith("show_product:"))
-async def handle_show_product_details(query: types.CallbackQuery):
+@router.callback_query(CallbackIs(ShowProduct))
+async def handle_show_product_details(query: types.CallbackQuery, dados: ShowProduct):
     """
     Mostra a descrição, preço e botão "Comprar" para um produto.
     (Esta é a nova etapa que você pediu)
@@ -30,28 +56,16 @@ async def handle_show_product_details(query: types.CallbackQuery):
     await query.answer()
     
     try:
-        produto_id = query.data.split(":")[1]
+        produto_id = dados.produto_id
         
-        # Busca os produtos (ineficiente, mas é como o 'cancel' já fazia)
-        produtos = await api_client.get_produtos()
-        if not produtos:
-            raise Exception("API não retornou produtos")
-            
-        produto_original = None
-        for p in produtos:
-            if p['id'] == produto_id:
-                produto_original = p
-                break
+        # Busca o produto no cache do catálogo (índice por ID)
+        produto_original = await catalog_cache.get_produto(produto_id)
         
         if not produto_original:
             raise Exception("Produto não encontrado na lista da API")
         
-        # Reconstrói a mensagem de detalhes
-        texto_produto = (
-            f"📺 **{produto_original['nome']}**\n\n"
-            f"📝 {produto_original['descricao']}\n\n"
-            f"💰 **Preço: R$ {produto_original['preco']}**"
-        )
+        # Texto de detalhes (formatado uma vez por versão do catálogo)
+        texto_produto = catalog_cache.render(produto_original, "detalhes", _texto_detalhes)
         
         # Reconstrói o teclado de detalhes
         teclado = get_product_details_keyboard(
@@ -64,7 +78,7 @@ async def handle_show_product_details(query: types.CallbackQuery):
         await query.message.edit_text(texto_produto, reply_markup=teclado)
 
     except Exception as e:
-        print(f"Erro ao mostrar detalhes do produto: {e}")
+        logger.exception("Erro ao mostrar detalhes do produto: %s", e)
         await query.message.edit_text("❌ Erro ao carregar detalhes. Tente novamente.")
 
 # --- NOVO HANDLER: Volta para o catálogo (grid) ---
@@ -75,7 +89,7 @@ async def handle_show_catalog(query: types.CallbackQuery):
     """
     await query.answer("Voltando ao catálogo...")
     
-    produtos = await api_client.get_produtos()
+    produtos = await catalog_cache.get_produtos()
     
     if not produtos:
         await query.message.edit_text(
@@ -94,45 +108,48 @@ async def handle_show_catalog(query: types.CallbackQuery):
     )
 
 # --- FLUXO PASSO 1: Mostrar Confirmação ---
-@router.callback_query(F.data.startswith("confirm_buy:"))
-async def handle_show_confirmation(query: types.CallbackQuery):
+@router.callback_query(CallbackIs(ConfirmBuy))
+async def handle_show_confirmation(query: types.CallbackQuery, dados: ConfirmBuy):
     """
     Mostra a mensagem de confirmação de compra.
     """
     await query.answer()
     
     try:
-        # Extrai os dados do callback
-        parts = query.data.split(":")
-        produto_id = parts[1]
-        tipo_entrega = parts[2]
+        # Dados atuais do produto (nome, preço, estoque), pelo ID do callback:
+        # do catálogo em memória, ou da API se ainda não estiver lá
+        produto = await catalog_cache.get_produto_atual(dados.produto_id)
 
-        # Pega o texto da mensagem original para extrair nome e preço
-        message_text = query.message.text
-        
-        # Extrai o nome (1ª linha)
-        nome = message_text.split('\n')[0].replace("📺 **", "").replace("**", "").strip()
-        
-        # Extrai o preço (última linha)
-        preco = message_text.split("R$ ")[-1].replace("**", "").strip()
+        if not produto:
+            await query.message.edit_text(
+                "😕 Este produto já não está disponível. Abra o catálogo novamente."
+            )
+            return
+
+        if produto.get("estoque") is not None and produto["estoque"] <= 0:
+            await query.message.edit_text(
+                f"😕 **{produto['nome']}** está esgotado de momento. Tente novamente mais tarde."
+            )
+            return
         
-        # Monta o novo teclado
-        teclado = get_purchase_confirmation_keyboard(produto_id, tipo_entrega)
+        # Monta o novo teclado (com o tipo de entrega atual do produto)
+        teclado = get_purchase_confirmation_keyboard(produto['id'], produto['tipo_entrega'])
         
         # Edita a mensagem
         await query.message.edit_text(
-            f"Confirmar compra de **{nome}** por **R$ {preco}**?",
+            catalog_cache.render(produto, "confirmacao", _texto_confirmacao),
             reply_markup=teclado
         )
         
     except Exception as e:
-        print(f"Erro ao mostrar confirmação: {e}")
+        logger.exception("Erro ao mostrar confirmação: %s", e)
         await query.message.edit_text("❌ Erro ao processar. Tente novamente.")
 
 # --- FLUXO PASSO 2 (Opção A): Compra Automática ---
 
-@router.callback_query(F.data.startswith("buy:auto:"))
-async def handle_buy_auto_callback(query: types.CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackIs(Buy, tipo="auto"))
+@purchase_inflight.guard_callback("⏳ A sua compra já está a ser processada.")
+async def handle_buy_auto_callback(query: types.CallbackQuery, dados: Buy, state: FSMContext):
     """
     Processa o clique no botão "Confirmar Compra" para produtos AUTOMÁTICOS.
     """
@@ -142,17 +159,22 @@ async def handle_buy_auto_callback(query: types.CallbackQuery, state: FSMContext
     await query.message.edit_text("A processar a sua compra... ⏳")
 
     try:
-        produto_id = query.data.split(":")[2] # Pega o ID (buy:auto:ID)
+        produto_id = dados.produto_id
         telegram_id = query.from_user.id
 
-        # Chama a API (sem e-mail)
-        resultado = await api_client.make_purchase(telegram_id, produto_id)
+        # Chama a API (sem e-mail). Um toque repetido no mesmo botão dá a
+        # mesma chave: a compra não é feita duas vezes
+        resultado = await api_client.make_purchase(
+            telegram_id, produto_id,
+            idempotency_key=make_idempotency_key("compra", telegram_id, query.message.message_id, produto_id)
+        )
         
         await query.message.delete()
 
         if resultado.get("success"):
             # SUCESSO!
             dados_compra = resultado.get("data", {})
+            user_cache.update_balance(telegram_id, dados_compra.get("novo_saldo"))
             texto_sucesso = (
                 f"✅ **Compra Concluída!**\n\n"
                 f"Obrigado por comprar o **{dados_compra.get('produto_nome')}**.\n\n"
@@ -175,13 +197,14 @@ async def handle_buy_auto_callback(query: types.CallbackQuery, state: FSMContext
 
     except Exception as e:
         await query.message.delete()
-        print(f"Erro inesperado no fluxo de compra AUTO: {e}")
+        logger.exception("Erro inesperado no fluxo de compra AUTO: %s", e)
         await query.message.answer("❌ Ocorreu um erro crítico. Tente novamente.")
 
 
 # --- FLUXO PASSO 2 (Opção C) Compra Manual (Admin) ---
-@router.callback_query(F.data.startswith("buy:manual:"))
-async def handle_buy_manual_callback(query: types.CallbackQuery, state: FSMContext, bot: Bot):
+@router.callback_query(CallbackIs(Buy, tipo="manual"))
+@purchase_inflight.guard_callback("⏳ A sua compra já está a ser processada.")
+async def handle_buy_manual_callback(query: types.CallbackQuery, dados: Buy, state: FSMContext, bot: Bot):
     """
     Processa o clique "Confirmar Compra" para produtos de ENTREGA MANUAL ADMIN.
     """
@@ -191,17 +214,22 @@ async def handle_buy_manual_callback(query: types.CallbackQuery, state: FSMConte
     await query.message.edit_text("A processar a sua compra... ⏳")
 
     try:
-        produto_id = query.data.split(":")[2] # Pega o ID (buy:manual:ID)
+        produto_id = dados.produto_id
         telegram_id = query.from_user.id
 
-        # Chama a API (sem e-mail)
-        resultado = await api_client.make_purchase(telegram_id, produto_id)
+        # Chama a API (sem e-mail). Um toque repetido no mesmo botão dá a
+        # mesma chave: a compra não é feita duas vezes
+        resultado = await api_client.make_purchase(
+            telegram_id, produto_id,
+            idempotency_key=make_idempotency_key("compra", telegram_id, query.message.message_id, produto_id)
+        )
         
         await query.message.delete()
 
         if resultado.get("success"):
             # SUCESSO!
             dados_compra = resultado.get("data", {})
+            user_cache.update_balance(telegram_id, dados_compra.get("novo_saldo"))
             # A API retorna a mensagem de "Aguarde" que configuramos
             texto_sucesso = dados_compra.get('mensagem_entrega') 
             await query.message.answer(texto_sucesso)
@@ -221,13 +249,14 @@ async def handle_buy_manual_callback(query: types.CallbackQuery, state: FSMConte
                     f"para inserir as credenciais e realizar a entrega."
                 )
                 # Usamos query.bot.send_message
-                await bot.send_message(
-                    chat_id=admin_id, 
-                    text=texto_notificacao, 
-                    parse_mode="Markdown"
-                )
+                with outbound_lane(Lane.NORMAL):
+                    await bot.send_message(
+                        chat_id=admin_id, 
+                        text=texto_notificacao, 
+                        parse_mode="Markdown"
+                    )
             except Exception as e_notify:
-                print(f"ERRO AO NOTIFICAR ADMIN (Entrega Manual): {e_notify}")
+                logger.exception("Erro ao notificar o admin (Entrega Manual): %s", e_notify)
 
         else:
             # FALHA! (Saldo, Estoque, etc.)
@@ -241,19 +270,19 @@ async def handle_buy_manual_callback(query: types.CallbackQuery, state: FSMConte
 
     except Exception as e:
         await query.message.delete()
-        print(f"Erro inesperado no fluxo de compra MANUAL: {e}")
+        logger.exception("Erro inesperado no fluxo de compra MANUAL: %s", e)
         await query.message.answer("❌ Ocorreu um erro crítico. Tente novamente.")
 
 # --- FLUXO PASSO 2 (Opção B): Compra Manual (E-mail) ---
 
-@router.callback_query(F.data.startswith("buy:email:"))
-async def handle_buy_email_start(query: types.CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackIs(Buy, tipo="email"))
+async def handle_buy_email_start(query: types.CallbackQuery, dados: Buy, state: FSMContext):
     """
     PASSO 1 (Fluxo de E-mail): Inicia o fluxo, pedindo o e-mail.
     """
     await query.answer("Este produto requer entrega manual.")
     
-    produto_id = query.data.split(":")[2] # Pega o ID (buy:email:ID)
+    produto_id = dados.produto_id
 
     # Guarda o ID do produto na "memória" (FSM)
     await state.update_data(produto_id=produto_id)
@@ -398,6 +427,7 @@ async def handle_email_retry(query: types.CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "buy_email:confirm", StateFilter(PurchaseStates.awaiting_email_confirmation))
+@purchase_inflight.guard_callback("⏳ A sua compra já está a ser processada.")
 async def handle_email_confirm(query: types.CallbackQuery, state: FSMContext):
     """
     PASSO 3: O usuário confirmou o e-mail. Executa a compra.
@@ -425,12 +455,16 @@ async def handle_email_confirm(query: types.CallbackQuery, state: FSMContext):
 
     try:
         # Chama a API (AGORA COM O E-MAIL)
-        resultado = await api_client.make_purchase(telegram_id, produto_id, email)
+        resultado = await api_client.make_purchase(
+            telegram_id, produto_id, email,
+            idempotency_key=make_idempotency_key("compra", telegram_id, query.message.message_id, produto_id)
+        )
         
         # Envia uma NOVA MENSAGEM com o resultado
         if resultado.get("success"):
             # SUCESSO!
             dados_compra = resultado.get("data", {})
+            user_cache.update_balance(telegram_id, dados_compra.get("novo_saldo"))
             texto_sucesso = (
                 f"✅ **Compra Concluída!**\n\n"
                 f"Obrigado por comprar o **{dados_compra.get('produto_nome')}**.\n\n"
@@ -453,9 +487,10 @@ async def handle_email_confirm(query: types.CallbackQuery, state: FSMContext):
                     f"**E-mail para Entrega:** `{email}`\n\n"
                     f"Por favor, realize a entrega manual."
                 )
-                await query.bot.send_message(chat_id=admin_id, text=texto_notificacao, parse_mode="Markdown")
+                with outbound_lane(Lane.NORMAL):
+                    await query.bot.send_message(chat_id=admin_id, text=texto_notificacao, parse_mode="Markdown")
             except Exception as e_notify:
-                print(f"ERRO AO NOTIFICAR ADMIN (Compra Manual): {e_notify}")
+                logger.exception("Erro ao notificar o admin (Compra Manual): %s", e_notify)
 
         else:
             # FALHA! (Saldo, Estoque, etc.)
@@ -463,7 +498,7 @@ async def handle_email_confirm(query: types.CallbackQuery, state: FSMContext):
             await query.message.answer(f"❌ **Falha na Compra**\n\nMotivo: {detalhe}")
 
     except Exception as e:
-        print(f"Erro inesperado no fluxo de compra EMAIL: {e}")
+        logger.exception("Erro inesperado no fluxo de compra EMAIL: %s", e)
         await query.message.answer("❌ Ocorreu um erro crítico. Tente novamente.")
     finally:
         await state.clear() # Limpa o FSM
\ No newline at end of file
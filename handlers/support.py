@@ -1,15 +1,20 @@
 import datetime
+import logging
 
 from aiogram import Router, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 
 from services.api_client import api_client
+from services.outbound import Lane, outbound_lane
 from states.user_states import SupportStates
+from keyboards.callback_data import CallbackIs, SupportOrder, SupportReason
 from keyboards.inline_keyboards import get_support_orders_keyboard, get_support_reason_keyboard
 from keyboards.reply_keyboards import get_main_menu_keyboard
 from core.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
 def escape_markdown(text: str) -> str:
@@ -80,12 +85,12 @@ async def handle_cancel_support(query: types.CallbackQuery, state: FSMContext):
 
 # --- 3. Apanha a seleção do Pedido ---
 
-@router.callback_query(F.data.startswith("support_order:"), StateFilter(SupportStates.awaiting_order_selection))
-async def handle_order_selection(query: types.CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackIs(SupportOrder), StateFilter(SupportStates.awaiting_order_selection))
+async def handle_order_selection(query: types.CallbackQuery, dados: SupportOrder, state: FSMContext):
     """
     Utilizador selecionou um pedido. Agora pergunta o motivo.
     """
-    pedido_id = query.data.split(":")[1]
+    pedido_id = dados.pedido_id
 
     # Guarda o pedido_id no estado (memória)
     await state.update_data(pedido_id=pedido_id)
@@ -119,15 +124,15 @@ async def handle_order_selection(query: types.CallbackQuery, state: FSMContext):
 
 # --- 4. Apanha a seleção do Motivo (e cria o ticket) ---
 
-@router.callback_query(F.data.startswith("support_reason:"), StateFilter(SupportStates.awaiting_reason))
-async def handle_reason_selection(query: types.CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackIs(SupportReason), StateFilter(SupportStates.awaiting_reason))
+async def handle_reason_selection(query: types.CallbackQuery, dados: SupportReason, state: FSMContext):
     """
     Utilizador selecionou o motivo. Cria o ticket na API.
     """
     await query.answer("A processar o seu ticket...")
 
-    # 1. Extrai os dados do callback (ex: "support_reason:LOGIN_INVALIDO")
-    _, motivo = query.data.split(":")
+    # 1. Motivo escolhido (ex: "LOGIN_INVALIDO")
+    motivo = dados.motivo
 
     # 2. LÊ O PEDIDO_ID DA "MEMÓRIA" DO FSM
     dados_fsm = await state.get_data()
@@ -178,9 +183,10 @@ async def handle_reason_selection(query: types.CallbackQuery, state: FSMContext)
                 f"**Motivo:** {motivo_md}\n\n"
                 f"Por favor, verifique o painel admin."
             )
-            await query.bot.send_message(chat_id=admin_id, text=texto_notificacao)
+            with outbound_lane(Lane.NORMAL):
+                await query.bot.send_message(chat_id=admin_id, text=texto_notificacao)
         except Exception as e_notify:
-            print(f"ERRO AO NOTIFICAR ADMIN (Novo Ticket): {e_notify}")
+            logger.exception("Erro ao notificar o admin (Novo Ticket): %s", e_notify)
 
         
     elif resultado and resultado.get("detail"):
@@ -1,26 +1,40 @@
-import asyncio
-import base64
+import logging
 from aiogram import Router, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 
 from services.api_client import api_client
+from services.idempotency import make_idempotency_key
+from services.outbound import Lane, outbound_lane
+from services.pix_qr import pix_qr
+from services.recharge_poller import STATUS_FALHOU, recharge_poller
+from services.scheduler import scheduler
+from services.user_cache import user_cache
 from states.user_states import WalletStates # O nosso FSM
 from keyboards.reply_keyboards import get_main_menu_keyboard, get_cancel_keyboard
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
-async def _notificar_expiracao_recarga(bot, telegram_id: int, recarga_id: str, expiracao_minutos: int) -> None:
-    await asyncio.sleep(expiracao_minutos * 60)
-    status_data = await api_client.get_recharge_status(recarga_id)
+async def _notificar_expiracao_recarga(bot, payload: dict) -> None:
+    """
+    Job agendado para o fim do prazo do PIX: se a recarga expirou sem
+    pagamento, avisa o usuário.
+    """
+    status_data = await api_client.get_recharge_status(payload["recarga_id"])
     if not status_data:
-        return
-    if status_data.get("expirado") and status_data.get("status_pagamento") == "FALHOU":
-        await bot.send_message(
-            telegram_id,
-            "⏳ Sua recarga expirou porque o pagamento nao foi identificado dentro do prazo.\n"
-            "Se quiser, gere uma nova recarga em Carteira."
-        )
+        # Falha da API: o scheduler volta a tentar mais tarde
+        raise Exception("Não foi possível consultar o status da recarga.")
+    if status_data.get("expirado") and status_data.get("status_pagamento") == STATUS_FALHOU:
+        with outbound_lane(Lane.NORMAL):
+            await bot.send_message(
+                payload["telegram_id"],
+                "⏳ Sua recarga expirou porque o pagamento nao foi identificado dentro do prazo.\n"
+                "Se quiser, gere uma nova recarga em Carteira."
+            )
+
+scheduler.register("recharge_expiry", _notificar_expiracao_recarga)
 
 # --- 1. Manipulador para o botão "Carteira" (ou comando /carteira) ---
 
@@ -32,14 +46,15 @@ async def handle_wallet_menu(message: types.Message, state: FSMContext):
     """
     await state.clear() # Limpa qualquer estado antigo
 
-    await message.answer("A consultar a sua carteira... ⏳")
-
     try:
-        # 1. Busca os dados do usuário na API (que inclui o saldo)
-        usuario_api = await api_client.register_user(
-            telegram_id=message.from_user.id,
-            nome_completo=message.from_user.full_name
-        )
+        # 1. Busca os dados do usuário (que incluem o saldo): da cache, ou da API
+        usuario_api = await user_cache.get(message.from_user.id)
+        if usuario_api is None:
+            await message.answer("A consultar a sua carteira... ⏳")
+            usuario_api = await user_cache.register(
+                telegram_id=message.from_user.id,
+                nome_completo=message.from_user.full_name
+            )
         
         if usuario_api is None:
             raise Exception("API offline")
@@ -76,7 +91,7 @@ async def handle_wallet_menu(message: types.Message, state: FSMContext):
 
     except Exception as e:
         # 3. Se falhou (API offline ou outro erro)
-        print(f"Erro no /carteira ao tentar buscar saldo: {e}")
+        logger.exception("Erro no /carteira ao tentar buscar saldo: %s", e)
         await message.answer(
             "❌ Ups! Estou com dificuldades para me ligar aos nossos servidores agora.\n"
             "Por favor, tente novamente mais tarde.",
@@ -125,7 +140,10 @@ async def handle_recharge_amount(message: types.Message, state: FSMContext):
         pix_data = await api_client.create_recharge(
             telegram_id=message.from_user.id,
             nome_completo=message.from_user.full_name,
-            valor=valor
+            valor=valor,
+            incluir_qr_code=not pix_qr.render_local,
+            # A mesma mensagem com o valor nunca gera dois PIX
+            idempotency_key=make_idempotency_key("recarga", message.from_user.id, message.message_id)
         )
 
         if pix_data is None:
@@ -148,17 +166,12 @@ async def handle_recharge_amount(message: types.Message, state: FSMContext):
         await state.clear()
 
         # 5. Envia o PIX (QR Code + Texto)
-        # Precisamos de descodificar o QR Code base64
         try:
-            # Remove o prefixo "data:image/png;base64,"
-            image_data = pix_qr_code_base64.split(",")[1]
-            image_bytes = base64.b64decode(image_data)
+            # QR gerado localmente ou vindo da API (ou o file_id de um envio anterior)
+            qr_code_foto = await pix_qr.get_photo(pix_copia_e_cola, pix_qr_code_base64)
 
-            # Envia como um ficheiro de foto
-            qr_code_file = types.BufferedInputFile(image_bytes, filename="qrcode.png")
-
-            await message.answer_photo(
-                photo=qr_code_file,
+            mensagem_qr = await message.answer_photo(
+                photo=qr_code_foto,
                 caption=(
                     f"✅ PIX gerado com sucesso no valor de **R$ {valor:.2f}**!\n\n"
                     f"Pague usando o QR Code ou o código abaixo.\n\n"
@@ -169,9 +182,10 @@ async def handle_recharge_amount(message: types.Message, state: FSMContext):
                 # Envia o menu principal de volta
                 reply_markup=get_main_menu_keyboard() 
             )
+            pix_qr.remember(pix_copia_e_cola, mensagem_qr)
 
         except Exception as e_img:
-            print(f"Erro ao descodificar/enviar QR Code: {e_img}")
+            logger.exception("Erro ao descodificar/enviar QR Code: %s", e_img)
             # Plano B: Se o QR Code falhar, envia só o texto
             await message.answer(
                 f"✅ PIX gerado com sucesso no valor de **R$ {valor:.2f}**!\n\n"
@@ -187,18 +201,24 @@ async def handle_recharge_amount(message: types.Message, state: FSMContext):
             f"`{pix_copia_e_cola}`"
         )
 
+        # O bônus de indicação pendente pode ter sido usado nesta recarga
+        await user_cache.invalidate(message.from_user.id)
+
+        if recarga_id:
+            # Avisa o usuário assim que o pagamento for confirmado
+            await recharge_poller.track(str(recarga_id), message.from_user.id, valor, expiracao_minutos_int)
+
         if recarga_id and expiracao_minutos_int:
-            asyncio.create_task(
-                _notificar_expiracao_recarga(
-                    message.bot,
-                    message.from_user.id,
-                    str(recarga_id),
-                    expiracao_minutos_int
-                )
+            # Agendado na base local: sobrevive a reinícios do bot
+            await scheduler.schedule(
+                "recharge_expiry",
+                atraso_segundos=expiracao_minutos_int * 60,
+                payload={"telegram_id": message.from_user.id, "recarga_id": str(recarga_id)},
+                chave=f"recharge_expiry:{recarga_id}"
             )
 
     except Exception as e:
-        print(f"Erro ao chamar api_client.create_recharge: {e}")
+        logger.exception("Erro ao chamar api_client.create_recharge: %s", e)
         await state.clear()
         await message.answer(
             "❌ Ups! Não consegui gerar o seu PIX agora.\n"
@@ -0,0 +1,359 @@
+"""
+Callback data dos botões inline: tipos, codificação compacta e parsing.
+
+O Telegram limita o callback_data a 64 bytes. Cada tipo de botão tem um
+prefixo de 1 carácter e campos codificados de forma compacta:
+
+- IDs em formato UUID passam a 22 caracteres (base64url dos 16 bytes);
+  outros IDs vão tal como estão.
+- Valores conhecidos (tipo de entrega, motivo do ticket, ...) passam a
+  1 carácter.
+
+Se mesmo assim não couber, o botão leva só um token (com o prefixo do
+tipo) e os dados ficam numa tabela no servidor (CallbackTokens: em memória
+e na base local, para sobreviver a reinícios).
+
+O parsing é uma única expressão regular pré-compilada por tipo, e o
+resultado fica em cache (vários filtros do mesmo callback não repetem o
+trabalho). Os formatos antigos (ex: "show_product:<id>", "buy:auto:<id>")
+continuam a ser aceites, para os botões de mensagens já enviadas.
+"""
+import asyncio
+import base64
+import functools
+import json
+import logging
+import re
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from aiogram import types
+from aiogram.filters import Filter
+
+from core.config import settings
+from services.local_db import local_db
+from services.supervisor import supervisor
+
+logger = logging.getLogger(__name__)
+
+# Limite do Telegram para o callback_data
+MAX_BYTES = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callback_tokens (
+    token TEXT PRIMARY KEY,
+    prefixo TEXT NOT NULL,
+    valores TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+"""
+
+
+# --- Tipos de callback ---
+
+class ShowProduct(NamedTuple):
+    produto_id: str
+
+
+class ConfirmBuy(NamedTuple):
+    produto_id: str
+    tipo_entrega: str
+
+
+class Buy(NamedTuple):
+    tipo: str  # "auto", "manual" ou "email"
+    produto_id: str
+
+
+class SupportOrder(NamedTuple):
+    pedido_id: str
+
+
+class SupportReason(NamedTuple):
+    motivo: str
+
+
+# --- Codificação dos campos ---
+
+_UUID_B64 = r"[A-Za-z0-9_-]{22}"
+
+
+def _encode_id(valor: Any) -> str:
+    valor = str(valor)
+    try:
+        if str(uuid.UUID(valor)) == valor:
+            return "u" + base64.urlsafe_b64encode(uuid.UUID(valor).bytes).decode().rstrip("=")
+    except ValueError:
+        pass
+    return "s" + valor
+
+
+def _decode_id(texto: str) -> str:
+    if texto[0] == "u":
+        return str(uuid.UUID(bytes=base64.urlsafe_b64decode(texto[1:] + "==")))
+    return texto[1:]
+
+
+class _Enum:
+    """
+    Valores conhecidos -> 1 carácter; outros valores vão por extenso ("~valor").
+    """
+    def __init__(self, valores: dict[str, str]):
+        self._para_codigo = valores
+        self._para_valor = {codigo: valor for valor, codigo in valores.items()}
+
+    def encode(self, valor: str) -> str:
+        return self._para_codigo.get(valor) or "~" + valor
+
+    def decode(self, texto: str) -> str:
+        if texto[0] == "~":
+            return texto[1:]
+        return self._para_valor[texto]
+
+
+_TIPOS_ENTREGA = _Enum({"AUTOMATICA": "a", "MANUAL_ADMIN": "m", "SOLICITA_EMAIL": "e"})
+_TIPOS_COMPRA = _Enum({"auto": "a", "manual": "m", "email": "e"})
+_MOTIVOS = _Enum({"LOGIN_INVALIDO": "l", "SEM_ASSINATURA": "s", "CONTA_CAIU": "c", "OUTRO": "o"})
+
+# Padrões (regex) de cada tipo de campo
+_P_ID = rf"(u{_UUID_B64}|s[^:]+)"
+_P_ENUM = r"([a-z]|~[^:]+)"
+
+
+class _Formato:
+    """
+    Como um tipo de callback é escrito: prefixo + campos separados por ':'.
+    """
+    def __init__(self, tipo: type, prefixo: str, campos: list[tuple[str, Any]]):
+        self.tipo = tipo
+        self.prefixo = prefixo
+        self.campos = campos  # (padrão, codec) por campo, pela ordem do tipo
+        self.regex = re.compile(re.escape(prefixo) + ":".join(padrao for padrao, _ in campos))
+
+    def encode(self, dados: tuple) -> str:
+        return self.prefixo + ":".join(
+            _encode_id(valor) if codec is None else codec.encode(valor)
+            for valor, (_, codec) in zip(dados, self.campos)
+        )
+
+    def decode(self, texto: str):
+        m = self.regex.fullmatch(texto)
+        if m is None:
+            return None
+        try:
+            return self.tipo(*(
+                _decode_id(valor) if codec is None else codec.decode(valor)
+                for valor, (_, codec) in zip(m.groups(), self.campos)
+            ))
+        except (KeyError, ValueError):
+            # Código desconhecido (ex: botão de uma versão mais recente)
+            return None
+
+
+# Prefixos curtos (maiúsculas; os formatos antigos começam por minúscula)
+_FORMATOS = [
+    _Formato(ShowProduct, "P", [(_P_ID, None)]),
+    _Formato(ConfirmBuy, "C", [(_P_ID, None), (_P_ENUM, _TIPOS_ENTREGA)]),
+    _Formato(Buy, "B", [(_P_ENUM, _TIPOS_COMPRA), (_P_ID, None)]),
+    _Formato(SupportOrder, "O", [(_P_ID, None)]),
+    _Formato(SupportReason, "R", [(_P_ENUM, _MOTIVOS)]),
+]
+_POR_TIPO = {formato.tipo: formato for formato in _FORMATOS}
+_POR_PREFIXO = {formato.prefixo: formato for formato in _FORMATOS}
+
+PREFIXO_TOKEN = "T"
+
+# Formatos antigos (texto por extenso), numa única regex
+_LEGADO = re.compile(
+    r"show_product:(?P<show>[^:]+)"
+    r"|confirm_buy:(?P<confirm>[^:]+):(?P<confirm_tipo>[^:]+)"
+    r"|buy:(?P<buy_tipo>auto|manual|email):(?P<buy>[^:]+)"
+    r"|support_order:(?P<order>[^:]+)"
+    r"|support_reason:(?P<reason>[^:]+)"
+)
+
+
+def _decode_legado(texto: str):
+    m = _LEGADO.fullmatch(texto)
+    if m is None:
+        return None
+    g = m.groupdict()
+    if g["show"] is not None:
+        return ShowProduct(g["show"])
+    if g["confirm"] is not None:
+        return ConfirmBuy(g["confirm"], g["confirm_tipo"])
+    if g["buy"] is not None:
+        return Buy(g["buy_tipo"], g["buy"])
+    if g["order"] is not None:
+        return SupportOrder(g["order"])
+    return SupportReason(g["reason"])
+
+
+class CallbackTokens:
+    """
+    Tabela dos payloads que não cabem no callback_data, por token.
+
+    - Os tokens recentes ficam em memória (LRU, 'max_entradas').
+    - Todos são gravados na base local (em segundo plano), para os botões
+      continuarem a funcionar depois de um reinício, até 'ttl_segundos'.
+      Depois disso, o handler de botões expirados pede para recomeçar.
+    """
+    def __init__(self, max_entradas: int, ttl_segundos: float):
+        self.max_entradas = max(max_entradas, 1)
+        self.ttl_segundos = ttl_segundos
+        self._dados: OrderedDict[str, tuple] = OrderedDict()
+        self._pronto = False
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            self._pronto = True
+
+    def put(self, prefixo: str, dados: tuple) -> str:
+        token = secrets.token_urlsafe(12)
+        self._guardar_em_memoria(token, dados)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Fora do event loop (ex: scripts): fica só em memória
+            return token
+        supervisor.spawn("callback_token", self._gravar(token, prefixo, dados))
+        return token
+
+    def _guardar_em_memoria(self, token: str, dados: tuple) -> None:
+        self._dados[token] = dados
+        self._dados.move_to_end(token)
+        while len(self._dados) > self.max_entradas:
+            self._dados.popitem(last=False)
+
+    async def _gravar(self, token: str, prefixo: str, dados: tuple) -> None:
+        await self._garantir_schema()
+        await local_db.execute(
+            "INSERT OR REPLACE INTO callback_tokens (token, prefixo, valores, criado_em) VALUES (?, ?, ?, ?)",
+            (token, prefixo, json.dumps(list(dados)), time.time())
+        )
+
+    def get_cached(self, token: str) -> tuple | None:
+        dados = self._dados.get(token)
+        if dados is not None:
+            self._dados.move_to_end(token)
+        return dados
+
+    async def get(self, token: str) -> tuple | None:
+        """
+        Payload do token: da memória ou, se já lá não estiver, da base local.
+        """
+        dados = self.get_cached(token)
+        if dados is not None:
+            return dados
+        await self._garantir_schema()
+        row = await local_db.fetchone(
+            "SELECT prefixo, valores FROM callback_tokens WHERE token = ? AND criado_em >= ?",
+            (token, time.time() - self.ttl_segundos)
+        )
+        formato = _POR_PREFIXO.get(row["prefixo"]) if row else None
+        if formato is None:
+            return None
+        dados = formato.tipo(*json.loads(row["valores"]))
+        self._guardar_em_memoria(token, dados)
+        return dados
+
+    async def purge(self) -> None:
+        """
+        Apaga os tokens mais antigos do que o TTL (chamado no arranque).
+        """
+        await self._garantir_schema()
+        await local_db.execute(
+            "DELETE FROM callback_tokens WHERE criado_em < ?", (time.time() - self.ttl_segundos,)
+        )
+
+
+# Instância única. Com BOT_WORKERS, cada usuário é sempre tratado pelo mesmo
+# worker (o que criou os botões dele); a base local é partilhada por todos
+callback_tokens = CallbackTokens(
+    max_entradas=settings.CALLBACK_TOKENS_MAX_ENTRIES,
+    ttl_segundos=settings.CALLBACK_TOKENS_TTL_SECONDS
+)
+
+
+def pack(dados: tuple) -> str:
+    """
+    Converte um callback tipado (ex: ShowProduct(id)) no texto do botão.
+    """
+    formato = _POR_TIPO[type(dados)]
+    texto = formato.encode(dados)
+    if len(texto.encode()) <= MAX_BYTES and not any(":" in str(valor) for valor in dados):
+        return texto
+    # Não cabe (ou um ID tem ':'): guarda no servidor e manda só o token,
+    # com o prefixo do tipo (ex: "TP<token>")
+    return PREFIXO_TOKEN + formato.prefixo + callback_tokens.put(formato.prefixo, dados)
+
+
+@functools.lru_cache(maxsize=4096)
+def _unpack_texto(texto: str):
+    formato = _POR_PREFIXO.get(texto[0])
+    if formato is not None:
+        return formato.decode(texto)
+    return _decode_legado(texto)
+
+
+def unpack(texto: str | None):
+    """
+    Converte o callback_data recebido no callback tipado (None se não for
+    um dos tipos conhecidos). Os tokens só são procurados em memória (ver
+    resolve() para procurar também na base local).
+    """
+    if not texto:
+        return None
+    if texto[0] == PREFIXO_TOKEN:
+        return callback_tokens.get_cached(texto[2:])
+    return _unpack_texto(texto)
+
+
+async def resolve(texto: str | None):
+    """
+    Como unpack(), mas os tokens que já não estão em memória (ex: depois de
+    reiniciar o bot) são procurados na base local. None se o token expirou.
+    """
+    if texto and texto[0] == PREFIXO_TOKEN:
+        return await callback_tokens.get(texto[2:])
+    return unpack(texto)
+
+
+class CallbackIs(Filter):
+    """
+    Filtro dos handlers de callback: aceita o callback se for do tipo dado
+    (e tiver os valores pedidos) e passa-o ao handler como 'dados'.
+
+        @router.callback_query(CallbackIs(Buy, tipo="auto"))
+        async def handler(query: types.CallbackQuery, dados: Buy): ...
+    """
+    def __init__(self, classe: type, /, **valores: Any):
+        self.classe = classe
+        self.valores = valores
+
+    async def __call__(self, query: types.CallbackQuery) -> bool | dict[str, Any]:
+        dados = await resolve(query.data)
+        if not isinstance(dados, self.classe):
+            return False
+        for campo, valor in self.valores.items():
+            if getattr(dados, campo) != valor:
+                return False
+        return {"dados": dados}
+
+
+class ExpiredToken(Filter):
+    """
+    Filtro dos botões com token que já não existe (mais antigo que o TTL),
+    para o handler responder em vez de os ignorar. Passa ao handler o
+    tipo do botão ('tipo_botao', ex: ShowProduct) para adaptar a resposta.
+    """
+    async def __call__(self, query: types.CallbackQuery) -> bool | dict[str, Any]:
+        texto = query.data
+        if not texto or texto[0] != PREFIXO_TOKEN or await resolve(texto) is not None:
+            return False
+        formato = _POR_PREFIXO.get(texto[1:2])
+        return {"tipo_botao": formato.tipo if formato else None}
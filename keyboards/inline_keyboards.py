@@ -2,6 +2,8 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 import datetime
 
+from keyboards.callback_data import Buy, ConfirmBuy, ShowProduct, SupportOrder, SupportReason, pack
+
 # def get_buy_product_keyboard(
 #     produto_id: str, 
 #     produto_nome: str, 
@@ -40,7 +42,7 @@ def build_product_grid(produtos: list) -> InlineKeyboardMarkup:
                 # Mostra nome e preço
                 text=f"📺 {produto['nome']} - (R$ {produto['preco']})",
                 # Este callback_data vai acionar a tela de detalhes
-                callback_data=f"show_product:{produto['id']}"
+                callback_data=pack(ShowProduct(produto['id']))
             )
         )
     
@@ -66,7 +68,7 @@ def get_product_details_keyboard(
             text=f"✅ Comprar (R$ {preco})",
             # Este callback_data aciona o 'handle_show_confirmation'
             # que já existe em purchase.py
-            callback_data=f"confirm_buy:{produto_id}:{tipo_entrega}"
+            callback_data=pack(ConfirmBuy(produto_id, tipo_entrega))
         )
     )
     # Botão 2: Voltar
@@ -88,16 +90,16 @@ def get_purchase_confirmation_keyboard(
     """
     builder = InlineKeyboardBuilder()
 
-    # Define o prefixo do callback final com base no tipo de entrega
+    # Define o tipo do callback final com base no tipo de entrega
     if tipo_entrega == "SOLICITA_EMAIL":
-        callback_data_prefix = "buy:email:"
+        tipo = "email"
     elif tipo_entrega == "MANUAL_ADMIN":
-        callback_data_prefix = "buy:manual:"
+        tipo = "manual"
     else:
         # O padrão é AUTOMATICA
-        callback_data_prefix = "buy:auto:"
+        tipo = "auto"
     
-    callback_data = f"{callback_data_prefix}{produto_id}"
+    callback_data = pack(Buy(tipo, produto_id))
 
     builder.row(
         InlineKeyboardButton(text="✅ Confirmar Compra", callback_data=callback_data)
@@ -105,7 +107,7 @@ def get_purchase_confirmation_keyboard(
     builder.row(
         InlineKeyboardButton(
             text="« Cancelar / Voltar", 
-            callback_data=f"show_product:{produto_id}"
+            callback_data=pack(ShowProduct(produto_id))
         )
     )
     return builder.as_markup()
@@ -131,7 +133,7 @@ def get_support_orders_keyboard(pedidos: list) -> InlineKeyboardMarkup:
         builder.row(
             InlineKeyboardButton(
                 text=f"Pedido: {produto_nome} ({data}){sufixo_status}",
-                callback_data=f"support_order:{pedido_id}"
+                callback_data=pack(SupportOrder(pedido_id))
             )
         )
 
@@ -156,23 +158,23 @@ def get_support_reason_keyboard() -> InlineKeyboardMarkup:
     builder.row(
         InlineKeyboardButton(
             text="Login / Senha Inválida",
-            callback_data="support_reason:LOGIN_INVALIDO"
+            callback_data=pack(SupportReason("LOGIN_INVALIDO"))
         )
     )
     builder.row(
         InlineKeyboardButton(
             text="Conta sem Assinatura",
-            callback_data="support_reason:SEM_ASSINATURA"
+            callback_data=pack(SupportReason("SEM_ASSINATURA"))
         )
     )
     builder.row(
         InlineKeyboardButton(
             text="Conta Caiu / Parou",
-            callback_data="support_reason:CONTA_CAIU"
+            callback_data=pack(SupportReason("CONTA_CAIU"))
         )
     )
     builder.row(
-        InlineKeyboardButton(text="Outro Motivo", callback_data="support_reason:OUTRO"),
+        InlineKeyboardButton(text="Outro Motivo", callback_data=pack(SupportReason("OUTRO"))),
         InlineKeyboardButton(text="« Cancelar", callback_data="cancel_support")
     )
     return builder.as_markup()
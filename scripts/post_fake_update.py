@@ -0,0 +1,60 @@
+"""
+Envia um update falso (mensagem de texto) para o webhook local do bot,
+para testar o modo webhook sem o Telegram.
+
+Uso (na raiz do projeto, com o bot a correr em BOT_RUN_MODE=webhook):
+    python -m scripts.post_fake_update --user-id 123 --text /start
+
+Nota: as respostas do bot vão mesmo para a Bot API, por isso use o
+telegram_id de uma conta de teste que já tenha falado com o bot.
+"""
+import argparse
+import itertools
+import time
+
+import httpx
+
+from core.config import settings
+
+
+def build_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Teste"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Teste"},
+            "text": text,
+            # Comandos precisam da entidade bot_command para o filtro Command()
+            "entities": (
+                [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+                if text.startswith("/") else []
+            ),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envia updates falsos para o webhook local.")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=settings.WEBHOOK_SECRET)
+    parser.add_argument("--user-id", type=int, default=settings.ADMIN_TELEGRAM_ID)
+    parser.add_argument("--text", default="/start")
+    parser.add_argument("--count", type=int, default=1, help="Quantos updates enviar")
+    args = parser.parse_args()
+
+    headers = {}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+
+    update_ids = itertools.count(int(time.time() * 1000) % 1_000_000_000)
+    with httpx.Client(timeout=10.0) as client:
+        for _ in range(args.count):
+            update_id = next(update_ids)
+            response = client.post(args.url, json=build_update(update_id, args.user_id, args.text), headers=headers)
+            print(f"update {update_id}: HTTP {response.status_code} {response.text}")
+
+
+if __name__ == "__main__":
+    main()
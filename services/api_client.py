@@ -1,12 +1,22 @@
+import asyncio
+import logging
+import time
 import httpx
 from core.config import settings
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, backoff_com_jitter
+from services.idempotency import IdempotentResults, make_idempotency_key
+from services.metrics import api_errors, api_latency, registry
+from services.tracing import tracer
+from services.single_flight import SingleFlight, coalesced
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 class APIClient:
     """
     Cliente HTTP assíncrono para comunicar com a nossa API FastAPI.
-    Usa 'httpx.AsyncClient' para fazer pedidos não-bloqueantes,
-    o que é essencial para o 'aiogram'.
+    Usa um único 'httpx.AsyncClient' (pool de ligações com keep-alive)
+    para fazer pedidos não-bloqueantes, o que é essencial para o 'aiogram'.
     """
     def __init__(self):
         self.base_url = settings.API_BASE_URL
@@ -17,28 +27,240 @@ class APIClient:
             "Accept": "application/json"
         }
 
+        # Pool de ligações partilhado (keep-alive) com a API.
+        # É aberto no arranque do bot (start) e fechado no encerramento (close).
+        self._client: httpx.AsyncClient | None = None
+
+        # Timeout padrão e timeouts específicos por endpoint
+        self._default_timeout = httpx.Timeout(
+            settings.API_TIMEOUT_SECONDS,
+            connect=settings.API_CONNECT_TIMEOUT_SECONDS
+        )
+        self._timeouts = {
+            endpoint: httpx.Timeout(segundos, connect=settings.API_CONNECT_TIMEOUT_SECONDS)
+            for endpoint, segundos in settings.API_ENDPOINT_TIMEOUTS.items()
+        }
+
+        # Agrupa leituras concorrentes idênticas num único pedido (@coalesced)
+        self._single_flight = SingleFlight()
+
+        # Resultados recentes das compras/recargas/resgates, por chave de idempotência
+        self._idempotentes = IdempotentResults(
+            ttl_segundos=settings.API_IDEMPOTENCY_RESULT_TTL_SECONDS,
+            max_entradas=settings.API_IDEMPOTENCY_MAX_RESULTS
+        )
+
+        # Um circuit breaker por endpoint (criados sob demanda)
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+        # Passam a False se a API não tiver a marcação de expirações em lote
+        # / a consulta de recargas em lote
+        self._bulk_ack_suportado = True
+        self._bulk_status_suportado = True
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """
+        Cria o 'httpx.AsyncClient' com os limites do pool configurados.
+        """
+        http2 = settings.API_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401 (dependência opcional: httpx[http2])
+            except ImportError:
+                logger.warning("APIClient: pacote 'h2' não instalado, a usar HTTP/1.1.")
+                http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.API_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.API_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.API_KEEPALIVE_EXPIRY_SECONDS
+        )
+        return httpx.AsyncClient(
+            headers=self.bot_headers,
+            limits=limits,
+            timeout=self._default_timeout,
+            http2=http2
+        )
+
+    async def start(self) -> None:
+        """
+        Abre o pool de ligações. Chamado uma vez no arranque do bot.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            logger.info("APIClient: Pool de ligações HTTP aberto.")
+
+    async def close(self) -> None:
+        """
+        Fecha o pool de ligações. Chamado no encerramento do bot.
+        """
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("APIClient: Pool de ligações HTTP fechado.")
+        self._client = None
+
+    def coalescing_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Contadores do agrupamento de leituras (chamadas totais e agrupadas).
+        """
+        return self._single_flight.stats()
+
+    def circuit_states(self) -> dict[str, str]:
+        """
+        Estado atual do circuit breaker de cada endpoint já usado.
+        """
+        return {nome: breaker.estado for nome, breaker in self._breakers.items()}
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                endpoint,
+                limite_falhas=settings.API_BREAKER_FAILURE_THRESHOLD,
+                tempo_reset=settings.API_BREAKER_RESET_SECONDS
+            )
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    async def _request(
+        self, endpoint: str, method: str, path: str, idempotency_key: str | None = None, **kwargs
+    ) -> httpx.Response:
+        """
+        Executa um pedido HTTP no pool partilhado, aplicando o timeout do endpoint.
+
+        - Passa pelo circuit breaker do endpoint (falha rápida se estiver aberto,
+          com CircuitOpenError, que é uma httpx.RequestError).
+        - Leituras idempotentes (GET) são repetidas em erros de rede e 5xx,
+          com backoff exponencial com jitter. Escritas só são repetidas com
+          'idempotency_key' (cabeçalho Idempotency-Key, igual em todas as
+          tentativas) e API_WRITE_RETRY_ATTEMPTS > 1; depois de um timeout de
+          leitura ou de um 5xx, só se API_IDEMPOTENCY_KEYS_SUPPORTED estiver
+          ativo (o pedido pode já ter sido executado pela API).
+
+        Não trata erros: cada método decide o que devolver em caso de falha.
+        """
+        if self._client is None or self._client.is_closed:
+            # Uso fora do bot (ex: scripts): abre o pool sob demanda
+            await self.start()
+
+        kwargs.setdefault("timeout", self._timeouts.get(endpoint, self._default_timeout))
+        url = f"{self.base_url}{path}"
+        breaker = self._breaker(endpoint)
+        if method == "GET":
+            tentativas = max(settings.API_RETRY_ATTEMPTS, 1)
+        elif idempotency_key is not None:
+            tentativas = max(settings.API_WRITE_RETRY_ATTEMPTS, 1)
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Idempotency-Key": idempotency_key}
+        else:
+            tentativas = 1
+        # Escrita que pode já ter sido executada: só se repete se a API deduplicar
+        repete_incertos = method == "GET" or settings.API_IDEMPOTENCY_KEYS_SUPPORTED
+
+        for tentativa in range(1, tentativas + 1):
+            try:
+                breaker.before_request()
+            except CircuitOpenError:
+                api_errors.inc((endpoint, "circuit_open"))
+                raise
+
+            inicio = time.perf_counter()
+            try:
+                with tracer.span(f"api.{endpoint}", method=method, path=path, tentativa=tentativa) as span:
+                    if span is not None:
+                        # Propaga o trace ao backend (W3C Trace Context)
+                        kwargs["headers"] = {**kwargs.get("headers", {}), "traceparent": span.traceparent}
+                    response = await self._client.request(method, url, **kwargs)
+                    if span is not None:
+                        span.set("status", response.status_code)
+            except httpx.RequestError as e:
+                duracao = time.perf_counter() - inicio
+                api_latency.observe(endpoint, duracao)
+                api_errors.inc((endpoint, "network"))
+                logger.warning(
+                    "APIClient: erro de rede em %s %s (tentativa %s/%s): %s", method, path, tentativa, tentativas, e,
+                    extra={"endpoint": endpoint, "duration_ms": round(duracao * 1000, 1)}
+                )
+                breaker.record_failure()
+                if tentativa == tentativas or not (repete_incertos or _nao_enviado(e)):
+                    raise
+            except BaseException:
+                # Cancelado (ex: broadcast em pausa, encerramento) ou erro inesperado:
+                # não conta como falha da API, mas liberta o lugar de teste
+                breaker.release_probe()
+                raise
+            else:
+                duracao = time.perf_counter() - inicio
+                api_latency.observe(endpoint, duracao)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "APIClient: %s %s -> %s", method, path, response.status_code,
+                        extra={"endpoint": endpoint, "duration_ms": round(duracao * 1000, 1)}
+                    )
+                if response.status_code >= 400:
+                    api_errors.inc((endpoint, f"{response.status_code // 100}xx"))
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if tentativa == tentativas or not repete_incertos:
+                    return response
+
+            await asyncio.sleep(backoff_com_jitter(
+                tentativa,
+                settings.API_RETRY_BACKOFF_BASE_SECONDS,
+                settings.API_RETRY_BACKOFF_MAX_SECONDS
+            ))
+
+    @coalesced
     async def get_produtos(self) -> list | None:
         """
         Busca a lista de produtos ativos na API.
         (Chama GET /api/v1/produtos/)
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                print("APIClient: A tentar buscar /produtos/")
-                response = await client.get(
-                    f"{self.base_url}/produtos/",
-                    headers=self.bot_headers
-                )
-                response.raise_for_status() 
-                print(f"APIClient: /produtos/ retornado com sucesso ({response.status_code})")
-                return response.json()
-            
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao buscar produtos: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao buscar produtos: {e}")
-                return None
+        try:
+            logger.debug("APIClient: A tentar buscar /produtos/")
+            response = await self._request("produtos", "GET", "/produtos/")
+            response.raise_for_status() 
+            logger.debug("APIClient: /produtos/ retornado com sucesso (%s)", response.status_code)
+            return response.json()
+        
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao buscar produtos: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao buscar produtos: %s", e)
+            return None
+
+    @coalesced
+    async def get_produtos_if_changed(self, etag: str | None = None) -> dict | None:
+        """
+        Busca a lista de produtos com um pedido condicional (ETag / If-None-Match).
+        (Chama GET /api/v1/produtos/)
+        Retorna {"modificado": False} se a API responder 304 (nada mudou),
+        {"modificado": True, "produtos": [...], "etag": ...} caso contrário,
+        ou None em caso de erro.
+        """
+        headers = dict(self.bot_headers)
+        if etag:
+            headers["If-None-Match"] = etag
+
+        try:
+            response = await self._request("produtos", "GET", "/produtos/", headers=headers)
+            if response.status_code == 304:
+                return {"modificado": False}
+            response.raise_for_status()
+            return {
+                "modificado": True,
+                "produtos": response.json(),
+                "etag": response.headers.get("ETag")
+            }
+
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao buscar produtos: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao buscar produtos: %s", e)
+            return None
 
     async def register_user(self, telegram_id: int, nome_completo: str, referrer_id: Optional[int] = None) -> dict | None:
         """
@@ -52,99 +274,162 @@ class APIClient:
             "referrer_id": referrer_id
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A tentar registar usuário {telegram_id}...")
-                response = await client.post(
-                    f"{self.base_url}/usuarios/register",
-                    json=data,
-                    headers=self.bot_headers
-                )
-                
-                response.raise_for_status() 
-                
-                print(f"APIClient: Usuário {telegram_id} registado/encontrado com sucesso.")
-                return response.json() # Retorna os dados do usuário (incluindo saldo)
+        try:
+            logger.debug("APIClient: A tentar registar usuário %s...", telegram_id)
+            response = await self._request(
+                "register", "POST", "/usuarios/register",
+                json=data
+            )
             
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao registar usuário: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao registar usuário: {e}")
-                return None
+            response.raise_for_status() 
+            
+            logger.debug("APIClient: Usuário %s registado/encontrado com sucesso.", telegram_id)
+            return response.json() # Retorna os dados do usuário (incluindo saldo)
+        
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao registar usuário: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao registar usuário: %s", e)
+            return None
 
     async def create_recharge(
         self, 
         telegram_id: int, 
         nome_completo: str, 
-        valor: float
+        valor: float,
+        incluir_qr_code: bool = True,
+        idempotency_key: str | None = None
     ) -> dict | None:
         """
         Solicita a criação de um PIX de recarga à API.
         (Chama POST /api/v1/recargas/)
+        Com incluir_qr_code=False, a API pode omitir 'pix_qr_code_base64'
+        (o bot gera o QR localmente).
+        Com 'idempotency_key', um pedido repetido devolve o mesmo PIX.
         """
-        
+        if idempotency_key is None:
+            return await self._create_recharge(
+                telegram_id, nome_completo, valor, incluir_qr_code, make_idempotency_key("recarga")
+            )
+        return await self._idempotentes.run(
+            idempotency_key,
+            lambda: self._create_recharge(telegram_id, nome_completo, valor, incluir_qr_code, idempotency_key),
+            definitivo=lambda resultado: resultado is not None
+        )
+
+    async def _create_recharge(
+        self,
+        telegram_id: int,
+        nome_completo: str,
+        valor: float,
+        incluir_qr_code: bool,
+        idempotency_key: str
+    ) -> dict | None:
         data = {
             "telegram_id": telegram_id,
             "nome_completo": nome_completo,
             "valor": float(valor)
         }
+        if not incluir_qr_code:
+            data["incluir_qr_code"] = False
         
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A tentar criar recarga de {valor} para {telegram_id}...")
-                response = await client.post(
-                    f"{self.base_url}/recargas/",
-                    json=data,
-                    headers=self.bot_headers
-                )
-                
-                response.raise_for_status() 
-                
-                print(f"APIClient: Recarga criada com sucesso.")
-                return response.json() # Retorna os dados do PIX
+        try:
+            logger.debug("APIClient: A tentar criar recarga de %s para %s...", valor, telegram_id)
+            response = await self._request(
+                "recargas", "POST", "/recargas/",
+                idempotency_key=idempotency_key,
+                json=data
+            )
             
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao criar recarga: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao criar recarga: {e}")
-                return None
+            response.raise_for_status() 
+            
+            logger.debug("APIClient: Recarga criada com sucesso.")
+            return response.json() # Retorna os dados do PIX
+        
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao criar recarga: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao criar recarga: %s", e)
+            return None
 
+    @coalesced
     async def get_recharge_status(self, recarga_id: str) -> dict | None:
         """
         Consulta o status de uma recarga pelo ID.
         (Chama GET /api/v1/recargas/{recarga_id})
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A consultar status da recarga {recarga_id}...")
-                response = await client.get(
-                    f"{self.base_url}/recargas/{recarga_id}",
-                    headers=self.bot_headers
-                )
-                response.raise_for_status()
-                print("APIClient: Status da recarga consultado com sucesso.")
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao consultar status da recarga: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"Erro de conexÃ£o ao consultar status da recarga: {e}")
+        try:
+            logger.debug("APIClient: A consultar status da recarga %s...", recarga_id)
+            response = await self._request("recarga_status", "GET", f"/recargas/{recarga_id}")
+            response.raise_for_status()
+            logger.debug("APIClient: Status da recarga consultado com sucesso.")
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao consultar status da recarga: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao consultar status da recarga: %s", e)
+            return None
+
+    async def get_recharges_status_bulk(self, recarga_ids: list[str]) -> dict[str, dict] | None:
+        """
+        Consulta o status de várias recargas num único pedido.
+        (Chama POST /api/v1/recargas/status com {"recarga_ids": [...]})
+        Retorna {recarga_id: status}, ou None se a API não tiver o endpoint
+        em lote ou o pedido falhar (o chamador consulta uma a uma).
+        """
+        if not self._bulk_status_suportado:
+            return None
+
+        try:
+            response = await self._request(
+                "recargas_status", "POST", "/recargas/status",
+                json={"recarga_ids": recarga_ids}
+            )
+            if response.status_code in (404, 405):
+                logger.warning("APIClient: API sem consulta em lote de recargas, a consultar uma a uma.")
+                self._bulk_status_suportado = False
                 return None
+            response.raise_for_status()
+            return {str(item.get("recarga_id")): item for item in response.json()}
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao consultar recargas em lote: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao consultar recargas em lote: %s", e)
+            return None
 
     async def make_purchase(
         self, 
         telegram_id: int, 
         produto_id: str,
-        email_cliente: str | None = None
+        email_cliente: str | None = None,
+        idempotency_key: str | None = None
     ) -> dict:
         """
         Tenta executar uma compra usando o saldo da carteira.
         (Chama POST /api/v1/compras/)
         Retorna um dicionário indicando sucesso ou falha.
+        Com 'idempotency_key', um pedido repetido (ex: duplo toque em
+        "Confirmar Compra") devolve o resultado da primeira compra.
         """
-        
+        if idempotency_key is None:
+            return await self._make_purchase(telegram_id, produto_id, email_cliente, make_idempotency_key("compra"))
+        return await self._idempotentes.run(
+            idempotency_key,
+            lambda: self._make_purchase(telegram_id, produto_id, email_cliente, idempotency_key),
+            definitivo=_resultado_definitivo
+        )
+
+    async def _make_purchase(
+        self,
+        telegram_id: int,
+        produto_id: str,
+        email_cliente: str | None,
+        idempotency_key: str
+    ) -> dict:
         data = {
             "telegram_id": telegram_id,
             "produto_id": produto_id
@@ -152,81 +437,82 @@ class APIClient:
         if email_cliente:
             data["email_cliente"] = email_cliente
         
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A tentar compra do produto {produto_id} para {telegram_id}...")
-                response = await client.post(
-                    f"{self.base_url}/compras/",
-                    json=data,
-                    headers=self.bot_headers
-                )
-                
-                # Se der erro (ex: 402 Saldo, 404 Stock), levanta uma exceção
-                response.raise_for_status() 
-                
-                print(f"APIClient: Compra bem-sucedida.")
-                # Retorna os dados da compra (login, senha, novo_saldo, etc.)
-                return {"success": True, "data": response.json()}
+        try:
+            logger.debug("APIClient: A tentar compra do produto %s para %s...", produto_id, telegram_id)
+            response = await self._request(
+                "compras", "POST", "/compras/",
+                idempotency_key=idempotency_key,
+                json=data
+            )
             
-            except httpx.HTTPStatusError as e:
-                # A API retornou um erro (ex: 402 Saldo Insuficiente)
-                print(f"Erro HTTP ao fazer compra: {e.response.status_code}")
-                # Tenta extrair a mensagem de 'detail' da nossa API
-                try:
-                    error_detail = e.response.json().get("detail", "Erro desconhecido")
-                except:
-                    error_detail = e.response.text
-                return {"success": False, "status_code": e.response.status_code, "detail": error_detail}
+            # Se der erro (ex: 402 Saldo, 404 Stock), levanta uma exceção
+            response.raise_for_status() 
             
-            except httpx.RequestError as e:
-                # A API está offline
-                print(f"Erro de conexão ao fazer compra: {e}")
-                return {"success": False, "status_code": 503, "detail": "Serviço indisponível (API offline)."}
+            logger.debug("APIClient: Compra bem-sucedida.")
+            # Retorna os dados da compra (login, senha, novo_saldo, etc.)
+            return {"success": True, "data": response.json()}
+        
+        except httpx.HTTPStatusError as e:
+            # A API retornou um erro (ex: 402 Saldo Insuficiente)
+            logger.warning("Erro HTTP ao fazer compra: %s", e.response.status_code)
+            # Tenta extrair a mensagem de 'detail' da nossa API
+            try:
+                error_detail = e.response.json().get("detail", "Erro desconhecido")
+            except:
+                error_detail = e.response.text
+            return {"success": False, "status_code": e.response.status_code, "detail": error_detail}
+        
+        except httpx.RequestError as e:
+            # A API está offline
+            logger.warning("Erro de conexão ao fazer compra: %s", e)
+            return {"success": False, "status_code": 503, "detail": "Serviço indisponível (API offline)."}
     
+    @coalesced
     async def get_my_orders(self, telegram_id: int) -> list | None:
         """
         Busca o histórico de 5 pedidos do usuário na API.
         (Chama GET /api/v1/usuarios/meus-pedidos)
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A buscar pedidos para {telegram_id}...")
-                response = await client.get(
-                    f"{self.base_url}/usuarios/meus-pedidos",
-                    headers=self.bot_headers,
-                    params={"telegram_id": telegram_id} # Envia como ?telegram_id=...
-                )
-                response.raise_for_status()
-                print("APIClient: Pedidos encontrados.")
-                return response.json()
+        try:
+            logger.debug("APIClient: A buscar pedidos para %s...", telegram_id)
+            response = await self._request(
+                "meus_pedidos", "GET", "/usuarios/meus-pedidos",
+                params={"telegram_id": telegram_id} # Envia como ?telegram_id=...
+            )
+            response.raise_for_status()
+            logger.debug("APIClient: Pedidos encontrados.")
+            return response.json()
 
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao buscar pedidos: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao buscar pedidos: {e}")
-                return None
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao buscar pedidos: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao buscar pedidos: %s", e)
+            return None
 
-    async def get_expiration_pending_notifications(self, limite: int = 200) -> list:
+    async def get_expiration_pending_notifications(self, limite: int = 200, offset: int = 0) -> list:
         """
         Busca pedidos que expiram hoje e ainda precisam de notificação.
         (Chama GET /api/v1/usuarios/expiracoes-pendentes)
+        'offset' salta os primeiros pendentes (ex: já avisados, mas cuja
+        marcação ainda não chegou à API).
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/usuarios/expiracoes-pendentes",
-                    headers=self.bot_headers,
-                    params={"limite": limite},
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao buscar expirações pendentes: {e.response.status_code} - {e.response.text}")
-                return []
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao buscar expirações pendentes: {e}")
-                return []
+        params = {"limite": limite}
+        if offset:
+            params["offset"] = offset
+        try:
+            response = await self._request(
+                "expiracoes_pendentes", "GET", "/usuarios/expiracoes-pendentes",
+                params=params
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao buscar expirações pendentes: %s - %s", e.response.status_code, e.response.text)
+            return []
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao buscar expirações pendentes: %s", e)
+            return []
 
     async def mark_expiration_notification_sent(self, pedido_id: str, data_expiracao: str) -> bool:
         """
@@ -238,24 +524,54 @@ class APIClient:
             "data_expiracao": data_expiracao,
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/usuarios/expiracoes-pendentes/marcar-notificada",
-                    headers=self.bot_headers,
-                    json=payload,
-                )
-                response.raise_for_status()
-                return True
-            except httpx.HTTPStatusError as e:
-                print(
-                    "Erro HTTP ao marcar notificação de expiração como enviada: "
-                    f"{e.response.status_code} - {e.response.text}"
-                )
-                return False
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao marcar notificação de expiração: {e}")
-                return False
+        try:
+            response = await self._request(
+                "marcar_expiracao", "POST", "/usuarios/expiracoes-pendentes/marcar-notificada",
+                json=payload
+            )
+            response.raise_for_status()
+            return True
+        except httpx.HTTPStatusError as e:
+            logger.warning(
+                "Erro HTTP ao marcar notificação de expiração como enviada: %s - %s",
+                e.response.status_code, e.response.text
+            )
+            return False
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao marcar notificação de expiração: %s", e)
+            return False
+    
+    async def mark_expiration_notifications_sent_bulk(self, itens: list[dict]) -> bool | None:
+        """
+        Marca vários avisos de expiração como enviados num único pedido.
+        (Chama POST /api/v1/usuarios/expiracoes-pendentes/marcar-notificadas)
+        'itens' é uma lista de {"pedido_id": ..., "data_expiracao": ...}.
+        Retorna True/False, ou None se a API não tiver o endpoint em lote
+        (nesse caso, o chamador deve marcar item a item).
+        """
+        if not self._bulk_ack_suportado:
+            return None
+
+        try:
+            response = await self._request(
+                "marcar_expiracoes", "POST", "/usuarios/expiracoes-pendentes/marcar-notificadas",
+                json={"itens": itens}
+            )
+            if response.status_code in (404, 405):
+                logger.warning("APIClient: API sem marcação em lote de expirações, a usar marcação individual.")
+                self._bulk_ack_suportado = False
+                return None
+            response.raise_for_status()
+            return True
+        except httpx.HTTPStatusError as e:
+            logger.warning(
+                "Erro HTTP ao marcar notificações de expiração em lote: %s - %s",
+                e.response.status_code, e.response.text
+            )
+            return False
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao marcar notificações de expiração em lote: %s", e)
+            return False
     
     async def create_ticket(
     self, 
@@ -273,67 +589,72 @@ class APIClient:
             "motivo": motivo
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A tentar criar ticket para pedido {pedido_id}...")
-                response = await client.post(
-                    f"{self.base_url}/tickets/",
-                    json=data,
-                    headers=self.bot_headers
-                )
-                response.raise_for_status()
-                print("APIClient: Ticket criado com sucesso.")
-                return response.json()
+        try:
+            logger.debug("APIClient: A tentar criar ticket para pedido %s...", pedido_id)
+            response = await self._request(
+                "tickets", "POST", "/tickets/",
+                json=data
+            )
+            response.raise_for_status()
+            logger.debug("APIClient: Ticket criado com sucesso.")
+            return response.json()
 
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao criar ticket: {e.response.status_code} - {e.response.text}")
-                return e.response.json() # Retorna o erro (ex: 409 "Já existe")
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao criar ticket: {e}")
-                return None
-            
-    async def redeem_gift_card(self, telegram_id: int, codigo: str) -> dict:
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao criar ticket: %s - %s", e.response.status_code, e.response.text)
+            return e.response.json() # Retorna o erro (ex: 409 "Já existe")
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao criar ticket: %s", e)
+            return None
+        
+    async def redeem_gift_card(self, telegram_id: int, codigo: str, idempotency_key: str | None = None) -> dict:
         """
         Tenta resgatar um gift card usando um código.
         (Chama POST /api/v1/giftcards/resgatar)
         Retorna um dicionário indicando sucesso ou falha.
         """
+        if idempotency_key is None:
+            return await self._redeem_gift_card(telegram_id, codigo, make_idempotency_key("giftcard"))
+        return await self._idempotentes.run(
+            idempotency_key,
+            lambda: self._redeem_gift_card(telegram_id, codigo, idempotency_key),
+            definitivo=_resultado_definitivo
+        )
 
+    async def _redeem_gift_card(self, telegram_id: int, codigo: str, idempotency_key: str) -> dict:
         data = {
             "telegram_id": telegram_id,
             "codigo": codigo
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A tentar resgatar código {codigo} para {telegram_id}...")
-                response = await client.post(
-                    f"{self.base_url}/giftcards/resgatar",
-                    json=data,
-                    headers=self.bot_headers
-                )
+        try:
+            logger.debug("APIClient: A tentar resgatar código %s para %s...", codigo, telegram_id)
+            response = await self._request(
+                "giftcards", "POST", "/giftcards/resgatar",
+                idempotency_key=idempotency_key,
+                json=data
+            )
 
-                # Se der erro (ex: 404, 410), levanta uma exceção
-                response.raise_for_status() 
+            # Se der erro (ex: 404, 410), levanta uma exceção
+            response.raise_for_status() 
 
-                print(f"APIClient: Código resgatado com sucesso.")
-                # Retorna os dados do resgate (valor, novo_saldo)
-                return {"success": True, "data": response.json()}
+            logger.debug("APIClient: Código resgatado com sucesso.")
+            # Retorna os dados do resgate (valor, novo_saldo)
+            return {"success": True, "data": response.json()}
 
-            except httpx.HTTPStatusError as e:
-                # A API retornou um erro (ex: 404 Código não encontrado, 410 Já usado)
-                print(f"Erro HTTP ao resgatar código: {e.response.status_code}")
-                try:
-                    error_detail = e.response.json().get("detail", "Erro desconhecido")
-                except:
-                    error_detail = e.response.text
-                return {"success": False, "status_code": e.response.status_code, "detail": error_detail}
+        except httpx.HTTPStatusError as e:
+            # A API retornou um erro (ex: 404 Código não encontrado, 410 Já usado)
+            logger.warning("Erro HTTP ao resgatar código: %s", e.response.status_code)
+            try:
+                error_detail = e.response.json().get("detail", "Erro desconhecido")
+            except:
+                error_detail = e.response.text
+            return {"success": False, "status_code": e.response.status_code, "detail": error_detail}
 
-            except httpx.RequestError as e:
-                # A API está offline
-                print(f"Erro de conexão ao resgatar código: {e}")
-                return {"success": False, "status_code": 503, "detail": "Serviço indisponível (API offline)."}
-            
+        except httpx.RequestError as e:
+            # A API está offline
+            logger.warning("Erro de conexão ao resgatar código: %s", e)
+            return {"success": False, "status_code": 503, "detail": "Serviço indisponível (API offline)."}
+        
     async def create_suggestion(self, telegram_id: int, nome_streaming: str) -> dict | None:
         """
         Envia uma nova sugestão de streaming para a API.
@@ -345,52 +666,148 @@ class APIClient:
             "nome_streaming": nome_streaming
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"APIClient: A enviar sugestão '{nome_streaming}' para {telegram_id}...")
-                response = await client.post(
-                    f"{self.base_url}/sugestoes/",
-                    json=data,
-                    headers=self.bot_headers
-                )
+        try:
+            logger.debug("APIClient: A enviar sugestão '%s' para %s...", nome_streaming, telegram_id)
+            response = await self._request(
+                "sugestoes", "POST", "/sugestoes/",
+                json=data
+            )
 
-                response.raise_for_status() 
+            response.raise_for_status() 
 
-                print(f"APIClient: Sugestão enviada com sucesso.")
-                return response.json() # Retorna os dados da sugestão
+            logger.debug("APIClient: Sugestão enviada com sucesso.")
+            return response.json() # Retorna os dados da sugestão
 
-            except httpx.HTTPStatusError as e:
-                # Ex: 404 (Usuário não encontrado), 400 (Nome muito curto)
-                print(f"Erro HTTP ao enviar sugestão: {e.response.status_code} - {e.response.text}")
-                return e.response.json()
-            except httpx.RequestError as e:
-                # A API está offline
-                print(f"Erro de conexão ao enviar sugestão: {e}")
-                return None
-            
+        except httpx.HTTPStatusError as e:
+            # Ex: 404 (Usuário não encontrado), 400 (Nome muito curto)
+            logger.warning("Erro HTTP ao enviar sugestão: %s - %s", e.response.status_code, e.response.text)
+            return e.response.json()
+        except httpx.RequestError as e:
+            # A API está offline
+            logger.warning("Erro de conexão ao enviar sugestão: %s", e)
+            return None
+        
     # Metodo buscar ids de todos usuarios
+    @coalesced
     async def get_all_user_ids(self) -> list[int] | None:
         """
         Busca a lista de todos os Telegram IDs dos clientes na API.
         (Chama GET /api/v1/usuarios/all-ids)
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                print("APIClient: A tentar buscar /usuarios/all-ids/")
-                response = await client.get(
-                    f"{self.base_url}/usuarios/all-ids",
-                    headers=self.bot_headers
-                )
-                response.raise_for_status() 
-                print(f"APIClient: /usuarios/all-ids/ retornado com sucesso ({response.status_code})")
-                return response.json() # Retorna a lista [123, 456, ...]
-            
-            except httpx.HTTPStatusError as e:
-                print(f"Erro HTTP ao buscar IDs de usuários: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"Erro de conexão ao buscar IDs de usuários: {e}")
-                return None
+        try:
+            logger.debug("APIClient: A tentar buscar /usuarios/all-ids/")
+            response = await self._request("all_ids", "GET", "/usuarios/all-ids")
+            response.raise_for_status() 
+            logger.debug("APIClient: /usuarios/all-ids/ retornado com sucesso (%s)", response.status_code)
+            return response.json() # Retorna a lista [123, 456, ...]
+        
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao buscar IDs de usuários: %s - %s", e.response.status_code, e.response.text)
+            return None
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao buscar IDs de usuários: %s", e)
+            return None
+
+    async def iter_user_ids(self, page_size: int = 1000, cursor: str | None = None):
+        """
+        Percorre os Telegram IDs dos clientes página a página (gerador assíncrono).
+        (Chama GET /api/v1/usuarios/ids?limite=...&cursor=...)
+        Produz tuplos (ids_da_pagina, proximo_cursor); proximo_cursor é None na
+        última página e pode ser guardado para retomar a leitura mais tarde.
+
+        Se a API não tiver o endpoint paginado (404) e
+        API_USER_IDS_FULL_LIST_FALLBACK estiver ativo, usa /usuarios/all-ids e
+        pagina a lista localmente (cursores "local:<posição>"); sem essa opção,
+        o 404 é propagado.
+        Erros de rede/HTTP são propagados (httpx.HTTPError).
+        """
+        if cursor is None or not cursor.startswith("local:"):
+            while True:
+                params = {"limite": page_size}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await self._request("ids_paginados", "GET", "/usuarios/ids", params=params)
+                if response.status_code == 404 and cursor is None:
+                    if settings.API_USER_IDS_FULL_LIST_FALLBACK:
+                        break
+                    logger.error(
+                        "APIClient: GET /usuarios/ids não existe na API. Ative "
+                        "API_USER_IDS_FULL_LIST_FALLBACK para usar /usuarios/all-ids (lista inteira em memória)."
+                    )
+                response.raise_for_status()
+
+                dados = response.json()
+                proximo = dados.get("next_cursor")
+                cursor = str(proximo) if proximo is not None else None
+                yield dados.get("ids", []), cursor
+                if cursor is None:
+                    return
+
+        # Alternativa: lista completa (em memória), entregue em páginas
+        if not settings.API_USER_IDS_FULL_LIST_FALLBACK:
+            raise httpx.RequestError("Cursor local sem API_USER_IDS_FULL_LIST_FALLBACK ativo")
+        ids = await self.get_all_user_ids()
+        if ids is None:
+            raise httpx.RequestError("Falha ao buscar /usuarios/all-ids")
+        logger.error(
+            "APIClient: a usar /usuarios/all-ids (%s IDs em memória) porque a API não tem GET /usuarios/ids.",
+            len(ids)
+        )
+        inicio = int(cursor.split(":", 1)[1]) if cursor else 0
+        while True:
+            fim = inicio + page_size
+            proximo = f"local:{fim}" if fim < len(ids) else None
+            yield ids[inicio:fim], proximo
+            if proximo is None:
+                return
+            inicio = fim
+
+    async def report_inactive_users(self, usuarios: list[dict]) -> bool:
+        """
+        Informa a API dos usuários que bloquearam o bot (ou cujo chat não existe).
+        (Chama POST /api/v1/usuarios/inativos)
+        'usuarios' é uma lista de {"telegram_id": ..., "motivo": ...}.
+        """
+        try:
+            logger.debug("APIClient: A reportar %s usuário(s) inativo(s)...", len(usuarios))
+            response = await self._request(
+                "inativos", "POST", "/usuarios/inativos",
+                json={"usuarios": usuarios}
+            )
+            response.raise_for_status()
+            return True
+        except httpx.HTTPStatusError as e:
+            logger.warning("Erro HTTP ao reportar usuários inativos: %s - %s", e.response.status_code, e.response.text)
+            return False
+        except httpx.RequestError as e:
+            logger.warning("Erro de conexão ao reportar usuários inativos: %s", e)
+            return False
+
+
+def _nao_enviado(erro: httpx.RequestError) -> bool:
+    """
+    Erros em que o pedido de certeza não chegou à API (falha ao ligar ou à
+    espera de uma ligação do pool): repetir uma escrita é seguro.
+    """
+    return isinstance(erro, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _resultado_definitivo(resultado: dict) -> bool:
+    """
+    Sucesso ou recusa da API (4xx) são definitivos; API offline/5xx não
+    (uma nova tentativa deve ir à API, com a mesma chave).
+    """
+    return resultado.get("success") or resultado.get("status_code", 500) < 500
+
 
 # Criamos uma instância única do cliente para ser usada em todo o bot
 api_client = APIClient()
+
+registry.gauge(
+    "bot_api_circuit_open", "Circuit breaker por endpoint (0 = fechado, 0.5 = meio aberto, 1 = aberto)",
+    ("endpoint",),
+    lambda: {
+        endpoint: {"closed": 0, "half_open": 0.5, "open": 1}.get(estado, 1)
+        for endpoint, estado in api_client.circuit_states().items()
+    }
+)
@@ -0,0 +1,586 @@
+import asyncio
+import contextlib
+import logging
+import time
+
+import httpx
+from aiogram import Bot
+
+from core.config import settings
+from services.api_client import api_client
+from services.circuit_breaker import backoff_com_jitter
+from services.local_db import local_db
+from services.outbound import Lane, outbound_lane
+from services.supervisor import supervisor
+from services.suppression import suppression_list
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    metodo TEXT NOT NULL,
+    from_chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    admin_chat_id INTEGER NOT NULL,
+    status_message_id INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    enviados INTEGER NOT NULL DEFAULT 0,
+    falhas INTEGER NOT NULL DEFAULT 0,
+    ignorados INTEGER NOT NULL DEFAULT 0,
+    carregado INTEGER NOT NULL DEFAULT 0,
+    api_cursor TEXT,
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_targets (
+    job_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    resultado INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Estados de um job
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+
+# Resultado de cada destinatário
+PENDENTE = 0
+ENVIADO = 1
+FALHOU = 2
+
+
+class BroadcastStore:
+    """
+    Persistência dos jobs de broadcast na base local (SQLite).
+
+    O 'cursor' de cada job é um checkpoint: todos os destinatários com
+    seq <= cursor já foram processados. Os resultados individuais também
+    são gravados, por isso um job retomado não reenvia a quem já recebeu.
+
+    Os destinatários são carregados da API aos poucos ('api_cursor' guarda
+    a posição da leitura; 'carregado' indica que a lista está completa).
+    """
+    # Colunas acrescentadas depois da primeira versão da tabela
+    COLUNAS_NOVAS = {
+        "ignorados": "INTEGER NOT NULL DEFAULT 0",
+        "carregado": "INTEGER NOT NULL DEFAULT 0",
+        "api_cursor": "TEXT",
+    }
+
+    def __init__(self):
+        self._pronto = False
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            await local_db.run(self._migrar)
+            self._pronto = True
+
+    def _migrar(self, conn) -> None:
+        existentes = {row["name"] for row in conn.execute("PRAGMA table_info(broadcast_jobs)")}
+        for coluna, tipo in self.COLUNAS_NOVAS.items():
+            if coluna not in existentes:
+                conn.execute(f"ALTER TABLE broadcast_jobs ADD COLUMN {coluna} {tipo}")
+
+    async def create_job(
+        self,
+        metodo: str,
+        from_chat_id: int,
+        message_id: int,
+        admin_chat_id: int,
+        status_message_id: int | None
+    ) -> int:
+        await self._garantir_schema()
+        agora = time.time()
+        return await local_db.execute(
+            "INSERT INTO broadcast_jobs "
+            "(status, metodo, from_chat_id, message_id, admin_chat_id, status_message_id, "
+            "criado_em, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (RUNNING, metodo, from_chat_id, message_id, admin_chat_id, status_message_id, agora, agora)
+        )
+
+    async def append_targets(
+        self,
+        job_id: int,
+        primeiro_seq: int,
+        user_ids: list[int],
+        ignorados: int,
+        api_cursor: str | None,
+        carregado: bool
+    ) -> None:
+        """
+        Acrescenta uma página de destinatários e guarda a posição da leitura
+        na API, numa única transação.
+        """
+        def _acrescentar(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO broadcast_targets (job_id, seq, telegram_id) VALUES (?, ?, ?)",
+                ((job_id, seq, telegram_id) for seq, telegram_id in enumerate(user_ids, start=primeiro_seq))
+            )
+            conn.execute(
+                "UPDATE broadcast_jobs SET total = total + ?, ignorados = ignorados + ?, "
+                "api_cursor = ?, carregado = ?, atualizado_em = ? WHERE id = ?",
+                (len(user_ids), ignorados, api_cursor, int(carregado), time.time(), job_id)
+            )
+
+        await local_db.run(_acrescentar)
+
+    async def get_job(self, job_id: int) -> dict | None:
+        await self._garantir_schema()
+        row = await local_db.fetchone("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+        return dict(row) if row else None
+
+    async def list_jobs(self, limite: int = 5) -> list[dict]:
+        await self._garantir_schema()
+        rows = await local_db.fetchall("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limite,))
+        return [dict(row) for row in rows]
+
+    async def jobs_by_status(self, status: str) -> list[int]:
+        await self._garantir_schema()
+        rows = await local_db.fetchall("SELECT id FROM broadcast_jobs WHERE status = ?", (status,))
+        return [row["id"] for row in rows]
+
+    async def set_status(self, job_id: int, status: str) -> None:
+        await local_db.execute(
+            "UPDATE broadcast_jobs SET status = ?, atualizado_em = ? WHERE id = ?",
+            (status, time.time(), job_id)
+        )
+
+    async def next_targets(self, job_id: int, depois_de: int, limite: int) -> list[tuple[int, int]]:
+        rows = await local_db.fetchall(
+            "SELECT seq, telegram_id FROM broadcast_targets "
+            "WHERE job_id = ? AND seq > ? AND resultado = ? ORDER BY seq LIMIT ?",
+            (job_id, depois_de, PENDENTE, limite)
+        )
+        return [(row["seq"], row["telegram_id"]) for row in rows]
+
+    async def checkpoint(self, job_id: int, cursor: int, resultados: list[tuple[int, int]]) -> None:
+        """
+        Grava os resultados novos e avança o cursor, numa única transação.
+        """
+        def _gravar(conn):
+            conn.executemany(
+                "UPDATE broadcast_targets SET resultado = ? WHERE job_id = ? AND seq = ?",
+                ((resultado, job_id, seq) for seq, resultado in resultados)
+            )
+            enviados = sum(1 for _, r in resultados if r == ENVIADO)
+            conn.execute(
+                "UPDATE broadcast_jobs SET cursor = MAX(cursor, ?), enviados = enviados + ?, "
+                "falhas = falhas + ?, atualizado_em = ? WHERE id = ?",
+                (cursor, enviados, len(resultados) - enviados, time.time(), job_id)
+            )
+
+        await local_db.run(_gravar)
+
+
+class _JobRun:
+    """
+    Estado em memória de um job em execução (fila, destinatários em voo
+    e resultados ainda não gravados).
+    """
+    def __init__(self, job: dict):
+        self.job = job
+        self.status = RUNNING
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=settings.BROADCAST_WORKERS * 4)
+        self.em_voo: set[int] = set()
+        self.ultimo_despachado = job["cursor"]
+        self.resultados: list[tuple[int, int]] = []
+        self.enviados = job["enviados"]
+        self.falhas = job["falhas"]
+        # Envios com erro temporário (rede, RetryAfter esgotado) nesta execução:
+        # ficam pendentes na base e são tentados de novo ao retomar o job
+        self.temporarias = 0
+
+        # Carregamento dos destinatários (em paralelo com o envio)
+        self.total = job["total"]
+        self.ignorados = job["ignorados"]
+        self.carregado = bool(job["carregado"])
+        self.erro_carregamento = False
+        self.novos_alvos = asyncio.Event()
+
+    def cursor(self) -> int:
+        # Marca d'água: tudo abaixo do menor seq ainda em voo está concluído
+        return min(self.em_voo) - 1 if self.em_voo else self.ultimo_despachado
+
+
+class BroadcastEngine:
+    """
+    Motor de broadcast: envia um job com vários workers em paralelo (dentro
+    dos limites do limitador central), com checkpoints periódicos na base
+    local para que um job interrompido seja retomado de onde parou.
+
+    Os destinatários chegam da API em páginas (APIClient.iter_user_ids): o
+    envio começa logo com a primeira página e a memória usada fica limitada.
+
+    Com BOT_WORKERS > 0, os workers (remoto=True) só gravam os pedidos do
+    admin na base; os jobs correm no processo principal (ver watch), que
+    fica com a quota dos envios em massa.
+    """
+    def __init__(self, store: BroadcastStore):
+        self.store = store
+        self._bot: Bot | None = None
+        self._runs: dict[int, _JobRun] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+        self.remoto = False
+        self._parado = False
+
+    async def start(self, bot: Bot, retomar: bool = True, remoto: bool = False) -> None:
+        """
+        Guarda o Bot e retoma os jobs que estavam a correr antes do reinício
+        (com retomar=False, ex: processos sem tarefas de fundo, só guarda o Bot).
+        Com remoto=True, os jobs iniciados aqui correm noutro processo.
+        """
+        self._bot = bot
+        self.remoto = remoto
+        self._parado = False
+        if not retomar:
+            return
+        for job_id in await self.store.jobs_by_status(RUNNING):
+            logger.info("Broadcast: a retomar job #%s após reinício.", job_id)
+            await self.start_job(job_id)
+
+    async def stop(self) -> None:
+        """
+        Interrompe os jobs em memória (continuam 'running' na base e são
+        retomados no próximo arranque).
+        """
+        self._parado = True
+        for task in list(self._tasks.values()):
+            task.cancel()
+        for task in list(self._tasks.values()):
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def create_job(
+        self,
+        metodo: str,
+        from_chat_id: int,
+        message_id: int,
+        admin_chat_id: int,
+        status_message_id: int | None
+    ) -> int:
+        return await self.store.create_job(metodo, from_chat_id, message_id, admin_chat_id, status_message_id)
+
+    async def start_job(self, job_id: int) -> bool:
+        """
+        Inicia (ou retoma) um job. Devolve False se ele não puder correr.
+        """
+        if job_id in self._tasks:
+            return False
+        job = await self.store.get_job(job_id)
+        if job is None or job["status"] in (CANCELLED, DONE):
+            return False
+        if job["status"] != RUNNING:
+            await self.store.set_status(job_id, RUNNING)
+            job["status"] = RUNNING
+        if self.remoto:
+            # O processo principal vê o job 'running' na base e inicia-o (watch)
+            return True
+
+        run = _JobRun(job)
+        self._runs[job_id] = run
+        self._tasks[job_id] = supervisor.spawn(f"broadcast_job_{job_id}", self._run_job(run))
+        return True
+
+    async def watch(self, intervalo: float) -> None:
+        """
+        Inicia os jobs 'running' na base que não estão a correr neste
+        processo (ex: pedidos pelo admin num worker, ou retomados).
+        """
+        while True:
+            if not self._parado:
+                for job_id in await self.store.jobs_by_status(RUNNING):
+                    if job_id not in self._tasks:
+                        logger.info("Broadcast: a iniciar job #%s.", job_id)
+                        await self.start_job(job_id)
+            await asyncio.sleep(intervalo)
+
+    async def pause_job(self, job_id: int) -> bool:
+        return await self._parar(job_id, PAUSED)
+
+    async def cancel_job(self, job_id: int) -> bool:
+        return await self._parar(job_id, CANCELLED)
+
+    async def resume_job(self, job_id: int) -> bool:
+        job = await self.store.get_job(job_id)
+        if job is None or job["status"] != PAUSED:
+            return False
+        task = self._tasks.get(job_id)
+        if task is not None:
+            # A execução anterior ainda está a terminar (pausa logo antes de
+            # retomar): espera que ela pare e grave o checkpoint
+            run = self._runs.get(job_id)
+            if run is not None and run.status == RUNNING:
+                run.status = PAUSED
+                run.novos_alvos.set()
+            await asyncio.wait({task})
+        return await self.start_job(job_id)
+
+    async def _parar(self, job_id: int, status: str) -> bool:
+        job = await self.store.get_job(job_id)
+        if job is None or job["status"] in (CANCELLED, DONE):
+            return False
+        run = self._runs.get(job_id)
+        if run is not None:
+            # Os workers veem o novo status e param após o envio em curso
+            run.status = status
+            run.novos_alvos.set()
+        await self.store.set_status(job_id, status)
+        return True
+
+    def progress(self, job_id: int) -> dict | None:
+        """
+        Progresso em memória de um job em execução (mais atual que a base).
+        """
+        run = self._runs.get(job_id)
+        if run is None:
+            return None
+        return {
+            "enviados": run.enviados,
+            "falhas": run.falhas,
+            "em_voo": len(run.em_voo),
+            "total": run.total,
+            "carregado": run.carregado,
+        }
+
+    # --- Execução ---
+
+    async def _run_job(self, run: _JobRun) -> None:
+        job_id = run.job["id"]
+        # Relê a lista de inativos: com BOT_WORKERS, quem voltou a falar com o
+        # bot foi retirado da lista na base por outro processo
+        await suppression_list.load()
+        workers = [
+            asyncio.create_task(self._worker(run))
+            for _ in range(max(settings.BROADCAST_WORKERS, 1))
+        ]
+        checkpointer = asyncio.create_task(self._checkpointer(run))
+        loader = asyncio.create_task(self._loader(run)) if not run.carregado else None
+        try:
+            await self._feeder(run)
+            # Sinal de fim para cada worker
+            for _ in workers:
+                await run.fila.put(None)
+            await asyncio.gather(*workers)
+
+            if run.status == RUNNING and run.temporarias:
+                # Há envios por repetir: o job fica em pausa para o admin retomar
+                run.status = PAUSED
+                await self.store.set_status(job_id, PAUSED)
+            elif run.status == RUNNING:
+                run.status = DONE
+                await self.store.set_status(job_id, DONE)
+                await suppression_list.report_to_backend()
+        finally:
+            tarefas = [*workers, checkpointer] + ([loader] if loader else [])
+            for task in tarefas:
+                task.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+            await self._checkpoint(run)
+            await self._atualizar_mensagem(run, final=True)
+            self._runs.pop(job_id, None)
+            self._tasks.pop(job_id, None)
+
+    async def _loader(self, run: _JobRun) -> None:
+        """
+        Lê os IDs da API página a página (filtrando os usuários inativos)
+        e grava-os como destinatários, guardando a posição da leitura.
+        """
+        job = run.job
+        falhas_seguidas = 0
+
+        while run.status == RUNNING and not run.carregado:
+            try:
+                async for ids, api_cursor in api_client.iter_user_ids(
+                    page_size=settings.BROADCAST_PAGE_SIZE,
+                    cursor=job["api_cursor"]
+                ):
+                    alvos = suppression_list.filter(ids)
+                    ignorados = len(ids) - len(alvos)
+                    carregado = api_cursor is None
+                    await self.store.append_targets(
+                        job["id"], run.total + 1, alvos, ignorados, api_cursor, carregado
+                    )
+                    run.total += len(alvos)
+                    run.ignorados += ignorados
+                    run.carregado = carregado
+                    job["api_cursor"] = api_cursor
+                    falhas_seguidas = 0
+                    run.novos_alvos.set()
+                    if run.status != RUNNING:
+                        return
+            except httpx.HTTPError as e:
+                falhas_seguidas += 1
+                logger.warning("Erro ao carregar destinatários do broadcast #%s: %s", job['id'], e)
+                if falhas_seguidas >= settings.BROADCAST_LOAD_MAX_RETRIES:
+                    # Desiste de carregar: envia para quem já foi carregado
+                    run.erro_carregamento = True
+                    await self.store.append_targets(job["id"], run.total + 1, [], 0, job["api_cursor"], True)
+                    run.carregado = True
+                    run.novos_alvos.set()
+                    return
+                await asyncio.sleep(backoff_com_jitter(falhas_seguidas, 1.0, 30.0))
+
+    async def _feeder(self, run: _JobRun) -> None:
+        """
+        Lê os destinatários pendentes da base, por páginas, e enfileira-os.
+        Enquanto a lista não estiver toda carregada, espera por novas páginas.
+        """
+        job_id = run.job["id"]
+        # Começa do início (e não do cursor): os destinatários abaixo do cursor
+        # ainda pendentes são os que falharam com erro temporário numa
+        # execução anterior. Os já processados são saltados pela consulta.
+        depois_de = 0
+        while run.status == RUNNING:
+            run.novos_alvos.clear()
+            carregado = run.carregado
+            pagina = await self.store.next_targets(job_id, depois_de, settings.BROADCAST_PAGE_SIZE)
+            if not pagina:
+                if carregado:
+                    return
+                await run.novos_alvos.wait()
+                continue
+            for seq, telegram_id in pagina:
+                if run.status != RUNNING:
+                    return
+                run.em_voo.add(seq)
+                run.ultimo_despachado = seq
+                await run.fila.put((seq, telegram_id))
+            depois_de = pagina[-1][0]
+
+    async def _worker(self, run: _JobRun) -> None:
+        job = run.job
+        send_function = self._bot.copy_message if job["metodo"] == "copy" else self._bot.forward_message
+
+        while True:
+            item = await run.fila.get()
+            if item is None:
+                return
+            seq, telegram_id = item
+            if run.status != RUNNING:
+                # Pausado/cancelado: fica pendente (não avança o cursor)
+                continue
+
+            if suppression_list.is_suppressed(telegram_id):
+                # Bloqueou o bot depois de o job ter sido criado: nem tenta
+                run.falhas += 1
+                run.resultados.append((seq, FALHOU))
+                run.em_voo.discard(seq)
+                continue
+
+            try:
+                with outbound_lane(Lane.BULK):
+                    await send_function(
+                        chat_id=telegram_id,
+                        from_chat_id=job["from_chat_id"],
+                        message_id=job["message_id"]
+                    )
+                resultado = ENVIADO
+                run.enviados += 1
+            except Exception as e:
+                # A falha mais comum é o usuário ter bloqueado o bot:
+                # nesse caso ele sai dos próximos envios (falha definitiva)
+                motivo = await suppression_list.record_failure(telegram_id, e)
+                if motivo is None:
+                    # Erro temporário: fica pendente, para ser repetido ao retomar
+                    logger.warning("Falha ao enviar broadcast #%s para %s: %s", job['id'], telegram_id, e)
+                    run.temporarias += 1
+                    run.em_voo.discard(seq)
+                    continue
+                resultado = FALHOU
+                run.falhas += 1
+
+            run.resultados.append((seq, resultado))
+            run.em_voo.discard(seq)
+
+    async def _checkpointer(self, run: _JobRun) -> None:
+        while True:
+            await asyncio.sleep(settings.BROADCAST_CHECKPOINT_SECONDS)
+            await self._checkpoint(run)
+            await self._atualizar_mensagem(run)
+            await self._sincronizar_status(run)
+
+    async def _sincronizar_status(self, run: _JobRun) -> None:
+        """
+        Aplica pausas/cancelamentos gravados por outro processo
+        (ex: comando do admin tratado noutro worker).
+        """
+        job = await self.store.get_job(run.job["id"])
+        if job is not None and job["status"] in (PAUSED, CANCELLED) and run.status == RUNNING:
+            run.status = job["status"]
+            run.novos_alvos.set()
+
+    async def _checkpoint(self, run: _JobRun) -> None:
+        resultados, run.resultados = run.resultados, []
+        try:
+            # 'shield': um cancelamento (ex: encerramento) não interrompe a gravação
+            await asyncio.shield(self.store.checkpoint(run.job["id"], run.cursor(), resultados))
+        except Exception as e:
+            logger.warning("Erro ao gravar checkpoint do broadcast #%s: %s", run.job['id'], e)
+            run.resultados = resultados + run.resultados
+
+    async def _atualizar_mensagem(self, run: _JobRun, final: bool = False) -> None:
+        """
+        Atualiza a mensagem de progresso enviada ao admin.
+        """
+        job = run.job
+        if not job.get("status_message_id"):
+            return
+
+        total = run.total
+        processados = run.enviados + run.falhas
+        percentual = int(processados / total * 100) if total and run.carregado else 0
+        total_texto = str(total) if run.carregado else f"{total}+ (a carregar)"
+
+        if final and run.status == DONE and run.erro_carregamento and not total:
+            texto = f"❌ Broadcast #{job['id']}: falha ao buscar lista de usuários na API."
+        elif final and run.status == DONE and not total:
+            texto = f"Broadcast #{job['id']}: nenhum cliente encontrado para enviar."
+        elif final and run.status == DONE:
+            texto = (
+                f"✅ **Broadcast #{job['id']} Concluído!**\n\n"
+                f"Enviado com sucesso: {run.enviados}\n"
+                f"Falhas (bot bloqueado): {run.falhas}\n"
+                f"Ignorados (inativos): {run.ignorados}\n"
+                f"Total de Clientes: {total}"
+            )
+            if run.erro_carregamento:
+                texto += "\n\n⚠️ A lista de usuários não foi carregada por completo."
+        elif run.status in (PAUSED, CANCELLED):
+            rotulo = "pausado ⏸" if run.status == PAUSED else "cancelado ❌"
+            texto = (
+                f"Broadcast #{job['id']} {rotulo} ({percentual}%)\n\n"
+                f"Enviados: {run.enviados}\n"
+                f"Falhas: {run.falhas}"
+            )
+            if run.temporarias:
+                texto += f"\nPor repetir (erro temporário): {run.temporarias} — retome o job para tentar de novo."
+        else:
+            texto = (
+                f"Broadcast #{job['id']}: enviando para {total_texto} clientes... ({percentual}%)\n\n"
+                f"Enviados: {run.enviados}\n"
+                f"Falhas: {run.falhas}"
+            )
+
+        try:
+            await self._bot.edit_message_text(
+                text=texto,
+                chat_id=job["admin_chat_id"],
+                message_id=job["status_message_id"]
+            )
+        except Exception:
+            # "message is not modified" ou mensagem apagada: não é crítico
+            pass
+
+
+# Instâncias únicas, usadas pelo bot.py e pelos handlers de admin
+broadcast_store = BroadcastStore()
+broadcast_engine = BroadcastEngine(broadcast_store)
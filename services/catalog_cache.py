@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+
+from core.config import settings
+from services.api_client import api_client
+from services.supervisor import supervisor
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """
+    Cache em memória do catálogo de produtos, com índice por 'id'.
+
+    - Durante o TTL, as leituras são servidas da memória (sem ida à API).
+    - Depois do TTL, devolve a versão antiga (stale) e atualiza em segundo
+      plano, até ao limite de 'max_stale'; passado esse limite, espera pela API.
+    - Usa pedidos condicionais (ETag / If-None-Match) quando a API suporta.
+    """
+    def __init__(self, ttl_segundos: float, max_stale_segundos: float, miss_refresh_segundos: float):
+        self._ttl = ttl_segundos
+        self._max_stale = max_stale_segundos
+        self._miss_refresh = miss_refresh_segundos
+
+        self._produtos: list | None = None
+        self._por_id: dict[str, dict] = {}
+        # (modelo, id) -> texto já formatado do produto (ver render())
+        self._textos: dict[tuple[str, str], str] = {}
+        self._etag: str | None = None
+        self._atualizado_em = float("-inf")
+        self._ultima_falha_em = float("-inf")
+
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    def _idade(self) -> float:
+        return time.monotonic() - self._atualizado_em
+
+    async def get_produtos(self) -> list | None:
+        """
+        Devolve a lista de produtos (da memória sempre que possível).
+        """
+        if self._produtos is not None:
+            idade = self._idade()
+            if idade < self._ttl:
+                return self._produtos
+            if idade < self._ttl + self._max_stale:
+                self._refresh_in_background()
+                return self._produtos
+
+        # Sem cache (ou velho demais): busca na API e espera
+        await self.refresh()
+        return self._produtos
+
+    async def get_produto(self, produto_id: str) -> dict | None:
+        """
+        Devolve um produto pelo ID (consulta O(1) no índice).
+        """
+        await self.get_produtos()
+        return self._por_id.get(produto_id)
+
+    async def get_produto_atual(self, produto_id: str) -> dict | None:
+        """
+        Como get_produto, mas um ID que não está no índice (ex: produto
+        criado depois da última atualização) faz ir à API antes de desistir.
+        As idas forçadas à API por IDs desconhecidos são no máximo uma a
+        cada 'miss_refresh_segundos'.
+        """
+        produto = await self.get_produto(produto_id)
+        if produto is not None:
+            return produto
+
+        agora = time.monotonic()
+        if agora - self._ultima_falha_em < self._miss_refresh:
+            return None
+        self._ultima_falha_em = agora
+
+        self.invalidate()
+        await self.refresh()
+        return self._por_id.get(produto_id)
+
+    def render(self, produto: dict, modelo: str, formatar: Callable[[dict], str]) -> str:
+        """
+        Texto de um produto formatado com 'formatar', guardado por
+        (modelo, id) até o catálogo mudar: mostrar o mesmo produto outra
+        vez não volta a formatar o texto.
+        """
+        chave = (modelo, str(produto["id"]))
+        texto = self._textos.get(chave)
+        if texto is None:
+            texto = self._textos[chave] = formatar(produto)
+        return texto
+
+    async def refresh(self) -> None:
+        """
+        Atualiza o catálogo a partir da API (pedido condicional).
+        Em caso de erro, mantém a última versão conhecida.
+        """
+        async with self._lock:
+            # Outro chamador pode ter atualizado enquanto esperávamos o lock
+            if self._produtos is not None and self._idade() < self._ttl:
+                return
+
+            etag = self._etag if self._produtos is not None else None
+            resultado = await api_client.get_produtos_if_changed(etag)
+            if resultado is None:
+                return
+
+            if resultado["modificado"]:
+                self._set_produtos(resultado["produtos"], resultado.get("etag"))
+            self._atualizado_em = time.monotonic()
+
+    def invalidate(self) -> None:
+        """
+        Força a próxima leitura a buscar o catálogo na API.
+        """
+        self._atualizado_em = float("-inf")
+
+    def _set_produtos(self, produtos: list, etag: str | None) -> None:
+        self._produtos = produtos
+        self._por_id = {str(p["id"]): p for p in produtos}
+        self._etag = etag
+        self._textos = {}
+
+    def _refresh_in_background(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = supervisor.spawn("catalog_refresh", self._safe_refresh())
+
+    async def _safe_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("Erro ao atualizar o catálogo em segundo plano: %s", e)
+
+
+# Instância única do cache, partilhada por todos os handlers
+catalog_cache = CatalogCache(
+    ttl_segundos=settings.CATALOG_CACHE_TTL_SECONDS,
+    max_stale_segundos=settings.CATALOG_CACHE_MAX_STALE_SECONDS,
+    miss_refresh_segundos=settings.CATALOG_CACHE_MISS_REFRESH_SECONDS
+)
@@ -0,0 +1,92 @@
+import logging
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(httpx.RequestError):
+    """
+    Levantada quando o circuito de um endpoint está aberto (falha rápida).
+    É uma 'httpx.RequestError', por isso os métodos do APIClient tratam-na
+    como "API offline" sem precisarem de código novo.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por endpoint (fechado / aberto / meio-aberto).
+
+    - Fechado: os pedidos passam; falhas consecutivas são contadas.
+    - Aberto: após 'limite_falhas' falhas seguidas, os pedidos falham na hora
+      durante 'tempo_reset' segundos, sem tocar na rede.
+    - Meio-aberto: passado esse tempo, deixa passar 'max_testes' pedidos de
+      teste; um sucesso fecha o circuito, uma falha volta a abri-lo.
+    """
+    FECHADO = "closed"
+    ABERTO = "open"
+    MEIO_ABERTO = "half_open"
+
+    def __init__(self, nome: str, limite_falhas: int, tempo_reset: float, max_testes: int = 1):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_reset = tempo_reset
+        self.max_testes = max_testes
+
+        self.estado = self.FECHADO
+        self._falhas = 0
+        self._aberto_em = 0.0
+        self._testes_em_curso = 0
+
+    def before_request(self) -> None:
+        """
+        Chamado antes de cada pedido. Levanta CircuitOpenError se o pedido
+        não deve ser feito agora.
+        """
+        if self.estado == self.FECHADO:
+            return
+
+        if self.estado == self.ABERTO:
+            if time.monotonic() - self._aberto_em < self.tempo_reset:
+                raise CircuitOpenError(f"Circuito '{self.nome}' aberto (API indisponível)")
+            self.estado = self.MEIO_ABERTO
+            self._testes_em_curso = 0
+
+        if self._testes_em_curso >= self.max_testes:
+            raise CircuitOpenError(f"Circuito '{self.nome}' em teste (meio-aberto)")
+        self._testes_em_curso += 1
+
+    def release_probe(self) -> None:
+        """
+        Liberta o lugar de teste de um pedido que terminou sem resultado
+        (ex: tarefa cancelada a meio). Sem isto, um teste cancelado deixava
+        o circuito meio-aberto a falhar na hora até reiniciar o processo.
+        """
+        if self.estado == self.MEIO_ABERTO and self._testes_em_curso > 0:
+            self._testes_em_curso -= 1
+
+    def record_success(self) -> None:
+        if self.estado != self.FECHADO:
+            logger.info("CircuitBreaker: circuito '%s' fechado (API recuperada).", self.nome)
+        self.estado = self.FECHADO
+        self._falhas = 0
+        self._testes_em_curso = 0
+
+    def record_failure(self) -> None:
+        self._falhas += 1
+        if self.estado == self.MEIO_ABERTO or self._falhas >= self.limite_falhas:
+            if self.estado != self.ABERTO:
+                logger.warning("CircuitBreaker: circuito '%s' aberto após %s falha(s).", self.nome, self._falhas)
+            self.estado = self.ABERTO
+            self._aberto_em = time.monotonic()
+            self._testes_em_curso = 0
+
+
+def backoff_com_jitter(tentativa: int, base: float, maximo: float) -> float:
+    """
+    Backoff exponencial com "full jitter": um valor aleatório entre 0 e
+    min(maximo, base * 2^(tentativa-1)).
+    """
+    return random.uniform(0, min(maximo, base * (2 ** (tentativa - 1))))
@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import logging
+import time
+
+from core.config import settings
+from services.api_client import api_client
+from services.local_db import local_db
+from services.metrics import registry
+from services.supervisor import supervisor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expiration_acks (
+    pedido_id TEXT NOT NULL,
+    data_expiracao TEXT NOT NULL,
+    enviado_em REAL NOT NULL,
+    confirmado INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (pedido_id, data_expiracao)
+) WITHOUT ROWID;
+"""
+
+# Registos confirmados mais antigos que isto são apagados no arranque
+RETENCAO_SEGUNDOS = 7 * 24 * 3600
+
+
+class ExpirationAckBuffer:
+    """
+    Buffer "write-behind" das confirmações de avisos de expiração.
+
+    - Cada aviso enviado é gravado de imediato na base local (registo durável),
+      por isso, mesmo que a confirmação à API falhe, o aviso não é repetido.
+    - As confirmações são enviadas à API em lote, quando o buffer enche ou a
+      cada X segundos; se a API não tiver o endpoint em lote, confirma-se
+      item a item.
+    """
+    def __init__(self, tamanho_lote: int, intervalo_segundos: float):
+        self.tamanho_lote = max(tamanho_lote, 1)
+        self.intervalo_segundos = intervalo_segundos
+
+        self._registados: set[tuple[str, str]] = set()
+        self._buffer: dict[tuple[str, str], None] = {}  # dict = conjunto ordenado
+        self._em_envio: set[tuple[str, str]] = set()
+        self._confirmados: set[tuple[str, str]] = set()
+        self._lock = asyncio.Lock()
+        self._pronto = False
+        self._flush_task: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        """
+        Carrega o registo local e volta a pôr no buffer as confirmações
+        que ficaram por fazer (ex: a API falhou antes de um reinício).
+        """
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            self._pronto = True
+
+        await local_db.execute(
+            "DELETE FROM expiration_acks WHERE confirmado = 1 AND enviado_em < ?",
+            (time.time() - RETENCAO_SEGUNDOS,)
+        )
+        rows = await local_db.fetchall("SELECT pedido_id, data_expiracao, confirmado FROM expiration_acks")
+        self._registados = {(row["pedido_id"], row["data_expiracao"]) for row in rows}
+        self._confirmados = {(row["pedido_id"], row["data_expiracao"]) for row in rows if row["confirmado"]}
+        for chave in self._registados - self._confirmados:
+            self._buffer[chave] = None
+
+        if self._buffer:
+            logger.info("ExpirationAcks: %s confirmação(ões) pendente(s) recuperada(s).", len(self._buffer))
+
+    async def start(self) -> None:
+        await self.load()
+        self._flush_task = supervisor.supervise("expiration_acks_flush", self._flush_periodico)
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    def pendentes(self) -> int:
+        """
+        Quantas confirmações ainda não foram aceites pela API.
+        """
+        return len(self._buffer)
+
+    def already_sent(self, pedido_id: str, data_expiracao: str) -> bool:
+        """
+        Indica se o aviso deste pedido já foi enviado (segundo o registo local).
+        """
+        return (pedido_id, data_expiracao) in self._registados
+
+    async def add(self, pedido_id: str, data_expiracao: str) -> None:
+        """
+        Regista um aviso enviado e agenda a sua confirmação à API.
+        """
+        chave = (pedido_id, data_expiracao)
+        if chave not in self._registados:
+            if not self._pronto:
+                await self.load()
+            self._registados.add(chave)
+            await local_db.execute(
+                "INSERT OR IGNORE INTO expiration_acks (pedido_id, data_expiracao, enviado_em) VALUES (?, ?, ?)",
+                (pedido_id, data_expiracao, time.time())
+            )
+
+        if chave in self._em_envio or chave in self._confirmados:
+            # Já a caminho da API (ou já aceite): a página veio desatualizada
+            return
+        self._buffer[chave] = None
+        if len(self._buffer) >= self.tamanho_lote:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Envia à API as confirmações em buffer. As que falharem voltam ao
+        buffer para a próxima tentativa.
+        """
+        async with self._lock:
+            if not self._buffer:
+                return
+            lote = list(self._buffer)
+            self._buffer.clear()
+            self._em_envio.update(lote)
+
+            try:
+                confirmados = await self._confirmar(lote)
+            finally:
+                self._em_envio.difference_update(lote)
+
+            falhados = [chave for chave in lote if chave not in confirmados]
+            for chave in falhados:
+                self._buffer[chave] = None
+
+            if confirmados:
+                self._confirmados.update(confirmados)
+                await local_db.executemany(
+                    "UPDATE expiration_acks SET confirmado = 1 WHERE pedido_id = ? AND data_expiracao = ?",
+                    list(confirmados)
+                )
+            if falhados:
+                logger.warning("ExpirationAcks: %s confirmação(ões) falharam, nova tentativa mais tarde.", len(falhados))
+
+    async def _confirmar(self, lote: list[tuple[str, str]]) -> set[tuple[str, str]]:
+        """
+        Confirma o lote na API (em pedidos de até 'tamanho_lote' itens).
+        Devolve as chaves confirmadas com sucesso.
+        """
+        confirmados = set()
+        for inicio in range(0, len(lote), self.tamanho_lote):
+            parte = lote[inicio:inicio + self.tamanho_lote]
+            itens = [{"pedido_id": pedido_id, "data_expiracao": data} for pedido_id, data in parte]
+
+            resultado = await api_client.mark_expiration_notifications_sent_bulk(itens)
+            if resultado is True:
+                confirmados.update(parte)
+            elif resultado is None:
+                # Sem endpoint em lote na API: confirma item a item
+                for pedido_id, data in parte:
+                    if await api_client.mark_expiration_notification_sent(pedido_id, data):
+                        confirmados.add((pedido_id, data))
+        return confirmados
+
+    async def _flush_periodico(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo_segundos)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Erro ao enviar confirmações de expiração: %s", e)
+
+
+# Instância única, usada pelo notificador de expiração
+expiration_acks = ExpirationAckBuffer(
+    tamanho_lote=settings.EXPIRACAO_ACK_BATCH_SIZE,
+    intervalo_segundos=settings.EXPIRACAO_ACK_FLUSH_SECONDS
+)
+
+registry.gauge(
+    "bot_expiration_acks_pending", "Confirmações de expiração à espera de envio à API", (),
+    lambda: {(): len(expiration_acks._buffer) + len(expiration_acks._em_envio)}
+)
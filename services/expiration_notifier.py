@@ -1,10 +1,17 @@
 import asyncio
 import datetime
+import logging
+import time
 
 from aiogram import Bot
 
 from core.config import settings
 from services.api_client import api_client
+from services.expiration_acks import expiration_acks
+from services.outbound import Lane, outbound_lane
+from services.suppression import suppression_list
+
+logger = logging.getLogger(__name__)
 
 
 def _escape_markdown(text: str) -> str:
@@ -19,6 +26,123 @@ def _formatar_data_br(data_iso: str) -> str:
         return data_iso
 
 
+async def _notificar_item(bot: Bot, item: dict, semaforo: asyncio.Semaphore, stats: dict) -> bool:
+    """
+    Envia o aviso de um pedido e regista-o no buffer de confirmações
+    (a marcação na API é feita em lote). Devolve True se o pedido foi
+    confirmado (sai da lista de pendentes da API).
+    """
+    pedido_id = str(item.get("pedido_id"))
+    telegram_id = item.get("telegram_id")
+    produto_nome = _escape_markdown(item.get("produto_nome", "Produto"))
+    data_expiracao = str(item.get("data_expiracao"))
+    data_expiracao_br = _formatar_data_br(data_expiracao)
+
+    if expiration_acks.already_sent(pedido_id, data_expiracao):
+        # Já enviado antes, mas a API ainda não recebeu a confirmação:
+        # não repete o aviso, apenas volta a agendar a confirmação
+        await expiration_acks.add(pedido_id, data_expiracao)
+        stats["ja_enviados"] += 1
+        return True
+
+    if suppression_list.is_suppressed(telegram_id):
+        # O usuário bloqueou o bot: não envia, mas também não confirma
+        # (se ele voltar, o aviso ainda é enviado numa próxima execução)
+        stats["ignorados"] += 1
+        return False
+
+    mensagem = (
+        "⚠️ *Aviso de Expiração*\n\n"
+        f"A sua conta do produto *{produto_nome}* expirou hoje "
+        f"\\({data_expiracao_br}\\)\\.\n\n"
+        "Se precisar, abra um ticket em *🆘 Suporte* "
+        "ou fale diretamente com o administrador\\."
+    )
+
+    async with semaforo:
+        try:
+            with outbound_lane(Lane.BULK):
+                await bot.send_message(chat_id=telegram_id, text=mensagem)
+        except Exception as send_error:
+            logger.warning("Falha ao enviar notificação de expiração do pedido %s: %s", pedido_id, send_error)
+            stats["falhas"] += 1
+            # Se o chat estiver morto, o usuário fica suprimido; o aviso fica
+            # por confirmar, como os restantes avisos não entregues
+            await suppression_list.record_failure(telegram_id, send_error)
+            return False
+
+    await expiration_acks.add(pedido_id, data_expiracao)
+    stats["enviados"] += 1
+    return True
+
+
+async def notify_pending_expirations(bot: Bot) -> dict:
+    """
+    Uma execução do notificador: busca páginas de expirações pendentes até
+    esvaziar a fila, enviando com concorrência limitada (a taxa de envio é
+    controlada pelo limitador central). Devolve as estatísticas da execução.
+    """
+    inicio = time.monotonic()
+    tamanho_pagina = max(settings.EXPIRACAO_PAGE_SIZE, 1)
+    semaforo = asyncio.Semaphore(max(settings.EXPIRACAO_NOTIFIER_CONCURRENCY, 1))
+    stats = {"paginas": 0, "itens": 0, "enviados": 0, "falhas": 0, "ignorados": 0, "ja_enviados": 0}
+
+    # Com BOT_WORKERS, os usuários que voltaram a falar com o bot saem da
+    # lista na base por outro processo: relê-a em cada execução
+    await suppression_list.load()
+
+    # Pedidos já tratados nesta execução: se a marcação falhar, a API volta
+    # a devolvê-los e não queremos repetir o aviso nem entrar em ciclo
+    vistos: set[str] = set()
+
+    # Pendentes que a API continua a devolver (já vistos, ou não confirmados
+    # nesta página: usuário inativo, falha no envio): são saltados com
+    # 'offset' para chegar aos seguintes
+    offset = 0
+    pagina_anterior: tuple[int, list[str]] | None = None  # (offset, IDs) do pedido anterior
+
+    while True:
+        pendentes = await api_client.get_expiration_pending_notifications(limite=tamanho_pagina, offset=offset)
+        if not pendentes:
+            break
+        ids_pagina = [str(item.get("pedido_id")) for item in pendentes]
+        novos = [item for item in pendentes if str(item.get("pedido_id")) not in vistos]
+        confirmados = 0
+
+        if novos:
+            stats["paginas"] += 1
+            stats["itens"] += len(novos)
+            vistos.update(str(item.get("pedido_id")) for item in novos)
+
+            resultados = await asyncio.gather(*(_notificar_item(bot, item, semaforo, stats) for item in novos))
+            confirmados = sum(resultados)
+            # Confirma a página antes de pedir a próxima (senão a API devolve-a de novo)
+            await expiration_acks.flush()
+        elif pagina_anterior is not None and pagina_anterior[0] != offset and pagina_anterior[1] == ids_pagina:
+            # A mesma página com outro offset: a API não suporta 'offset'
+            logger.warning(
+                "Notificador de expiração: a API devolveu de novo %s pendente(s) já avisado(s); "
+                "os seguintes ficam para a próxima execução.", len(pendentes)
+            )
+            break
+
+        pagina_anterior = (offset, ids_pagina)
+        offset += len(pendentes) - confirmados
+        if len(pendentes) < tamanho_pagina:
+            break
+
+    stats["duracao_segundos"] = round(time.monotonic() - inicio, 2)
+    if stats["itens"]:
+        logger.info(
+            "Notificador de expiração: %s item(ns) em %s página(s), %s enviado(s), %s falha(s), "
+            "%s ignorado(s), %s já enviado(s), %ss",
+            stats['itens'], stats['paginas'], stats['enviados'], stats['falhas'],
+            stats['ignorados'], stats['ja_enviados'], stats['duracao_segundos'],
+            extra={"duration_ms": round(stats['duracao_segundos'] * 1000)}
+        )
+    return stats
+
+
 async def run_expiration_notifier(bot: Bot):
     """
     Loop periódico que busca expirações pendentes do dia e envia
@@ -28,30 +152,8 @@ async def run_expiration_notifier(bot: Bot):
 
     while True:
         try:
-            pendentes = await api_client.get_expiration_pending_notifications()
-
-            for item in pendentes:
-                pedido_id = str(item.get("pedido_id"))
-                telegram_id = item.get("telegram_id")
-                produto_nome = _escape_markdown(item.get("produto_nome", "Produto"))
-                data_expiracao = str(item.get("data_expiracao"))
-                data_expiracao_br = _formatar_data_br(data_expiracao)
-
-                mensagem = (
-                    "⚠️ *Aviso de Expiração*\n\n"
-                    f"A sua conta do produto *{produto_nome}* expirou hoje "
-                    f"\\({data_expiracao_br}\\)\\.\n\n"
-                    "Se precisar, abra um ticket em *🆘 Suporte* "
-                    "ou fale diretamente com o administrador\\."
-                )
-
-                try:
-                    await bot.send_message(chat_id=telegram_id, text=mensagem)
-                    await api_client.mark_expiration_notification_sent(pedido_id, data_expiracao)
-                except Exception as send_error:
-                    print(f"Falha ao enviar notificação de expiração do pedido {pedido_id}: {send_error}")
-
+            await notify_pending_expirations(bot)
         except Exception as loop_error:
-            print(f"Erro no loop de notificação de expiração: {loop_error}")
+            logger.warning("Erro no loop de notificação de expiração: %s", loop_error)
 
         await asyncio.sleep(intervalo_segundos)
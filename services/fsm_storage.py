@@ -0,0 +1,188 @@
+import json
+import logging
+import time
+from functools import partial
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from core.config import settings
+from services.local_db import LocalDatabase, local_db
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    chave TEXT PRIMARY KEY,
+    estado TEXT,
+    dados TEXT,
+    atualizado_em REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fsm_storage_atualizado_em ON fsm_storage (atualizado_em);
+"""
+
+# JSON compacto (sem espaços) e sem escapar acentos
+_json_dumps = partial(json.dumps, separators=(",", ":"), ensure_ascii=False)
+
+# Intervalo mínimo (segundos) entre limpezas das sessões expiradas
+INTERVALO_LIMPEZA_SEGUNDOS = 600
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Storage do FSM na base local (SQLite em WAL): as conversas a meio
+    (ex: à espera do valor da recarga ou do e-mail) sobrevivem a reinícios
+    e podem ser partilhadas por vários processos no mesmo host.
+
+    Sessões sem atividade há mais de 'ttl_segundos' são consideradas
+    abandonadas: deixam de ser devolvidas e são apagadas periodicamente.
+    """
+    def __init__(self, db: LocalDatabase, ttl_segundos: int | None):
+        self.db = db
+        self.ttl_segundos = ttl_segundos
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._pronto = False
+        self._ultima_limpeza = 0.0
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await self.db.executescript(SCHEMA)
+            self._pronto = True
+
+    def _limite_validade(self) -> float:
+        if not self.ttl_segundos:
+            return 0.0
+        return time.time() - self.ttl_segundos
+
+    async def _limpar_expiradas(self) -> None:
+        agora = time.time()
+        if not self.ttl_segundos or agora - self._ultima_limpeza < INTERVALO_LIMPEZA_SEGUNDOS:
+            return
+        self._ultima_limpeza = agora
+        await self.db.execute("DELETE FROM fsm_storage WHERE atualizado_em < ?", (self._limite_validade(),))
+
+    async def _ler(self, key: StorageKey):
+        await self._garantir_schema()
+        return await self.db.fetchone(
+            "SELECT estado, dados FROM fsm_storage WHERE chave = ? AND atualizado_em >= ?",
+            (self.key_builder.build(key), self._limite_validade())
+        )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._garantir_schema()
+        chave = self.key_builder.build(key)
+        estado = state.state if isinstance(state, State) else state
+        limite = self._limite_validade()
+
+        def _gravar(conn):
+            # Uma sessão expirada recomeça sem dados
+            conn.execute(
+                "INSERT INTO fsm_storage (chave, estado, dados, atualizado_em) VALUES (?, ?, NULL, ?) "
+                "ON CONFLICT (chave) DO UPDATE SET estado = excluded.estado, "
+                "dados = CASE WHEN atualizado_em >= ? THEN dados END, "
+                "atualizado_em = excluded.atualizado_em",
+                (chave, estado, time.time(), limite)
+            )
+            conn.execute("DELETE FROM fsm_storage WHERE chave = ? AND estado IS NULL AND dados IS NULL", (chave,))
+
+        await self.db.run(_gravar)
+        await self._limpar_expiradas()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await self._ler(key)
+        return row["estado"] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._garantir_schema()
+        chave = self.key_builder.build(key)
+        dados = _json_dumps(dict(data)) if data else None
+        limite = self._limite_validade()
+
+        def _gravar(conn):
+            conn.execute(
+                "INSERT INTO fsm_storage (chave, estado, dados, atualizado_em) VALUES (?, NULL, ?, ?) "
+                "ON CONFLICT (chave) DO UPDATE SET dados = excluded.dados, "
+                "estado = CASE WHEN atualizado_em >= ? THEN estado END, "
+                "atualizado_em = excluded.atualizado_em",
+                (chave, dados, time.time(), limite)
+            )
+            conn.execute("DELETE FROM fsm_storage WHERE chave = ? AND estado IS NULL AND dados IS NULL", (chave,))
+
+        await self.db.run(_gravar)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = await self._ler(key)
+        if not row or not row["dados"]:
+            return {}
+        return json.loads(row["dados"])
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        """
+        Leitura e escrita numa só ida à thread da base (em vez de get + set).
+        """
+        await self._garantir_schema()
+        chave = self.key_builder.build(key)
+        limite = self._limite_validade()
+
+        def _atualizar(conn):
+            row = conn.execute(
+                "SELECT estado, dados FROM fsm_storage WHERE chave = ? AND atualizado_em >= ?",
+                (chave, limite)
+            ).fetchone()
+            atuais = json.loads(row["dados"]) if row and row["dados"] else {}
+            atuais.update(data)
+            conn.execute(
+                "INSERT OR REPLACE INTO fsm_storage (chave, estado, dados, atualizado_em) VALUES (?, ?, ?, ?)",
+                (chave, row["estado"] if row else None, _json_dumps(atuais) if atuais else None, time.time())
+            )
+            return atuais
+
+        atuais = await self.db.run(_atualizar)
+        return atuais.copy()
+
+    async def close(self) -> None:
+        # A ligação é da base local partilhada (fechada em bot.py)
+        pass
+
+
+def create_redis_storage(redis, ttl_segundos: int | None) -> BaseStorage:
+    """
+    Storage do FSM em Redis, sobre um cliente já criado (redis.asyncio.Redis
+    ou outro compatível, ex: um substituto local nos testes).
+    """
+    from aiogram.fsm.storage.redis import RedisStorage
+
+    return RedisStorage(
+        redis,
+        key_builder=DefaultKeyBuilder(prefix="fsm", with_destiny=True),
+        state_ttl=ttl_segundos,
+        data_ttl=ttl_segundos,
+        json_dumps=_json_dumps
+    )
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Cria o storage do FSM escolhido em FSM_STORAGE ("memory", "sqlite" ou "redis").
+    """
+    tipo = settings.FSM_STORAGE.lower()
+    ttl = settings.FSM_TTL_SECONDS or None
+
+    if tipo == "sqlite":
+        return SQLiteStorage(local_db, ttl_segundos=ttl)
+
+    if tipo == "redis":
+        try:
+            # Dependência opcional: pip install redis
+            from redis.asyncio import Redis
+        except ImportError:
+            # Sem fallback: com vários hosts, cada um ficaria com as suas
+            # conversas (o usuário perdia o estado ao mudar de host)
+            logger.critical("FSM: FSM_STORAGE=redis, mas o pacote 'redis' não está instalado.")
+            raise RuntimeError("FSM_STORAGE=redis requer o pacote 'redis' (pip install redis)")
+
+        return create_redis_storage(Redis.from_url(settings.FSM_REDIS_URL), ttl_segundos=ttl)
+
+    return MemoryStorage()
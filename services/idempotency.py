@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+
+def make_idempotency_key(operacao: str, *partes: Any) -> str:
+    """
+    Chave de idempotência de uma operação lógica, derivada do que a
+    identifica do lado do Telegram (ex: usuário + mensagem de confirmação):
+    dois toques no mesmo botão dão a mesma chave.
+    Sem partes, gera uma chave única (só protege as repetições internas).
+    """
+    if not partes:
+        return f"{operacao}:{uuid.uuid4().hex}"
+    return ":".join([operacao, *map(str, partes)])
+
+
+class IdempotentResults:
+    """
+    Resultados recentes das operações com dinheiro (compras, recargas,
+    gift cards), por chave de idempotência:
+
+    - enquanto uma operação está em curso, um pedido repetido com a mesma
+      chave espera por ela (em vez de ir outra vez à API);
+    - depois, o resultado definitivo fica guardado 'ttl_segundos', e um
+      toque repetido recebe o resultado original.
+
+    Resultados indefinidos (ex: API offline) não ficam guardados: uma nova
+    tentativa vai à API com a mesma chave, e é a API que deduplica.
+    """
+    def __init__(self, ttl_segundos: float, max_entradas: int):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max(max_entradas, 1)
+        self._resultados: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._em_curso: dict[str, asyncio.Future] = {}
+        self.repetidos = 0
+
+    async def run(
+        self,
+        chave: str,
+        factory: Callable[[], Awaitable[Any]],
+        definitivo: Callable[[Any], bool]
+    ) -> Any:
+        guardado = self._resultados.get(chave)
+        if guardado is not None:
+            if time.monotonic() - guardado[0] < self.ttl_segundos:
+                self.repetidos += 1
+                return guardado[1]
+            del self._resultados[chave]
+
+        future = self._em_curso.get(chave)
+        if future is not None:
+            self.repetidos += 1
+        else:
+            future = asyncio.ensure_future(factory())
+            self._em_curso[chave] = future
+            future.add_done_callback(functools.partial(self._concluido, chave, definitivo))
+
+        # 'shield': se quem pediu for cancelado, a operação continua (e o resultado fica guardado)
+        return await asyncio.shield(future)
+
+    def _concluido(self, chave: str, definitivo: Callable[[Any], bool], future: asyncio.Future) -> None:
+        if self._em_curso.get(chave) is future:
+            del self._em_curso[chave]
+        if future.cancelled() or future.exception() is not None:
+            return
+        resultado = future.result()
+        if definitivo(resultado):
+            self._resultados[chave] = (time.monotonic(), resultado)
+            while len(self._resultados) > self.max_entradas:
+                self._resultados.popitem(last=False)
@@ -0,0 +1,93 @@
+import contextlib
+import functools
+import time
+from collections.abc import Callable, Hashable
+
+from aiogram import types
+
+from core.config import settings
+from services.metrics import duplicate_callbacks, registry
+
+
+class InFlightRegistry:
+    """
+    Registo das operações em curso por chave (ex: usuário + produto).
+
+    Um clique repetido enquanto a operação está em curso (ou logo a seguir,
+    durante 'cooldown_segundos') é detetado e pode ser respondido sem voltar
+    a chamar a API nem editar mensagens.
+
+    É por processo: com BOT_WORKERS, o mesmo usuário é sempre tratado pelo
+    mesmo worker, por isso os cliques dele passam todos pelo mesmo registo.
+    """
+    def __init__(self, nome: str, cooldown_segundos: float):
+        self.nome = nome
+        self.cooldown_segundos = cooldown_segundos
+        self._em_curso: set[Hashable] = set()
+        self._recentes: dict[Hashable, float] = {}
+
+    def em_curso(self) -> int:
+        return len(self._em_curso)
+
+    def _ocupado(self, chave: Hashable) -> bool:
+        if chave in self._em_curso:
+            return True
+        ate = self._recentes.get(chave)
+        if ate is None:
+            return False
+        if time.monotonic() < ate:
+            return True
+        del self._recentes[chave]
+        return False
+
+    @contextlib.contextmanager
+    def claim(self, chave: Hashable):
+        """
+        'with registo.claim(chave) as livre:' -> livre=False se a mesma
+        operação já estiver em curso (o pedido repetido é contado).
+        """
+        if self._ocupado(chave):
+            duplicate_callbacks.inc(self.nome)
+            yield False
+            return
+
+        self._em_curso.add(chave)
+        try:
+            yield True
+        finally:
+            self._em_curso.discard(chave)
+            if self.cooldown_segundos > 0:
+                agora = time.monotonic()
+                self._recentes[chave] = agora + self.cooldown_segundos
+                if len(self._recentes) > 10_000:
+                    self._recentes = {c: ate for c, ate in self._recentes.items() if ate > agora}
+
+    def guard_callback(
+        self,
+        aviso: str,
+        chave: Callable[[types.CallbackQuery], Hashable] = lambda query: (query.from_user.id, query.data)
+    ):
+        """
+        Decorador para handlers de callback: cliques repetidos no mesmo botão
+        (por omissão, mesmo usuário + mesmo callback_data) enquanto o primeiro
+        está a ser tratado só recebem 'query.answer(aviso)'.
+        """
+        def decorador(handler):
+            @functools.wraps(handler)
+            async def wrapper(query: types.CallbackQuery, *args, **kwargs):
+                with self.claim(chave(query)) as livre:
+                    if not livre:
+                        await query.answer(aviso)
+                        return None
+                    return await handler(query, *args, **kwargs)
+            return wrapper
+        return decorador
+
+
+# Instância única para as confirmações de compra (handlers/purchase.py)
+purchase_inflight = InFlightRegistry("compra", cooldown_segundos=settings.PURCHASE_DEDUP_COOLDOWN_SECONDS)
+
+registry.gauge(
+    "bot_purchases_in_flight", "Compras em curso (cliques de confirmação a ser tratados)", (),
+    lambda: {(): purchase_inflight.em_curso()}
+)
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import settings
+
+
+class LocalDatabase:
+    """
+    Base SQLite local do bot, para o estado que precisa de sobreviver a
+    reinícios (ex: jobs de broadcast).
+
+    Todas as operações correm numa única thread dedicada: não bloqueiam o
+    event loop e o acesso à ligação fica serializado.
+    """
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-db")
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            conn = sqlite3.connect(self.caminho, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # WAL: leitores não bloqueiam o escritor (e vice-versa)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def _run_sync(self, fn, args):
+        conn = self._connect()
+        with conn:  # Uma transação por chamada (commit ou rollback)
+            return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        """
+        Executa 'fn(conn, *args)' na thread da base de dados, numa transação.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_sync, fn, args)
+
+    async def executescript(self, script: str) -> None:
+        await self.run(lambda conn: conn.executescript(script))
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """
+        Executa um comando e devolve o 'lastrowid'.
+        """
+        return await self.run(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def executemany(self, sql: str, linhas) -> None:
+        await self.run(lambda conn: conn.executemany(sql, linhas))
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> sqlite3.Row | None:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def close(self) -> None:
+        def _fechar():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, _fechar)
+
+
+# Instância única da base local, partilhada pelos serviços
+local_db = LocalDatabase(settings.LOCAL_DB_PATH)
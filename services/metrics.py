@@ -0,0 +1,231 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Limites dos buckets de latência (segundos), partilhados por todos os histogramas
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Rotulos = str | tuple[str, ...]
+
+
+def _formatar_rotulos(nomes: tuple[str, ...], valores: Rotulos, extra: str = "") -> str:
+    if isinstance(valores, str):
+        valores = (valores,)
+    pares = [f'{nome}="{_escapar(str(valor))}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Serie:
+    __slots__ = ("contagens", "soma", "total")
+
+    def __init__(self, n_buckets: int):
+        # Um contador por bucket (+ o bucket "+Inf"), alocado uma única vez
+        self.contagens = [0] * (n_buckets + 1)
+        self.soma = 0.0
+        self.total = 0
+
+
+class Histogram:
+    """
+    Histograma com buckets fixos. Cada combinação de rótulos tem a sua
+    série, criada na primeira observação; depois disso, observe() só
+    incrementa contadores (sem alocações).
+    """
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...], buckets: tuple[float, ...] = BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.buckets = buckets
+        self._le = [f'le="{limite}"' for limite in buckets] + ['le="+Inf"']
+        self._series: dict[Rotulos, _Serie] = {}
+
+    def observe(self, rotulos: Rotulos, valor: float) -> None:
+        serie = self._series.get(rotulos)
+        if serie is None:
+            serie = self._series[rotulos] = _Serie(len(self.buckets))
+        serie.contagens[bisect.bisect_left(self.buckets, valor)] += 1
+        serie.soma += valor
+        serie.total += 1
+
+    def render(self) -> list[str]:
+        linhas = []
+        for rotulos, serie in self._series.items():
+            acumulado = 0
+            for le, contagem in zip(self._le, serie.contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, rotulos, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, rotulos)} {serie.soma}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, rotulos)} {serie.total}")
+        return linhas
+
+
+class Counter:
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...]):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._valores: dict[Rotulos, float] = {}
+
+    def inc(self, rotulos: Rotulos, valor: float = 1) -> None:
+        self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def render(self) -> list[str]:
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, r)} {v}" for r, v in self._valores.items()]
+
+
+class Gauge:
+    """
+    Valor lido no momento da recolha: 'ler' devolve {rótulos: valor}
+    (ex: tamanho das filas), por isso não custa nada no caminho quente.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...], ler: Callable[[], dict[Rotulos, float]]):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.ler = ler
+
+    def render(self) -> list[str]:
+        try:
+            valores = self.ler()
+        except Exception as e:
+            logger.warning("Métricas: erro ao ler '%s': %s", self.nome, e)
+            return []
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, r)} {v}" for r, v in valores.items()]
+
+
+class MetricsRegistry:
+    """
+    Conjunto das métricas do processo, exportadas no formato de texto do Prometheus.
+    """
+    def __init__(self):
+        self._metricas: list = []
+
+    def histogram(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = ()) -> Histogram:
+        return self._registar(Histogram(nome, ajuda, rotulos))
+
+    def counter(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = ()) -> Counter:
+        return self._registar(Counter(nome, ajuda, rotulos))
+
+    def gauge(self, nome: str, ajuda: str, rotulos: tuple[str, ...], ler: Callable[[], dict]) -> Gauge:
+        return self._registar(Gauge(nome, ajuda, rotulos, ler))
+
+    def _registar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def render(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.render())
+        return "\n".join(linhas) + "\n"
+
+
+registry = MetricsRegistry()
+
+# --- Métricas partilhadas pelos serviços ---
+
+api_latency = registry.histogram(
+    "bot_api_request_duration_seconds", "Latência dos pedidos à API do backend", ("endpoint",)
+)
+api_errors = registry.counter(
+    "bot_api_request_errors_total", "Pedidos à API do backend com erro", ("endpoint", "tipo")
+)
+telegram_latency = registry.histogram(
+    "bot_telegram_request_duration_seconds", "Latência dos pedidos à Bot API", ("method",)
+)
+telegram_errors = registry.counter(
+    "bot_telegram_request_errors_total", "Pedidos à Bot API com erro", ("method", "erro")
+)
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Tempo de execução dos handlers", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handlers que terminaram com exceção", ("handler",)
+)
+duplicate_callbacks = registry.counter(
+    "bot_duplicate_callbacks_suppressed_total", "Cliques repetidos ignorados enquanto a operação estava em curso",
+    ("operacao",)
+)
+loop_lag = registry.histogram(
+    "bot_event_loop_lag_seconds", "Atraso do event loop (quanto um sleep acorda depois do previsto)"
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Middleware interno (corre só quando um handler foi escolhido): mede a
+    duração e os erros de cada handler, pelo nome da função.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        nome = data["handler"].callback.__name__
+        inicio = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(nome)
+            raise
+        finally:
+            handler_latency.observe(nome, time.perf_counter() - inicio)
+
+
+async def monitor_loop_lag(intervalo: float = 0.5) -> None:
+    """
+    Mede continuamente o atraso do event loop (sinal de trabalho CPU a
+    bloquear o loop).
+    """
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        loop_lag.observe((), max(time.perf_counter() - inicio - intervalo, 0.0))
+
+
+async def start_metrics_server(deslocamento: int = 0) -> web.AppRunner | None:
+    """
+    Serve GET /metrics em METRICS_HOST:METRICS_PORT (METRICS_PORT=0 desativa).
+    Cada worker de sharding usa a porta seguinte ('deslocamento'), porque as
+    métricas são de cada processo.
+    """
+    if not settings.METRICS_PORT:
+        return None
+    porta = settings.METRICS_PORT + deslocamento
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=settings.METRICS_HOST, port=porta).start()
+    logger.info("Métricas disponíveis em http://%s:%s/metrics", settings.METRICS_HOST, porta)
+    return runner
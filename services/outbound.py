@@ -0,0 +1,264 @@
+import asyncio
+import contextlib
+import enum
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from core.config import settings
+from services.metrics import registry, telegram_errors, telegram_latency
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class Lane(enum.IntEnum):
+    """
+    Faixas de prioridade dos envios ao Telegram (menor = mais prioritário).
+    """
+    INTERACTIVE = 0  # Respostas diretas ao usuário (padrão)
+    NORMAL = 1       # Notificações pontuais (ex: avisos ao admin)
+    BULK = 2         # Envios em massa (broadcast, avisos de expiração)
+
+
+_lane_atual: ContextVar[Lane] = ContextVar("outbound_lane", default=Lane.INTERACTIVE)
+
+
+@contextlib.contextmanager
+def outbound_lane(lane: Lane):
+    """
+    Define a faixa de prioridade dos envios feitos dentro do bloco 'with'.
+    (Propaga-se também para as tasks criadas dentro do bloco.)
+    """
+    token = _lane_atual.set(lane)
+    try:
+        yield
+    finally:
+        _lane_atual.reset(token)
+
+
+class OutboundRateLimiter:
+    """
+    Limitador central dos envios ao Telegram.
+
+    - Global: token bucket (~30 msg/s); quem espera é servido por ordem de
+      prioridade (Lane) e, dentro da mesma faixa, por ordem de chegada.
+    - Por chat: GCRA (1 msg/s em privado, 20/min em grupos), com uma pequena
+      rajada permitida para não atrasar respostas interativas.
+    - TelegramRetryAfter: pausa a faixa afetada (e as menos prioritárias).
+    """
+    def __init__(
+        self,
+        taxa_global: float,
+        rajada_global: int,
+        intervalo_privado: float,
+        intervalo_grupo: float,
+        rajada_por_chat: int
+    ):
+        self._taxa = taxa_global
+        self._capacidade = float(rajada_global)
+        self._tokens = float(rajada_global)
+        self._ultimo_refill = time.monotonic()
+
+        self._intervalo_privado = intervalo_privado
+        self._intervalo_grupo = intervalo_grupo
+        self._rajada_por_chat = max(rajada_por_chat, 1)
+        # "Theoretical arrival time" do GCRA, por chat
+        self._tat_por_chat: dict[int | str, float] = {}
+
+        self._pausa_ate = [0.0] * len(Lane)
+        self._fila: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._acordar = asyncio.Event()
+        self._pump_task: asyncio.Task | None = None
+
+    def scale(self, fator: float) -> None:
+        """
+        Reduz a quota global deste processo (ex: quando vários processos
+        partilham o mesmo token do bot).
+        """
+        self._taxa *= fator
+        self._capacidade = max(self._capacidade * fator, 1.0)
+        self._tokens = min(self._tokens, self._capacidade)
+
+    def fila_por_faixa(self) -> dict[str, int]:
+        """
+        Quantos envios estão à espera de vez, por faixa.
+        """
+        contagem = {lane.name: 0 for lane in Lane}
+        for lane, _, future in self._fila:
+            if not future.done():
+                contagem[Lane(lane).name] += 1
+        return contagem
+
+    async def acquire(self, chat_id: int | str | None, lane: Lane, por_chat: bool = True) -> None:
+        """
+        Espera até ser permitido enviar para 'chat_id' na faixa 'lane'.
+        """
+        if por_chat and chat_id is not None:
+            await self._esperar_chat(chat_id)
+        await self._esperar_global(lane)
+
+    def pause(self, segundos: float, lane: Lane) -> None:
+        """
+        Suspende os envios da faixa 'lane' e das menos prioritárias.
+        """
+        ate = time.monotonic() + segundos
+        for faixa in Lane:
+            if faixa >= lane:
+                self._pausa_ate[faixa] = max(self._pausa_ate[faixa], ate)
+        self._acordar.set()
+
+    # --- Limite por chat (GCRA) ---
+
+    async def _esperar_chat(self, chat_id: int | str) -> None:
+        grupo = isinstance(chat_id, str) or chat_id < 0
+        intervalo = self._intervalo_grupo if grupo else self._intervalo_privado
+        tolerancia = intervalo * (self._rajada_por_chat - 1)
+
+        agora = time.monotonic()
+        tat = max(self._tat_por_chat.get(chat_id, agora), agora)
+        espera = tat - tolerancia - agora
+        self._tat_por_chat[chat_id] = tat + intervalo
+
+        if len(self._tat_por_chat) > 10_000:
+            self._limpar_chats(agora)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    def _limpar_chats(self, agora: float) -> None:
+        self._tat_por_chat = {c: t for c, t in self._tat_por_chat.items() if t > agora}
+
+    # --- Limite global (token bucket com prioridade) ---
+
+    def _tentar_token(self, lane: int) -> bool:
+        agora = time.monotonic()
+        if agora < self._pausa_ate[lane]:
+            return False
+        self._tokens = min(self._capacidade, self._tokens + (agora - self._ultimo_refill) * self._taxa)
+        self._ultimo_refill = agora
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def _esperar_global(self, lane: Lane) -> None:
+        # Caminho rápido: ninguém à espera e há token disponível
+        if not self._fila and self._tentar_token(lane):
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._fila, (int(lane), next(self._seq), future))
+        self._acordar.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        """
+        Liberta os envios em espera, um por token, por ordem de prioridade.
+        """
+        while self._fila:
+            lane, _, future = self._fila[0]
+            if future.done():
+                # O chamador desistiu (cancelado)
+                heapq.heappop(self._fila)
+                continue
+
+            if self._tentar_token(lane):
+                heapq.heappop(self._fila)
+                future.set_result(None)
+                continue
+
+            agora = time.monotonic()
+            espera = max(self._pausa_ate[lane] - agora, (1 - self._tokens) / self._taxa)
+            self._acordar.clear()
+            # Acorda mais cedo se chegar um envio novo (talvez mais prioritário)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._acordar.wait(), timeout=max(espera, 0.001))
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """
+    Middleware da sessão do Bot: todos os métodos da Bot API com 'chat_id'
+    passam pelo OutboundRateLimiter, e TelegramRetryAfter é esperado e
+    repetido automaticamente.
+    """
+    # Métodos que efetivamente enviam mensagens (contam para o limite por chat)
+    PREFIXOS_ENVIO = ("send", "copy", "forward")
+
+    def __init__(self, limiter: OutboundRateLimiter, max_retries: int):
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        with tracer.span(f"telegram.{method.__api_method__}") as span:
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is None:
+                return await self._medir(make_request, bot, method)
+
+            lane = _lane_atual.get()
+            por_chat = method.__api_method__.startswith(self.PREFIXOS_ENVIO)
+
+            tentativa = 0
+            while True:
+                inicio_espera = time.perf_counter()
+                await self.limiter.acquire(chat_id, lane, por_chat=por_chat)
+                if span is not None:
+                    # Quanto do tempo do span foi passado à espera do limitador
+                    span.set("espera_limitador_ms", round((time.perf_counter() - inicio_espera) * 1000, 3))
+                try:
+                    return await self._medir(make_request, bot, method)
+                except TelegramRetryAfter as e:
+                    tentativa += 1
+                    if tentativa > self.max_retries:
+                        raise
+                    logger.warning(
+                        "Outbound: flood control em %s (chat %s), a aguardar %ss (tentativa %s/%s)",
+                        method.__api_method__, chat_id, e.retry_after, tentativa, self.max_retries
+                    )
+                    self.limiter.pause(e.retry_after, lane)
+
+    @staticmethod
+    async def _medir(
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # Só o pedido em si (a espera no limitador não conta para a latência)
+        inicio = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_errors.inc((method.__api_method__, type(e).__name__))
+            raise
+        finally:
+            telegram_latency.observe(method.__api_method__, time.perf_counter() - inicio)
+
+
+# Instância única, registada na sessão do Bot em bot.py
+outbound_limiter = OutboundRateLimiter(
+    taxa_global=settings.TELEGRAM_GLOBAL_RATE_PER_SECOND,
+    rajada_global=settings.TELEGRAM_GLOBAL_BURST,
+    intervalo_privado=settings.TELEGRAM_PRIVATE_CHAT_INTERVAL_SECONDS,
+    intervalo_grupo=settings.TELEGRAM_GROUP_CHAT_INTERVAL_SECONDS,
+    rajada_por_chat=settings.TELEGRAM_PER_CHAT_BURST
+)
+
+registry.gauge(
+    "bot_outbound_queue_depth", "Envios à espera do limitador, por faixa", ("lane",),
+    outbound_limiter.fila_por_faixa
+)
@@ -0,0 +1,102 @@
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+
+from aiogram import types
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import qrcode  # Dependência opcional: pip install "qrcode[png]" (ou "qrcode[pil]")
+except ImportError:
+    qrcode = None
+
+
+def _chave(pix_copia_e_cola: str) -> str:
+    return hashlib.sha256(pix_copia_e_cola.encode()).hexdigest()
+
+
+def _render_png(pix_copia_e_cola: str) -> bytes:
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=2)
+    qr.add_data(pix_copia_e_cola)
+    qr.make(fit=True)
+    try:
+        # PNG em Python puro (pypng), sem precisar do Pillow
+        from qrcode.image.pure import PyPNGImage
+        imagem = qr.make_image(image_factory=PyPNGImage)
+    except ImportError:
+        imagem = qr.make_image()
+
+    buffer = io.BytesIO()
+    imagem.save(buffer)
+    return buffer.getvalue()
+
+
+def _decode_data_uri(qr_code_base64: str) -> bytes:
+    # Remove o prefixo "data:image/png;base64," (se existir)
+    image_data = qr_code_base64.split(",", 1)[-1]
+    return base64.b64decode(image_data)
+
+
+class PixQrService:
+    """
+    Prepara a foto do QR Code de um PIX para enviar ao Telegram.
+
+    - Com PIX_QR_LOCAL_RENDER, o QR é gerado localmente a partir do código
+      "copia e cola" (a API deixa de enviar a imagem em base64).
+    - Guarda (LRU) o 'file_id' devolvido pelo Telegram para cada código PIX,
+      por isso reenvios do mesmo PIX não voltam a fazer upload da imagem.
+    """
+    def __init__(self, render_local: bool, max_file_ids: int):
+        self.render_local = render_local and qrcode is not None
+        self.max_file_ids = max(max_file_ids, 1)
+        self._file_ids: OrderedDict[str, str] = OrderedDict()
+
+        if render_local and qrcode is None:
+            logger.warning("PixQr: pacote 'qrcode' não instalado, a usar a imagem enviada pela API.")
+
+    async def get_photo(self, pix_copia_e_cola: str | None, qr_code_base64: str | None) -> str | types.BufferedInputFile:
+        """
+        Devolve o 'file_id' já conhecido deste PIX ou um ficheiro novo para
+        upload. Lança exceção se não houver forma de obter a imagem.
+        """
+        if pix_copia_e_cola:
+            chave = _chave(pix_copia_e_cola)
+            file_id = self._file_ids.get(chave)
+            if file_id is not None:
+                self._file_ids.move_to_end(chave)
+                return file_id
+
+        if self.render_local and pix_copia_e_cola:
+            # Geração do QR é CPU: corre fora do event loop
+            image_bytes = await asyncio.to_thread(_render_png, pix_copia_e_cola)
+        elif qr_code_base64:
+            image_bytes = _decode_data_uri(qr_code_base64)
+        else:
+            raise ValueError("PIX sem QR Code e sem código para o gerar.")
+
+        return types.BufferedInputFile(image_bytes, filename="qrcode.png")
+
+    def remember(self, pix_copia_e_cola: str | None, mensagem: types.Message) -> None:
+        """
+        Guarda o 'file_id' da foto enviada para reutilizar no mesmo PIX.
+        """
+        if not pix_copia_e_cola or not mensagem.photo:
+            return
+        chave = _chave(pix_copia_e_cola)
+        self._file_ids[chave] = mensagem.photo[-1].file_id
+        self._file_ids.move_to_end(chave)
+        while len(self._file_ids) > self.max_file_ids:
+            self._file_ids.popitem(last=False)
+
+
+# Instância única, usada no fluxo da carteira
+pix_qr = PixQrService(
+    render_local=settings.PIX_QR_LOCAL_RENDER,
+    max_file_ids=settings.PIX_QR_FILE_ID_CACHE_SIZE
+)
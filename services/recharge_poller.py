@@ -0,0 +1,235 @@
+import asyncio
+import contextlib
+import logging
+import time
+
+from aiogram import Bot
+
+from core.config import settings
+from services.api_client import api_client
+from services.local_db import local_db
+from services.outbound import Lane, outbound_lane
+from services.supervisor import supervisor
+from services.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS open_recharges (
+    recarga_id TEXT PRIMARY KEY,
+    telegram_id INTEGER NOT NULL,
+    valor REAL NOT NULL,
+    expira_em REAL NOT NULL,
+    proxima_verificacao REAL NOT NULL,
+    verificacoes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_open_recharges_proxima ON open_recharges (proxima_verificacao);
+"""
+
+# Status de pagamento de uma recarga que falhou / expirou sem pagamento
+# (os status de "pago" vêm de RECHARGE_PAID_STATUSES)
+STATUS_FALHOU = "FALHOU"
+
+# Prazo assumido quando a API não indica a expiração do PIX
+EXPIRACAO_PADRAO_MINUTOS = 60
+
+
+class RechargePoller:
+    """
+    Acompanha as recargas PIX em aberto e avisa o usuário assim que o
+    pagamento é confirmado.
+
+    - As recargas ficam na base local (sobrevivem a reinícios).
+    - Um único loop consulta as recargas vencidas em lotes: num só pedido
+      se a API tiver a consulta em lote, senão uma a uma (com limite de
+      consultas em simultâneo).
+    - Cadência adaptativa: as recargas novas são consultadas com frequência
+      (é quando a maioria é paga) e o intervalo cresce até ao máximo.
+    - A recarga deixa de ser acompanhada quando é paga, falha, ou passa o
+      prazo do PIX (o aviso de expiração fica a cargo do scheduler).
+    """
+    FATOR_CRESCIMENTO = 1.5
+
+    def __init__(
+        self,
+        tamanho_lote: int,
+        concorrencia: int,
+        intervalo_min: float,
+        intervalo_max: float,
+        margem_segundos: float,
+        status_pagos: list[str]
+    ):
+        self.tamanho_lote = max(tamanho_lote, 1)
+        self.concorrencia = max(concorrencia, 1)
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = max(intervalo_max, intervalo_min)
+        self.margem_segundos = margem_segundos
+        self.status_pagos = {status.upper() for status in status_pagos}
+        self._status_desconhecidos: set[str] = set()
+
+        self._bot: Bot | None = None
+        self._acordar = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._pronto = False
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            self._pronto = True
+
+    async def start(self, bot: Bot) -> None:
+        await self._garantir_schema()
+        self._bot = bot
+        self._task = supervisor.supervise("recharge_poller", self._loop)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def track(self, recarga_id: str, telegram_id: int, valor: float, expiracao_minutos: int | None) -> None:
+        """
+        Começa a acompanhar uma recarga acabada de criar.
+        """
+        await self._garantir_schema()
+        agora = time.time()
+        expira_em = agora + (expiracao_minutos or EXPIRACAO_PADRAO_MINUTOS) * 60
+        await local_db.execute(
+            "INSERT OR REPLACE INTO open_recharges "
+            "(recarga_id, telegram_id, valor, expira_em, proxima_verificacao) VALUES (?, ?, ?, ?, ?)",
+            (recarga_id, telegram_id, float(valor), expira_em, agora + self.intervalo_min)
+        )
+        self._acordar.set()
+
+    async def em_aberto(self) -> int:
+        await self._garantir_schema()
+        row = await local_db.fetchone("SELECT COUNT(*) AS n FROM open_recharges")
+        return row["n"]
+
+    def _proximo_intervalo(self, verificacoes: int) -> float:
+        return min(self.intervalo_min * self.FATOR_CRESCIMENTO ** verificacoes, self.intervalo_max)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                espera = await self._verificar_vencidas()
+            except Exception as e:
+                logger.warning("Erro no loop de verificação de recargas: %s", e)
+                espera = self.intervalo_max
+
+            # Nunca dorme mais do que o intervalo máximo: apanha também as
+            # recargas registadas por outros processos
+            espera = self.intervalo_max if espera is None else min(espera, self.intervalo_max)
+            self._acordar.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._acordar.wait(), timeout=espera)
+
+    async def _verificar_vencidas(self) -> float | None:
+        """
+        Consulta as recargas cuja verificação venceu, lote a lote, e devolve
+        quanto tempo dormir até à próxima (None = nenhuma em aberto).
+        """
+        while True:
+            rows = await local_db.fetchall(
+                "SELECT * FROM open_recharges WHERE proxima_verificacao <= ? "
+                "ORDER BY proxima_verificacao LIMIT ?",
+                (time.time(), self.tamanho_lote)
+            )
+            if not rows:
+                break
+            await self._verificar_lote(rows)
+
+        proxima = await local_db.fetchone("SELECT MIN(proxima_verificacao) AS t FROM open_recharges")
+        if proxima["t"] is None:
+            return None
+        return max(proxima["t"] - time.time(), 0.0)
+
+    async def _consultar(self, recarga_ids: list[str]) -> dict[str, dict]:
+        """
+        Status das recargas: num só pedido, se a API suportar, senão uma a uma.
+        """
+        status = await api_client.get_recharges_status_bulk(recarga_ids)
+        if status is not None:
+            return status
+
+        semaforo = asyncio.Semaphore(self.concorrencia)
+
+        async def _uma(recarga_id: str) -> dict | None:
+            async with semaforo:
+                return await api_client.get_recharge_status(recarga_id)
+
+        resultados = await asyncio.gather(*(_uma(recarga_id) for recarga_id in recarga_ids))
+        return {recarga_id: r for recarga_id, r in zip(recarga_ids, resultados) if r}
+
+    async def _verificar_lote(self, rows) -> None:
+        status_por_id = await self._consultar([row["recarga_id"] for row in rows])
+        agora = time.time()
+
+        concluidas = []
+        reagendadas = []
+        for row in rows:
+            status_data = status_por_id.get(row["recarga_id"])
+            status_pagamento = str((status_data or {}).get("status_pagamento", "")).upper()
+
+            if status_pagamento in self.status_pagos:
+                # O saldo mudou: a carteira tem de voltar a consultá-lo
+                await user_cache.invalidate(row["telegram_id"])
+                await self._avisar_pagamento(row, status_data)
+                concluidas.append(row["recarga_id"])
+                continue
+            if status_pagamento == STATUS_FALHOU or (status_data or {}).get("expirado"):
+                concluidas.append(row["recarga_id"])
+                continue
+
+            if status_pagamento and status_pagamento not in self._status_desconhecidos:
+                # Nem "pago" nem "falhou" (normalmente pendente): regista uma vez cada
+                # valor, para detetar status da API em falta em RECHARGE_PAID_STATUSES
+                self._status_desconhecidos.add(status_pagamento)
+                logger.info("Recargas: status de pagamento '%s' tratado como pendente.", status_pagamento)
+
+            if agora > row["expira_em"] + self.margem_segundos:
+                # Passou o prazo sem resposta definitiva: desiste
+                concluidas.append(row["recarga_id"])
+            else:
+                intervalo = self._proximo_intervalo(row["verificacoes"])
+                reagendadas.append((agora + intervalo, row["recarga_id"]))
+
+        def _gravar(conn):
+            conn.executemany("DELETE FROM open_recharges WHERE recarga_id = ?", [(r,) for r in concluidas])
+            conn.executemany(
+                "UPDATE open_recharges SET proxima_verificacao = ?, verificacoes = verificacoes + 1 "
+                "WHERE recarga_id = ?",
+                reagendadas
+            )
+
+        await local_db.run(_gravar)
+
+    async def _avisar_pagamento(self, row, status_data: dict) -> None:
+        valor = status_data.get("valor") or row["valor"]
+        try:
+            valor_texto = f"{float(valor):.2f}"
+        except (TypeError, ValueError):
+            valor_texto = str(valor)
+
+        try:
+            with outbound_lane(Lane.NORMAL):
+                await self._bot.send_message(
+                    row["telegram_id"],
+                    f"✅ Pagamento confirmado! **R$ {valor_texto}** foram creditados na sua carteira.\n\n"
+                    "Já pode usar o saldo para comprar em *🛍️ Ver Produtos*."
+                )
+        except Exception as e:
+            logger.warning("Falha ao avisar pagamento da recarga %s: %s", row['recarga_id'], e)
+
+
+# Instância única, iniciada em bot.py
+recharge_poller = RechargePoller(
+    tamanho_lote=settings.RECHARGE_POLL_BATCH_SIZE,
+    concorrencia=settings.RECHARGE_POLL_CONCURRENCY,
+    intervalo_min=settings.RECHARGE_POLL_MIN_INTERVAL_SECONDS,
+    intervalo_max=settings.RECHARGE_POLL_MAX_INTERVAL_SECONDS,
+    margem_segundos=settings.RECHARGE_POLL_GRACE_SECONDS,
+    status_pagos=settings.RECHARGE_PAID_STATUSES
+)
@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from aiogram import Bot
+
+from core.config import settings
+from services.circuit_breaker import backoff_com_jitter
+from services.local_db import local_db
+from services.supervisor import supervisor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    chave TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    executar_em REAL NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_executar_em ON scheduled_jobs (executar_em);
+"""
+
+# Espera máxima do loop: apanha também jobs agendados por outros processos
+# (ex: várias réplicas em modo webhook a partilhar a base local)
+ESPERA_MAXIMA_SEGUNDOS = 30.0
+
+# Função chamada quando um job vence: handler(bot, payload)
+JobHandler = Callable[[Bot, dict], Awaitable[None]]
+
+
+class Scheduler:
+    """
+    Fila de tarefas agendadas persistida na base local (SQLite).
+
+    - Um único loop dorme até ao próximo vencimento (ou até ser acordado por
+      um agendamento mais cedo) e executa os jobs vencidos em lotes, com um
+      limite de jobs em simultâneo.
+    - Os jobs sobrevivem a reinícios: os que venceram com o bot desligado
+      são executados logo no arranque.
+    - Se o handler falhar, o job é reagendado com backoff até
+      'max_tentativas'; depois disso é descartado.
+    """
+    def __init__(self, tamanho_lote: int, concorrencia: int, max_tentativas: int, atraso_retry: float):
+        self.tamanho_lote = max(tamanho_lote, 1)
+        self.concorrencia = max(concorrencia, 1)
+        self.max_tentativas = max(max_tentativas, 1)
+        self.atraso_retry = atraso_retry
+
+        self._handlers: dict[str, JobHandler] = {}
+        self._bot: Bot | None = None
+        self._acordar = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._pronto = False
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            self._pronto = True
+
+    def register(self, tipo: str, handler: JobHandler) -> None:
+        """
+        Associa um tipo de job à função que o executa.
+        """
+        self._handlers[tipo] = handler
+
+    async def start(self, bot: Bot) -> None:
+        await self._garantir_schema()
+        self._bot = bot
+        pendentes = await local_db.fetchone("SELECT COUNT(*) AS n FROM scheduled_jobs")
+        if pendentes["n"]:
+            logger.info("Scheduler: %s job(s) agendado(s) recuperado(s).", pendentes['n'])
+        self._task = supervisor.supervise("scheduler", self._loop)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def schedule(self, tipo: str, atraso_segundos: float, payload: dict, chave: str | None = None) -> None:
+        """
+        Agenda um job para daqui a 'atraso_segundos'. Com 'chave', um novo
+        agendamento substitui o anterior com a mesma chave.
+        """
+        await self._garantir_schema()
+        agora = time.time()
+        await local_db.execute(
+            "INSERT OR REPLACE INTO scheduled_jobs (tipo, chave, payload, executar_em, criado_em) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (tipo, chave, json.dumps(payload, separators=(",", ":")), agora + max(atraso_segundos, 0), agora)
+        )
+        # Pode vencer antes daquilo por que o loop está à espera
+        self._acordar.set()
+
+    async def cancel(self, chave: str) -> None:
+        await self._garantir_schema()
+        await local_db.execute("DELETE FROM scheduled_jobs WHERE chave = ?", (chave,))
+
+    async def pendentes(self) -> int:
+        await self._garantir_schema()
+        row = await local_db.fetchone("SELECT COUNT(*) AS n FROM scheduled_jobs")
+        return row["n"]
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                espera = await self._executar_vencidos()
+            except Exception as e:
+                logger.warning("Erro no loop do scheduler: %s", e)
+                espera = self.atraso_retry
+
+            espera = ESPERA_MAXIMA_SEGUNDOS if espera is None else min(espera, ESPERA_MAXIMA_SEGUNDOS)
+            self._acordar.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._acordar.wait(), timeout=espera)
+
+    async def _executar_vencidos(self) -> float | None:
+        """
+        Executa os lotes de jobs vencidos e devolve quanto tempo dormir até
+        ao próximo (None = fila vazia).
+        """
+        semaforo = asyncio.Semaphore(self.concorrencia)
+        while True:
+            agora = time.time()
+            rows = await local_db.fetchall(
+                "SELECT id, tipo, payload, tentativas FROM scheduled_jobs "
+                "WHERE executar_em <= ? ORDER BY executar_em LIMIT ?",
+                (agora, self.tamanho_lote)
+            )
+            if not rows:
+                break
+            await asyncio.gather(*(self._executar(row, semaforo) for row in rows))
+
+        proximo = await local_db.fetchone("SELECT MIN(executar_em) AS t FROM scheduled_jobs")
+        if proximo["t"] is None:
+            return None
+        return max(proximo["t"] - time.time(), 0.0)
+
+    async def _executar(self, row, semaforo: asyncio.Semaphore) -> None:
+        handler = self._handlers.get(row["tipo"])
+        if handler is None:
+            logger.warning("Scheduler: tipo de job desconhecido '%s', descartado.", row['tipo'])
+            await local_db.execute("DELETE FROM scheduled_jobs WHERE id = ?", (row["id"],))
+            return
+
+        try:
+            async with semaforo:
+                await handler(self._bot, json.loads(row["payload"]))
+        except Exception as e:
+            tentativas = row["tentativas"] + 1
+            if tentativas >= self.max_tentativas:
+                logger.warning("Scheduler: job %s #%s falhou %s vez(es), descartado: %s", row['tipo'], row['id'], tentativas, e)
+                await local_db.execute("DELETE FROM scheduled_jobs WHERE id = ?", (row["id"],))
+                return
+            atraso = self.atraso_retry + backoff_com_jitter(tentativas, self.atraso_retry, self.atraso_retry * 10)
+            logger.warning("Scheduler: job %s #%s falhou (%s), nova tentativa em %.0fs", row['tipo'], row['id'], e, atraso)
+            await local_db.execute(
+                "UPDATE scheduled_jobs SET tentativas = ?, executar_em = ? WHERE id = ?",
+                (tentativas, time.time() + atraso, row["id"])
+            )
+            return
+
+        await local_db.execute("DELETE FROM scheduled_jobs WHERE id = ?", (row["id"],))
+
+
+# Instância única, iniciada em bot.py
+scheduler = Scheduler(
+    tamanho_lote=settings.SCHEDULER_BATCH_SIZE,
+    concorrencia=settings.SCHEDULER_CONCURRENCY,
+    max_tentativas=settings.SCHEDULER_MAX_ATTEMPTS,
+    atraso_retry=settings.SCHEDULER_RETRY_DELAY_SECONDS
+)
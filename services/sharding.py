@@ -0,0 +1,259 @@
+import asyncio
+import collections
+import json
+import logging
+import multiprocessing
+import signal
+import time
+from collections.abc import Callable
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(chave: int, total: int) -> int:
+    """
+    Worker responsável por um usuário (estável: o mesmo usuário vai sempre
+    para o mesmo worker, por isso as suas mensagens são tratadas por ordem).
+    """
+    return chave % total
+
+
+def _chave_do_update(update: Update) -> int:
+    contexto = UserContextMiddleware.resolve_event_context(update)
+    if contexto.user is not None:
+        return contexto.user.id
+    if contexto.chat is not None:
+        return contexto.chat.id
+    return 0
+
+
+class WorkerPool:
+    """
+    Processos worker que tratam os updates (cada um com o seu Bot e
+    Dispatcher). O processo principal só recebe os updates (polling ou
+    webhook) e distribui-os por hash do usuário.
+    """
+    # Intervalo mínimo entre reinícios do mesmo worker (evita um ciclo de
+    # arranques se ele morrer logo ao iniciar)
+    REINICIO_MIN_SEGUNDOS = 5.0
+
+    def __init__(self, total: int, create_bot: Callable[[], Bot], create_dispatcher: Callable[[], Dispatcher]):
+        self.total = max(total, 1)
+        self._create_bot = create_bot
+        self._create_dispatcher = create_dispatcher
+        # 'spawn': cada worker arranca um interpretador limpo (sem herdar o event loop)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._filas: list = []
+        self._processos: list = []
+        self._parando = False
+        self._reiniciado_em: dict[int, float] = {}
+        self.reinicios = 0
+
+    def start(self) -> None:
+        for indice in range(self.total):
+            fila, processo = self._iniciar(indice)
+            self._filas.append(fila)
+            self._processos.append(processo)
+        logger.info("Sharding: %s worker(s) iniciado(s).", self.total)
+
+    def _iniciar(self, indice: int) -> tuple:
+        fila = self._ctx.Queue()
+        processo = self._ctx.Process(
+            target=_worker_main,
+            args=(indice, self.total, fila, self._create_bot, self._create_dispatcher),
+            name=f"bot-worker-{indice}",
+            daemon=True
+        )
+        processo.start()
+        return fila, processo
+
+    def _garantir_vivo(self, indice: int) -> bool:
+        """
+        Reinicia o worker se ele tiver morrido (ex: erro fatal, OOM): sem
+        isto, os updates dos usuários dele ficavam numa fila sem leitor.
+        A fila também é nova (a antiga pode ter ficado bloqueada pelo
+        processo morto); o que estava nela perde-se.
+        Devolve False se o worker continuar morto (reinício adiado).
+        """
+        processo = self._processos[indice]
+        if processo.is_alive():
+            return True
+        if self._parando:
+            return False
+        agora = time.monotonic()
+        if agora - self._reiniciado_em.get(indice, float("-inf")) < self.REINICIO_MIN_SEGUNDOS:
+            logger.error(
+                "Sharding: %s morreu logo após reiniciar; continua morto, novo reinício adiado.",
+                processo.name
+            )
+            return False
+        logger.error(
+            "Sharding: %s morreu (código de saída %s); a reiniciar. Updates em fila perdidos.",
+            processo.name, processo.exitcode
+        )
+        fila_antiga = self._filas[indice]
+        fila_antiga.cancel_join_thread()
+        fila_antiga.close()
+        self._filas[indice], self._processos[indice] = self._iniciar(indice)
+        self._reiniciado_em[indice] = agora
+        self.reinicios += 1
+        return True
+
+    def check_workers(self) -> None:
+        """
+        Verifica todos os workers (chamado periodicamente pelo processo principal).
+        """
+        for indice in range(len(self._processos)):
+            self._garantir_vivo(indice)
+
+    async def monitor(self, intervalo: float) -> None:
+        while True:
+            await asyncio.sleep(intervalo)
+            self.check_workers()
+
+    def dispatch(self, update: Update) -> None:
+        chave = _chave_do_update(update)
+        indice = shard_for(chave, self.total)
+        if not self._garantir_vivo(indice):
+            # Ninguém lê a fila de um worker morto: o update ficaria lá perdido
+            logger.warning(
+                "Sharding: update %s descartado, %s está morto.", update.update_id, self._processos[indice].name
+            )
+            return
+        self._filas[indice].put((chave, update.model_dump_json(by_alias=True, exclude_none=True)))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Pede aos workers para terminar (depois de tratarem o que já receberam).
+        'timeout' é o prazo total: os que ainda estiverem vivos no fim são terminados.
+        """
+        self._parando = True
+        for fila in self._filas:
+            fila.put(None)
+        loop = asyncio.get_running_loop()
+        prazo = time.monotonic() + timeout
+        for processo in self._processos:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            await loop.run_in_executor(None, processo.join, restante)
+        for processo in self._processos:
+            if processo.is_alive():
+                # SIGKILL: os workers ignoram SIGTERM (ver _worker_main)
+                logger.warning("Sharding: %s não terminou a tempo, a forçar.", processo.name)
+                processo.kill()
+                processo.join(1.0)
+
+
+class ShardingDispatcher(Dispatcher):
+    """
+    Dispatcher do processo principal: em vez de tratar os updates,
+    entrega-os ao worker do respetivo usuário.
+    """
+    def __init__(self, pool: WorkerPool, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.pool = pool
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        self.pool.dispatch(update)
+        return None
+
+
+class _FilasPorUsuario:
+    """
+    Trata os updates de usuários diferentes em paralelo, mas os de cada
+    usuário um de cada vez e pela ordem de chegada.
+    """
+    def __init__(self, tratar: Callable[[dict], Any]):
+        self._tratar = tratar
+        self._filas: dict[int, collections.deque] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, chave: int, update: dict) -> None:
+        fila = self._filas.get(chave)
+        if fila is not None:
+            fila.append(update)
+            return
+        self._filas[chave] = collections.deque([update])
+        task = asyncio.create_task(self._drenar(chave))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drenar(self, chave: int) -> None:
+        fila = self._filas[chave]
+        try:
+            while fila:
+                try:
+                    await self._tratar(fila.popleft())
+                except Exception as e:
+                    logger.exception("Sharding: erro ao tratar update do usuário %s: %s", chave, e)
+        finally:
+            del self._filas[chave]
+
+    async def join(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+
+def _worker_main(indice: int, total: int, fila, create_bot, create_dispatcher) -> None:
+    # Ctrl+C e o SIGTERM de systemd / docker stop / k8s chegam a todo o grupo
+    # de processos: os workers ignoram-nos e é o processo principal que pede
+    # o encerramento (WorkerPool.stop), depois de deixar de receber updates
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Processo novo ('spawn'): o logging tem de ser configurado outra vez
+    from core.logging_config import setup_logging
+    setup_logging()
+    asyncio.run(_worker_loop(indice, total, fila, create_bot, create_dispatcher))
+
+
+async def _worker_loop(indice: int, total: int, fila, create_bot, create_dispatcher) -> None:
+    # Imports locais: só são precisos dentro do processo worker
+    from core.config import settings
+    from services.api_client import api_client
+    from services.broadcast import broadcast_engine
+    from services.local_db import local_db
+    from services.metrics import start_metrics_server
+    from services.outbound import outbound_limiter
+    from services.suppression import suppression_list
+    from services.tracing import tracer
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    # Os workers repartem entre si a parte da quota global da Bot API
+    # reservada às respostas interativas (ver BOT_WORKERS_RATE_SHARE)
+    outbound_limiter.scale(settings.BOT_WORKERS_RATE_SHARE / total)
+
+    await api_client.start()
+    metrics_runner = await start_metrics_server(deslocamento=indice + 1)
+    await tracer.start()
+    await suppression_list.load()
+    # Os jobs de broadcast pedidos pelo admin correm no processo principal
+    await broadcast_engine.start(bot, retomar=False, remoto=True)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    filas = _FilasPorUsuario(lambda update: dp.feed_raw_update(bot, update))
+    loop = asyncio.get_running_loop()
+    logger.info("Sharding: worker %s pronto.", indice)
+    try:
+        while True:
+            item = await loop.run_in_executor(None, fila.get)
+            if item is None:
+                break
+            chave, update_json = item
+            filas.submit(chave, json.loads(update_json))
+        await filas.join()
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await broadcast_engine.stop()
+        await tracer.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await api_client.close()
+        await local_db.close()
+        await bot.session.close()
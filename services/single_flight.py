@@ -0,0 +1,67 @@
+import asyncio
+import functools
+from collections import defaultdict
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes idênticas ("single-flight"): enquanto uma
+    chamada com a mesma chave está em curso, as restantes esperam pelo mesmo
+    resultado em vez de dispararem um novo pedido à API.
+    """
+    def __init__(self):
+        self._em_curso: dict[tuple, asyncio.Future] = {}
+        # Contadores por nome de operação
+        self.chamadas: dict[str, int] = defaultdict(int)
+        self.agrupadas: dict[str, int] = defaultdict(int)
+
+    async def do(self, key: tuple, factory):
+        """
+        Executa 'factory()' uma única vez por chave em curso.
+        key[0] deve ser o nome da operação (usado nos contadores).
+        """
+        nome = key[0]
+        self.chamadas[nome] += 1
+
+        future = self._em_curso.get(key)
+        if future is not None:
+            self.agrupadas[nome] += 1
+        else:
+            future = asyncio.ensure_future(factory())
+            self._em_curso[key] = future
+            future.add_done_callback(functools.partial(self._concluido, key))
+
+        # 'shield': se um dos chamadores for cancelado, os outros continuam à espera
+        return await asyncio.shield(future)
+
+    def _concluido(self, key: tuple, future: asyncio.Future) -> None:
+        if self._em_curso.get(key) is future:
+            del self._em_curso[key]
+        # Evita o aviso "exception was never retrieved" se todos desistiram
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Devolve, por operação, o total de chamadas e quantas foram agrupadas.
+        """
+        return {
+            nome: {"chamadas": total, "agrupadas": self.agrupadas.get(nome, 0)}
+            for nome, total in self.chamadas.items()
+        }
+
+
+def coalesced(method):
+    """
+    Decorador para métodos de leitura do APIClient: chamadas concorrentes com
+    os mesmos argumentos partilham o mesmo pedido em curso.
+    A instância precisa de ter um atributo '_single_flight' (SingleFlight).
+    """
+    nome = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        key = (nome, args, tuple(sorted(kwargs.items())))
+        return await self._single_flight.do(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import contextlib
+import functools
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.config import settings
+from services.circuit_breaker import backoff_com_jitter
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Uma execução que durou mais do que isto conta como saudável (o backoff recomeça)
+EXECUCAO_SAUDAVEL_SEGUNDOS = 60.0
+
+
+class TaskSupervisor:
+    """
+    Registo central das tarefas em segundo plano do bot.
+
+    - supervise(): loops de longa duração (notificador, scheduler, ...),
+      reiniciados com backoff se terminarem com erro.
+    - spawn(): tarefas avulsas ("fire-and-forget"); os erros são registados
+      em vez de se perderem em silêncio.
+    - critical(): secções que não devem ser interrompidas a meio (ex: o
+      tratamento de um update com uma compra); no encerramento, drain()
+      espera que terminem até um prazo.
+    """
+    def __init__(self, backoff_base: float, backoff_max: float):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._supervisionadas: dict[str, asyncio.Task] = {}
+        self._avulsas: set[asyncio.Task] = set()
+        self._falhas: collections.Counter = collections.Counter()
+        self._reinicios: collections.Counter = collections.Counter()
+
+        self._criticas = 0
+        self._sem_criticas = asyncio.Event()
+        self._sem_criticas.set()
+        self.encerrando = False
+
+    # --- Loops supervisionados ---
+
+    def supervise(self, nome: str, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """
+        Corre 'factory()' numa task; se terminar com exceção, regista o erro e
+        volta a chamá-la após um backoff. Devolve a task (cancelar = parar).
+        """
+        task = asyncio.create_task(self._manter(nome, factory), name=nome)
+        self._supervisionadas[nome] = task
+        task.add_done_callback(functools.partial(self._ao_parar, nome))
+        return task
+
+    def _ao_parar(self, nome: str, task: asyncio.Task) -> None:
+        if self._supervisionadas.get(nome) is task:
+            del self._supervisionadas[nome]
+
+    async def _manter(self, nome: str, factory: Callable[[], Awaitable[Any]]) -> None:
+        tentativa = 0
+        while True:
+            inicio = time.monotonic()
+            try:
+                await factory()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._falhas[nome] += 1
+                if time.monotonic() - inicio > EXECUCAO_SAUDAVEL_SEGUNDOS:
+                    tentativa = 0
+                tentativa += 1
+                atraso = self.backoff_base + backoff_com_jitter(tentativa, self.backoff_base, self.backoff_max)
+                logger.warning("Supervisor: '%s' terminou com erro (%r), a reiniciar em %.1fs", nome, e, atraso)
+                await asyncio.sleep(atraso)
+                self._reinicios[nome] += 1
+
+    # --- Tarefas avulsas ---
+
+    def spawn(self, nome: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """
+        Cria uma task avulsa acompanhada pelo supervisor.
+        """
+        task = asyncio.create_task(coro, name=nome)
+        self._avulsas.add(task)
+        task.add_done_callback(self._ao_terminar)
+        return task
+
+    def _ao_terminar(self, task: asyncio.Task) -> None:
+        self._avulsas.discard(task)
+        if task.cancelled():
+            return
+        erro = task.exception()
+        if erro is not None:
+            self._falhas[task.get_name()] += 1
+            logger.warning("Supervisor: task '%s' falhou: %r", task.get_name(), erro)
+
+    # --- Secções críticas e encerramento ---
+
+    @contextlib.asynccontextmanager
+    async def critical(self):
+        """
+        Marca uma secção que o encerramento deve deixar terminar.
+        """
+        self._criticas += 1
+        self._sem_criticas.clear()
+        try:
+            yield
+        finally:
+            self._criticas -= 1
+            if self._criticas == 0:
+                self._sem_criticas.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Espera (até 'timeout' segundos) que as secções críticas em curso
+        terminem. Devolve False se o prazo acabou antes.
+        """
+        self.encerrando = True
+        if self._criticas:
+            logger.info("Supervisor: a aguardar %s operação(ões) em curso (até %.0fs)...", self._criticas, timeout)
+        try:
+            await asyncio.wait_for(self._sem_criticas.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("Supervisor: prazo esgotado com %s operação(ões) ainda em curso.", self._criticas)
+            return False
+
+    async def shutdown(self) -> None:
+        """
+        Cancela todas as tasks que ainda estejam a correr.
+        """
+        tarefas = [*self._supervisionadas.values(), *self._avulsas]
+        for task in tarefas:
+            task.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "supervisionadas": sorted(self._supervisionadas),
+            "avulsas": len(self._avulsas),
+            "criticas": self._criticas,
+            "falhas": dict(self._falhas),
+            "reinicios": dict(self._reinicios),
+        }
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Middleware do Dispatcher: cada update em tratamento é uma secção crítica,
+    por isso o encerramento espera que compras/recargas a meio terminem.
+    """
+    def __init__(self, supervisor: TaskSupervisor):
+        self.supervisor = supervisor
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self.supervisor.critical():
+            return await handler(event, data)
+
+
+# Instância única, usada por bot.py e pelos serviços com tarefas de fundo
+supervisor = TaskSupervisor(
+    backoff_base=settings.SUPERVISOR_RESTART_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.SUPERVISOR_RESTART_BACKOFF_MAX_SECONDS
+)
+
+registry.gauge(
+    "bot_updates_in_flight", "Updates (secções críticas) em tratamento", (),
+    lambda: {(): supervisor.stats()["criticas"]}
+)
+registry.gauge(
+    "bot_background_task_failures", "Falhas acumuladas de cada tarefa em segundo plano", ("task",),
+    lambda: supervisor.stats()["falhas"]
+)
@@ -0,0 +1,162 @@
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from aiogram.types import TelegramObject, Update
+
+from core.config import settings
+from services.api_client import api_client
+from services.local_db import local_db
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppressed_users (
+    telegram_id INTEGER PRIMARY KEY,
+    motivo TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    reportado INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def classify_send_error(erro: Exception) -> str | None:
+    """
+    Indica se um erro de envio significa que o chat está "morto".
+    Devolve o motivo ('blocked', 'deactivated', 'kicked', 'chat_not_found')
+    ou None se o erro for transitório / não relacionado com o destinatário.
+    """
+    mensagem = str(erro).lower()
+
+    if isinstance(erro, TelegramForbiddenError):
+        if "blocked" in mensagem:
+            return "blocked"
+        if "deactivated" in mensagem:
+            return "deactivated"
+        if "kicked" in mensagem:
+            return "kicked"
+        return "forbidden"
+
+    if isinstance(erro, (TelegramBadRequest, TelegramNotFound)):
+        if "chat not found" in mensagem or "user not found" in mensagem:
+            return "chat_not_found"
+
+    return None
+
+
+class SuppressionList:
+    """
+    Lista local (persistida) de usuários que bloquearam o bot ou cujo chat
+    já não existe. É usada para filtrar os destinatários de broadcasts e
+    avisos, poupando tempo e quota da Bot API.
+    """
+    def __init__(self):
+        self._ids: set[int] = set()
+        self._pronto = False
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            self._pronto = True
+
+    async def load(self) -> None:
+        """
+        Carrega a lista da base local para memória (chamado no arranque).
+        """
+        await self._garantir_schema()
+        rows = await local_db.fetchall("SELECT telegram_id FROM suppressed_users")
+        self._ids = {row["telegram_id"] for row in rows}
+        logger.info("Suppression: %s usuário(s) inativo(s) carregado(s).", len(self._ids))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def is_suppressed(self, telegram_id: int) -> bool:
+        return telegram_id in self._ids
+
+    def filter(self, telegram_ids: list[int]) -> list[int]:
+        """
+        Remove da lista os usuários suprimidos.
+        """
+        return [telegram_id for telegram_id in telegram_ids if telegram_id not in self._ids]
+
+    async def add(self, telegram_id: int, motivo: str) -> None:
+        if telegram_id in self._ids:
+            return
+        self._ids.add(telegram_id)
+        await self._garantir_schema()
+        await local_db.execute(
+            "INSERT OR IGNORE INTO suppressed_users (telegram_id, motivo, criado_em) VALUES (?, ?, ?)",
+            (telegram_id, motivo, time.time())
+        )
+
+    async def discard(self, telegram_id: int) -> None:
+        """
+        Remove um usuário da lista (ex: voltou a falar com o bot).
+        """
+        if telegram_id not in self._ids:
+            return
+        self._ids.discard(telegram_id)
+        await self._garantir_schema()
+        await local_db.execute("DELETE FROM suppressed_users WHERE telegram_id = ?", (telegram_id,))
+
+    async def record_failure(self, telegram_id: int, erro: Exception) -> str | None:
+        """
+        Classifica um erro de envio e, se o chat estiver morto, suprime o usuário.
+        Devolve o motivo (ou None se o erro não for definitivo).
+        """
+        motivo = classify_send_error(erro)
+        if motivo is not None:
+            await self.add(telegram_id, motivo)
+        return motivo
+
+    async def report_to_backend(self) -> None:
+        """
+        Envia à API os usuários suprimidos ainda não reportados
+        (apenas se SUPPRESSION_REPORT_TO_BACKEND estiver ativo).
+        """
+        if not settings.SUPPRESSION_REPORT_TO_BACKEND:
+            return
+
+        await self._garantir_schema()
+        rows = await local_db.fetchall(
+            "SELECT telegram_id, motivo FROM suppressed_users WHERE reportado = 0 LIMIT 1000"
+        )
+        if not rows:
+            return
+
+        usuarios = [{"telegram_id": row["telegram_id"], "motivo": row["motivo"]} for row in rows]
+        if await api_client.report_inactive_users(usuarios):
+            await local_db.executemany(
+                "UPDATE suppressed_users SET reportado = 1 WHERE telegram_id = ?",
+                [(row["telegram_id"],) for row in rows]
+            )
+
+
+class SuppressionMiddleware(BaseMiddleware):
+    """
+    Middleware externo do Dispatcher: qualquer update de um usuário (mensagem,
+    clique num botão, ...) mostra que o chat voltou a estar ativo, por isso
+    ele sai da lista de inativos. Os avisos de bloqueio/desbloqueio do bot
+    (my_chat_member) são tratados pelos handlers em handlers/common.py.
+    """
+    def __init__(self, lista: SuppressionList):
+        self.lista = lista
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        usuario = data.get("event_from_user")
+        if usuario is not None and isinstance(event, Update) and event.my_chat_member is None:
+            await self.lista.discard(usuario.id)
+        return await handler(event, data)
+
+
+# Instância única, carregada no arranque do bot
+suppression_list = SuppressionList()
@@ -0,0 +1,288 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from typing import Any
+
+import httpx
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.config import settings
+from services.supervisor import supervisor
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    Um intervalo de tempo medido dentro de um trace (ex: o tratamento de um
+    update, um pedido à API, um envio ao Telegram).
+    """
+    __slots__ = ("trace_id", "span_id", "parent_id", "nome", "inicio_ns", "fim_ns", "atributos", "erro")
+
+    def __init__(self, trace_id: str, parent_id: str | None, nome: str, atributos: dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.nome = nome
+        self.inicio_ns = time.time_ns()
+        self.fim_ns = 0
+        self.atributos = atributos
+        self.erro: str | None = None
+
+    def set(self, chave: str, valor: Any) -> None:
+        self.atributos[chave] = valor
+
+    @property
+    def traceparent(self) -> str:
+        # Formato W3C Trace Context (versão 00, amostrado)
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.nome,
+            "start_ns": self.inicio_ns,
+            "duration_ms": round((self.fim_ns - self.inicio_ns) / 1e6, 3),
+            "attributes": self.atributos,
+            "error": self.erro,
+        }
+
+
+_span_atual: ContextVar[Span | None] = ContextVar("tracing_span", default=None)
+
+
+class JsonlExporter:
+    """
+    Acrescenta os spans a um ficheiro local, um objeto JSON por linha.
+    """
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+
+    def _escrever(self, linhas: str) -> None:
+        # Uma única escrita por lote (os workers de sharding partilham o ficheiro)
+        with open(self.caminho, "a", encoding="utf-8") as f:
+            f.write(linhas)
+
+    async def export(self, spans: list[Span]) -> None:
+        linhas = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        await asyncio.to_thread(self._escrever, linhas)
+
+
+class OtlpHttpExporter:
+    """
+    Envia os spans para um coletor OpenTelemetry (OTLP/HTTP, em JSON).
+    """
+    def __init__(self, url: str, servico: str):
+        self.url = url
+        self.servico = servico
+
+    @staticmethod
+    def _atributo(chave: str, valor: Any) -> dict:
+        if isinstance(valor, bool):
+            return {"key": chave, "value": {"boolValue": valor}}
+        if isinstance(valor, int):
+            return {"key": chave, "value": {"intValue": str(valor)}}
+        if isinstance(valor, float):
+            return {"key": chave, "value": {"doubleValue": valor}}
+        return {"key": chave, "value": {"stringValue": str(valor)}}
+
+    def _converter(self, span: Span) -> dict:
+        convertido = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.nome,
+            "kind": 1,
+            "startTimeUnixNano": str(span.inicio_ns),
+            "endTimeUnixNano": str(span.fim_ns),
+            "attributes": [self._atributo(k, v) for k, v in span.atributos.items()],
+            "status": {"code": 2, "message": span.erro} if span.erro else {},
+        }
+        if span.parent_id:
+            convertido["parentSpanId"] = span.parent_id
+        return convertido
+
+    async def export(self, spans: list[Span]) -> None:
+        corpo = {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._atributo("service.name", self.servico)]},
+                "scopeSpans": [{
+                    "scope": {"name": "bot.tracing"},
+                    "spans": [self._converter(span) for span in spans],
+                }],
+            }]
+        }
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(self.url, json=corpo)
+            response.raise_for_status()
+
+
+class Tracer:
+    """
+    Traces por update: um span raiz por update (TracingMiddleware) e spans
+    filhos para cada pedido à API e à Bot API feitos durante o tratamento.
+
+    - Só uma fração dos updates é amostrada ('taxa_amostragem'); nos
+      restantes não há span atual e span() não faz nada.
+    - Os spans terminados ficam num buffer e são exportados em lote,
+      numa tarefa em segundo plano.
+    """
+    def __init__(self, taxa_amostragem: float, exportador, intervalo_segundos: float, max_buffer: int):
+        self.taxa_amostragem = taxa_amostragem
+        self.exportador = exportador
+        self.intervalo_segundos = intervalo_segundos
+        self.max_buffer = max_buffer
+
+        self._buffer: list[Span] = []
+        self._descartados = 0
+        self._export_task: asyncio.Task | None = None
+
+    @property
+    def ativo(self) -> bool:
+        return self.taxa_amostragem > 0
+
+    @contextlib.contextmanager
+    def trace(self, nome: str, **atributos: Any):
+        """
+        Abre o span raiz de um trace novo (se este for amostrado).
+        """
+        if not self.ativo or random.random() >= self.taxa_amostragem:
+            yield None
+            return
+        span = Span(f"{random.getrandbits(128):032x}", None, nome, atributos)
+        with self._ativar(span):
+            yield span
+
+    @contextlib.contextmanager
+    def span(self, nome: str, **atributos: Any):
+        """
+        Abre um span filho do span atual (nada a fazer fora de um trace amostrado).
+        """
+        pai = _span_atual.get()
+        if pai is None:
+            yield None
+            return
+        span = Span(pai.trace_id, pai.span_id, nome, atributos)
+        with self._ativar(span):
+            yield span
+
+    @contextlib.contextmanager
+    def _ativar(self, span: Span):
+        token = _span_atual.set(span)
+        try:
+            yield
+        except BaseException as e:
+            span.erro = type(e).__name__
+            raise
+        finally:
+            _span_atual.reset(token)
+            span.fim_ns = time.time_ns()
+            self._registar(span)
+
+    def _registar(self, span: Span) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            # O exportador não está a acompanhar: perde-se o span em vez de crescer sem limite
+            self._descartados += 1
+            return
+        self._buffer.append(span)
+
+    def current(self) -> Span | None:
+        return _span_atual.get()
+
+    def traceparent(self) -> str | None:
+        """
+        Cabeçalho 'traceparent' do span atual (para propagar o trace ao backend).
+        """
+        span = _span_atual.get()
+        return span.traceparent if span is not None else None
+
+    async def start(self) -> None:
+        if self.ativo:
+            self._export_task = supervisor.supervise("tracing_export", self._exportar_periodico)
+
+    async def stop(self) -> None:
+        if self._export_task is not None:
+            self._export_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._export_task
+            self._export_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        try:
+            await self.exportador.export(spans)
+        except Exception as e:
+            logger.warning("Tracing: erro ao exportar %s span(s): %s", len(spans), e)
+        if self._descartados:
+            logger.warning("Tracing: %s span(s) descartado(s) (buffer cheio).", self._descartados)
+            self._descartados = 0
+
+    async def _exportar_periodico(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo_segundos)
+            await self.flush()
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Middleware externo do Dispatcher: um trace por update.
+    """
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with self.tracer.trace(f"update.{event.event_type}", update_id=event.update_id, pid=os.getpid()) as span:
+            if span is not None:
+                usuario = data.get("event_from_user")
+                if usuario is not None:
+                    span.set("user_id", usuario.id)
+            return await handler(event, data)
+
+
+class HandlerSpanMiddleware(BaseMiddleware):
+    """
+    Middleware interno: um span com o nome do handler escolhido, para
+    separar o tempo do handler do tempo dos filtros e middlewares.
+    """
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with self.tracer.span(f"handler.{data['handler'].callback.__name__}"):
+            return await handler(event, data)
+
+
+def _criar_exportador():
+    if settings.TRACING_EXPORTER.lower() == "otlp":
+        return OtlpHttpExporter(settings.TRACING_OTLP_URL, servico=settings.TRACING_SERVICE_NAME)
+    return JsonlExporter(settings.TRACING_FILE_PATH)
+
+
+# Instância única, usada pelos middlewares, pelo APIClient e pelo OutboundMiddleware
+tracer = Tracer(
+    taxa_amostragem=settings.TRACING_SAMPLE_RATE,
+    exportador=_criar_exportador(),
+    intervalo_segundos=settings.TRACING_FLUSH_SECONDS,
+    max_buffer=settings.TRACING_MAX_BUFFERED_SPANS
+)
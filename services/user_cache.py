@@ -0,0 +1,161 @@
+import time
+from collections import OrderedDict
+
+from core.config import settings
+from services.api_client import api_client
+from services.local_db import local_db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_cache_invalidations (
+    telegram_id INTEGER PRIMARY KEY,
+    invalidado_em REAL NOT NULL
+);
+"""
+
+# Campos do perfil devolvido por POST /usuarios/register que guardamos
+CAMPOS_PERFIL = ("saldo_carteira", "pending_cashback_percent")
+
+# Intervalo mínimo (segundos) entre leituras das invalidações feitas por
+# outros processos (é também o atraso máximo até serem aplicadas aqui)
+INTERVALO_SINCRONIZACAO_SEGUNDOS = 1.0
+# Sobreposição entre leituras: apanha invalidações gravadas com um
+# instante ligeiramente anterior ao da última leitura
+MARGEM_SINCRONIZACAO_SEGUNDOS = 5.0
+
+
+class UserProfileCache:
+    """
+    Cache dos usuários já registados na API (LRU limitado, com TTL), com o
+    último saldo conhecido: /start e a carteira de um usuário que volta
+    não precisam de chamar POST /usuarios/register (uma escrita) de novo.
+
+    - Compras e resgates de gift card atualizam o saldo com o valor
+      devolvido pela API (ou invalidam a entrada, se não o devolverem).
+    - Recargas pagas invalidam a entrada. Como o aviso de pagamento pode
+      correr noutro processo (ex: com BOT_WORKERS), as invalidações também
+      ficam na base local; cada processo lê as novas no máximo uma vez
+      por INTERVALO_SINCRONIZACAO_SEGUNDOS (não em cada acesso).
+    """
+    def __init__(self, max_entradas: int, ttl_segundos: float):
+        self.max_entradas = max(max_entradas, 1)
+        self.ttl_segundos = ttl_segundos
+
+        # telegram_id -> (guardado_em, perfil)
+        self._perfis: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+        self._pronto = False
+        # Invalidações da base já aplicadas (até este instante) e próxima leitura
+        self._sincronizado_ate = time.time()
+        self._proxima_sincronizacao = 0.0
+
+    async def _garantir_schema(self) -> None:
+        if not self._pronto:
+            await local_db.executescript(SCHEMA)
+            self._pronto = True
+
+    async def get(self, telegram_id: int) -> dict | None:
+        """
+        Perfil em cache do usuário (None se não houver, expirou ou foi invalidado).
+        """
+        if telegram_id not in self._perfis:
+            return None
+        await self._sincronizar()
+
+        entrada = self._perfis.get(telegram_id)
+        if entrada is None:
+            return None
+        guardado_em, perfil = entrada
+        if time.time() - guardado_em >= self.ttl_segundos:
+            self._perfis.pop(telegram_id, None)
+            return None
+
+        self._perfis.move_to_end(telegram_id)
+        return perfil
+
+    async def get_or_register(self, telegram_id: int, nome_completo: str) -> dict | None:
+        """
+        Perfil do usuário: da cache, ou registando-o na API (e guardando o resultado).
+        """
+        perfil = await self.get(telegram_id)
+        if perfil is not None:
+            return perfil
+        return await self.register(telegram_id, nome_completo)
+
+    async def register(self, telegram_id: int, nome_completo: str, referrer_id: int | None = None) -> dict | None:
+        """
+        Chama POST /usuarios/register e guarda o perfil devolvido.
+        """
+        usuario_api = await api_client.register_user(
+            telegram_id=telegram_id,
+            nome_completo=nome_completo,
+            referrer_id=referrer_id
+        )
+        if usuario_api is not None:
+            self._guardar(telegram_id, {campo: usuario_api[campo] for campo in CAMPOS_PERFIL if campo in usuario_api})
+        return usuario_api
+
+    def update_balance(self, telegram_id: int, novo_saldo) -> None:
+        """
+        Aplica o saldo devolvido por uma compra ou resgate. Sem saldo na
+        resposta, a entrada é descartada (o próximo acesso vai à API).
+        """
+        entrada = self._perfis.get(telegram_id)
+        if entrada is None:
+            return
+        if novo_saldo is None:
+            self._perfis.pop(telegram_id, None)
+            return
+        self._guardar(telegram_id, {**entrada[1], "saldo_carteira": novo_saldo})
+
+    async def invalidate(self, telegram_id: int) -> None:
+        """
+        Descarta o perfil do usuário, neste e nos outros processos do host.
+        """
+        self._perfis.pop(telegram_id, None)
+        await self._garantir_schema()
+        await local_db.execute(
+            "INSERT OR REPLACE INTO user_cache_invalidations (telegram_id, invalidado_em) VALUES (?, ?)",
+            (telegram_id, time.time())
+        )
+
+    def _guardar(self, telegram_id: int, perfil: dict) -> None:
+        self._perfis[telegram_id] = (time.time(), perfil)
+        self._perfis.move_to_end(telegram_id)
+        while len(self._perfis) > self.max_entradas:
+            self._perfis.popitem(last=False)
+
+    async def _sincronizar(self) -> None:
+        """
+        Aplica as invalidações gravadas por outros processos desde a última
+        leitura (uma consulta à base, no máximo uma vez por intervalo).
+        """
+        agora = time.monotonic()
+        if agora < self._proxima_sincronizacao:
+            return
+        self._proxima_sincronizacao = agora + INTERVALO_SINCRONIZACAO_SEGUNDOS
+
+        await self._garantir_schema()
+        rows = await local_db.fetchall(
+            "SELECT telegram_id, invalidado_em FROM user_cache_invalidations WHERE invalidado_em > ?",
+            (self._sincronizado_ate - MARGEM_SINCRONIZACAO_SEGUNDOS,)
+        )
+        for row in rows:
+            entrada = self._perfis.get(row["telegram_id"])
+            if entrada is not None and row["invalidado_em"] >= entrada[0]:
+                self._perfis.pop(row["telegram_id"], None)
+            self._sincronizado_ate = max(self._sincronizado_ate, row["invalidado_em"])
+
+    async def purge(self) -> None:
+        """
+        Apaga as invalidações mais antigas do que o TTL (já não afetam nenhuma entrada).
+        """
+        await self._garantir_schema()
+        await local_db.execute(
+            "DELETE FROM user_cache_invalidations WHERE invalidado_em < ?", (time.time() - self.ttl_segundos,)
+        )
+
+
+# Instância única, usada pelos handlers de /start, carteira, compras e gift cards
+user_cache = UserProfileCache(
+    max_entradas=settings.USER_CACHE_MAX_ENTRIES,
+    ttl_segundos=settings.USER_CACHE_TTL_SECONDS
+)
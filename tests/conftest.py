@@ -0,0 +1,152 @@
+"""
+Configuração comum dos testes.
+
+As variáveis de ambiente obrigatórias do Settings são definidas antes de
+importar qualquer módulo do bot, e a base local fica numa pasta temporária.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:ABCdefGhIJKlmNoPQRsTUVwxyZ123456789")
+os.environ.setdefault("API_KEY", "teste")
+os.environ.setdefault("API_BASE_URL", "http://api.test/api/v1")
+os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "bot.sqlite3"))
+os.environ.setdefault("TRACING_SAMPLE_RATE", "0")
+os.environ.setdefault("METRICS_PORT", "0")
+
+
+class FakeUserIdsApi:
+    """
+    Substituto local da API para GET /usuarios/ids (paginado por cursor) e
+    GET /usuarios/all-ids, servido por um httpx.MockTransport.
+    """
+    def __init__(self, ids: list[int], paginado: bool = True):
+        self.ids = ids
+        self.paginado = paginado
+        self.pedidos: list[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.pedidos.append(request)
+        if request.url.path.endswith("/usuarios/all-ids"):
+            return httpx.Response(200, json=self.ids)
+        if request.url.path.endswith("/usuarios/ids"):
+            if not self.paginado:
+                return httpx.Response(404, json={"detail": "Not Found"})
+            limite = int(request.url.params["limite"])
+            inicio = int(request.url.params.get("cursor", 0))
+            fim = inicio + limite
+            return httpx.Response(200, json={
+                "ids": self.ids[inicio:fim],
+                "next_cursor": fim if fim < len(self.ids) else None,
+            })
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def fake_user_ids_api():
+    """
+    Liga o api_client a um FakeUserIdsApi (lista de 25 IDs) durante o teste.
+    """
+    from services.api_client import api_client
+
+    api = FakeUserIdsApi(list(range(1, 26)))
+    anterior = api_client._client
+    api_client._client = httpx.AsyncClient(transport=httpx.MockTransport(api.handler))
+    try:
+        yield api
+    finally:
+        api_client._client = anterior
+
+
+class FakeRechargesApi:
+    """
+    Substituto local da API para a consulta de recargas: POST /recargas/status
+    (em lote) e GET /recargas/{id}. Com 'status_lote' (ex: 404 ou 405), a
+    consulta em lote responde com esse código, como uma API sem o endpoint.
+    """
+    def __init__(self, status: dict[str, dict], status_lote: int | None = None):
+        self.status = status
+        self.status_lote = status_lote
+        self.pedidos: list[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.pedidos.append(request)
+        caminho = request.url.path
+        if request.method == "POST" and caminho.endswith("/recargas/status"):
+            if self.status_lote is not None:
+                return httpx.Response(self.status_lote, json={"detail": "Not Found"})
+            ids = json.loads(request.content)["recarga_ids"]
+            return httpx.Response(200, json=[
+                {"recarga_id": recarga_id, **self.status[recarga_id]} for recarga_id in ids if recarga_id in self.status
+            ])
+        if request.method == "GET" and "/recargas/" in caminho:
+            recarga_id = caminho.rsplit("/", 1)[-1]
+            if recarga_id not in self.status:
+                return httpx.Response(404, json={"detail": "Not Found"})
+            return httpx.Response(200, json={"recarga_id": recarga_id, **self.status[recarga_id]})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def fake_recharges_api():
+    """
+    Liga o api_client a um FakeRechargesApi (sem recargas) durante o teste.
+    """
+    from services.api_client import api_client
+
+    api = FakeRechargesApi({})
+    anterior = api_client._client
+    api_client._client = httpx.AsyncClient(transport=httpx.MockTransport(api.handler))
+    api_client._bulk_status_suportado = True
+    try:
+        yield api
+    finally:
+        api_client._client = anterior
+        api_client._bulk_status_suportado = True
+
+
+class FakeRedis:
+    """
+    Substituto local (em memória) do redis.asyncio.Redis, com os comandos
+    usados pelo RedisStorage do aiogram (get, set com 'ex', delete).
+    O relógio ('agora') pode ser avançado para testar a expiração.
+    """
+    def __init__(self):
+        self.valores: dict[str, tuple[bytes, float | None]] = {}
+        self.agora = time.monotonic()
+
+    async def get(self, chave: str) -> bytes | None:
+        valor = self.valores.get(chave)
+        if valor is None:
+            return None
+        if valor[1] is not None and valor[1] <= self.agora:
+            del self.valores[chave]
+            return None
+        return valor[0]
+
+    async def set(self, chave: str, valor: str | bytes, ex: int | None = None) -> bool:
+        if isinstance(valor, str):
+            valor = valor.encode()
+        self.valores[chave] = (valor, self.agora + ex if ex else None)
+        return True
+
+    async def delete(self, *chaves: str) -> int:
+        return sum(self.valores.pop(chave, None) is not None for chave in chaves)
+
+    async def aclose(self, close_connection_pool: bool = True) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.config import settings
+from services.api_client import api_client
+
+
+async def _todas_as_paginas(**kwargs) -> list[tuple[list[int], str | None]]:
+    return [pagina async for pagina in api_client.iter_user_ids(**kwargs)]
+
+
+def test_iter_user_ids_percorre_as_paginas(fake_user_ids_api):
+    paginas = asyncio.run(_todas_as_paginas(page_size=10))
+
+    assert [ids for ids, _ in paginas] == [list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+    assert [cursor for _, cursor in paginas] == ["10", "20", None]
+
+
+def test_iter_user_ids_retoma_do_cursor(fake_user_ids_api):
+    paginas = asyncio.run(_todas_as_paginas(page_size=10, cursor="20"))
+
+    assert paginas == [(list(range(21, 26)), None)]
+
+
+def test_iter_user_ids_sem_endpoint_paginado_falha_sem_fallback(fake_user_ids_api, monkeypatch):
+    fake_user_ids_api.paginado = False
+    monkeypatch.setattr(settings, "API_USER_IDS_FULL_LIST_FALLBACK", False)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_todas_as_paginas(page_size=10))
+    assert not any(p.url.path.endswith("/all-ids") for p in fake_user_ids_api.pedidos)
+
+
+def test_iter_user_ids_fallback_para_lista_completa(fake_user_ids_api, monkeypatch):
+    fake_user_ids_api.paginado = False
+    monkeypatch.setattr(settings, "API_USER_IDS_FULL_LIST_FALLBACK", True)
+
+    paginas = asyncio.run(_todas_as_paginas(page_size=10))
+
+    assert [cursor for _, cursor in paginas] == ["local:10", "local:20", None]
+    assert sum(len(ids) for ids, _ in paginas) == 25
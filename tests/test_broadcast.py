@@ -0,0 +1,128 @@
+import asyncio
+
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import CopyMessage
+
+from services.broadcast import DONE, PAUSED, RUNNING, BroadcastEngine, BroadcastStore
+
+
+class FakeBot:
+    """
+    Bot que regista os envios; os IDs em 'falhar_uma_vez' falham na
+    primeira tentativa com um erro de rede (temporário).
+    """
+    def __init__(self, falhar_uma_vez: set[int] = frozenset(), atraso: float = 0.0):
+        self.enviados: list[int] = []
+        self.falhar_uma_vez = set(falhar_uma_vez)
+        self.atraso = atraso
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int) -> None:
+        await asyncio.sleep(self.atraso)
+        if chat_id in self.falhar_uma_vez:
+            self.falhar_uma_vez.discard(chat_id)
+            raise TelegramNetworkError(
+                method=CopyMessage(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id),
+                message="Request timeout error"
+            )
+        self.enviados.append(chat_id)
+
+    async def edit_message_text(self, **kwargs) -> None:
+        pass
+
+
+async def _esperar_fim(engine: BroadcastEngine, job_id: int) -> dict:
+    while job_id in engine._tasks:
+        await asyncio.sleep(0.01)
+    return await engine.store.get_job(job_id)
+
+
+def test_retomar_envia_so_os_que_faltam(fake_user_ids_api):
+    bot = FakeBot(falhar_uma_vez={3, 17})
+
+    async def cenario():
+        engine = BroadcastEngine(BroadcastStore())
+        await engine.start(bot, retomar=False)
+        job_id = await engine.create_job("copy", 1, 1, 1, None)
+        await engine.start_job(job_id)
+        pausado = await _esperar_fim(engine, job_id)
+        assert await engine.resume_job(job_id)
+        return pausado, await _esperar_fim(engine, job_id)
+
+    pausado, concluido = asyncio.run(cenario())
+
+    # Erros temporários: o job fica em pausa com esses envios pendentes
+    assert pausado["status"] == PAUSED
+    assert concluido["status"] == DONE
+    assert sorted(bot.enviados) == list(range(1, 26))
+    assert concluido["enviados"] == 25
+
+
+def test_retomar_apos_reinicio_sem_duplicados(fake_user_ids_api):
+    bot = FakeBot(atraso=0.005)
+
+    async def cenario():
+        engine = BroadcastEngine(BroadcastStore())
+        await engine.start(bot, retomar=False)
+        job_id = await engine.create_job("copy", 1, 1, 1, None)
+        await engine.start_job(job_id)
+        while len(bot.enviados) < 8:
+            await asyncio.sleep(0.001)
+        # Encerramento a meio: o job continua 'running' na base
+        await engine.stop()
+        interrompido = await engine.store.get_job(job_id)
+
+        # Novo arranque: retoma os jobs 'running'
+        novo = BroadcastEngine(BroadcastStore())
+        await novo.start(bot)
+        return interrompido, await _esperar_fim(novo, job_id)
+
+    interrompido, concluido = asyncio.run(cenario())
+
+    assert interrompido["status"] == RUNNING
+    assert concluido["status"] == DONE
+    assert sorted(bot.enviados) == list(range(1, 26))
+
+
+def test_pausa_e_retoma_imediata(fake_user_ids_api):
+    bot = FakeBot(atraso=0.005)
+
+    async def cenario():
+        engine = BroadcastEngine(BroadcastStore())
+        await engine.start(bot, retomar=False)
+        job_id = await engine.create_job("copy", 1, 1, 1, None)
+        await engine.start_job(job_id)
+        await asyncio.sleep(0.02)
+        assert await engine.pause_job(job_id)
+        assert await engine.resume_job(job_id)
+        return await _esperar_fim(engine, job_id)
+
+    concluido = asyncio.run(cenario())
+
+    assert concluido["status"] == DONE
+    assert sorted(bot.enviados) == list(range(1, 26))
+
+
+def test_job_pedido_num_worker_corre_no_processo_principal(fake_user_ids_api):
+    bot = FakeBot()
+
+    async def cenario():
+        store = BroadcastStore()
+        worker = BroadcastEngine(store)
+        await worker.start(bot, retomar=False, remoto=True)
+        principal = BroadcastEngine(store)
+        await principal.start(bot, retomar=False)
+        vigia = asyncio.create_task(principal.watch(intervalo=0.01))
+        try:
+            job_id = await worker.create_job("copy", 1, 1, 1, None)
+            assert await worker.start_job(job_id)
+            assert worker.progress(job_id) is None
+            while (await store.get_job(job_id))["status"] == RUNNING:
+                await asyncio.sleep(0.01)
+            return await store.get_job(job_id)
+        finally:
+            vigia.cancel()
+
+    concluido = asyncio.run(cenario())
+
+    assert concluido["status"] == DONE
+    assert sorted(bot.enviados) == list(range(1, 26))
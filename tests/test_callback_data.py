@@ -0,0 +1,72 @@
+import asyncio
+import uuid
+
+import pytest
+
+from keyboards.callback_data import (
+    MAX_BYTES, Buy, ConfirmBuy, ShowProduct, SupportOrder, SupportReason,
+    callback_tokens, pack, resolve, unpack
+)
+from services.supervisor import supervisor
+
+PRODUTO_UUID = str(uuid.UUID("7d3c2b1a-0f4e-4c5d-9a8b-112233445566"))
+
+
+@pytest.mark.parametrize("dados", [
+    ShowProduct(PRODUTO_UUID),
+    ShowProduct("42"),
+    ConfirmBuy(PRODUTO_UUID, "AUTOMATICA"),
+    ConfirmBuy("42", "TIPO_NOVO"),
+    Buy("email", PRODUTO_UUID),
+    Buy("manual", "42"),
+    SupportOrder(PRODUTO_UUID),
+    SupportReason("CONTA_CAIU"),
+    SupportReason("MOTIVO_NOVO"),
+])
+def test_pack_unpack_ida_e_volta(dados):
+    texto = pack(dados)
+
+    assert len(texto.encode()) <= MAX_BYTES
+    assert not texto.startswith("T")
+    assert unpack(texto) == dados
+
+
+def test_pack_uuid_cabe_em_poucos_bytes():
+    assert len(pack(Buy("auto", PRODUTO_UUID))) == 26
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    (f"show_product:{PRODUTO_UUID}", ShowProduct(PRODUTO_UUID)),
+    ("confirm_buy:42:SOLICITA_EMAIL", ConfirmBuy("42", "SOLICITA_EMAIL")),
+    ("buy:auto:42", Buy("auto", "42")),
+    ("support_order:99", SupportOrder("99")),
+    ("support_reason:LOGIN_INVALIDO", SupportReason("LOGIN_INVALIDO")),
+])
+def test_unpack_formatos_antigos(texto, esperado):
+    assert unpack(texto) == esperado
+
+
+@pytest.mark.parametrize("texto", [None, "", "show_catalog", "buy:outro:42", "Cs42:z", "Px"])
+def test_unpack_desconhecido(texto):
+    assert unpack(texto) is None
+
+
+def test_token_sobrevive_a_reinicio():
+    async def cenario():
+        dados = ConfirmBuy("x" * 80, "AUTOMATICA")
+        texto = pack(dados)
+        # A gravação na base local corre em segundo plano
+        await supervisor.drain(timeout=5.0)
+        # Reinício: a tabela em memória fica vazia
+        callback_tokens._dados.clear()
+        return texto, dados, unpack(texto), await resolve(texto)
+
+    texto, dados, em_memoria, na_base = asyncio.run(cenario())
+
+    assert texto.startswith("TC")
+    assert em_memoria is None
+    assert na_base == dados
+
+
+def test_token_desconhecido_expirou():
+    assert asyncio.run(resolve("TP" + "a" * 16)) is None
@@ -0,0 +1,118 @@
+import asyncio
+import sys
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from core.config import settings
+from services.fsm_storage import SQLiteStorage, create_fsm_storage, create_redis_storage
+from services.local_db import LocalDatabase
+
+CHAVE = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def _executar(tmp_path, cenario, ttl_segundos=3600):
+    async def correr():
+        db = LocalDatabase(str(tmp_path / "fsm.sqlite3"))
+        try:
+            return await cenario(SQLiteStorage(db, ttl_segundos=ttl_segundos), db)
+        finally:
+            await db.close()
+
+    return asyncio.run(correr())
+
+
+async def _envelhecer(db: LocalDatabase, segundos: float) -> None:
+    await db.execute("UPDATE fsm_storage SET atualizado_em = atualizado_em - ?", (segundos,))
+
+
+def test_estado_e_dados(tmp_path):
+    async def cenario(storage, db):
+        await storage.set_state(CHAVE, "Compra:email")
+        await storage.set_data(CHAVE, {"produto_id": "42"})
+        atualizados = await storage.update_data(CHAVE, {"email": "a@b.c"})
+        return await storage.get_state(CHAVE), await storage.get_data(CHAVE), atualizados
+
+    estado, dados, atualizados = _executar(tmp_path, cenario)
+
+    assert estado == "Compra:email"
+    assert dados == atualizados == {"produto_id": "42", "email": "a@b.c"}
+
+
+def test_sessao_expirada_nao_e_devolvida(tmp_path):
+    async def cenario(storage, db):
+        await storage.set_state(CHAVE, "Compra:email")
+        await storage.set_data(CHAVE, {"produto_id": "42"})
+        await _envelhecer(db, 120)
+        expirada = (await storage.get_state(CHAVE), await storage.get_data(CHAVE))
+        # Um novo estado depois de expirar recomeça sem os dados antigos
+        await storage.set_state(CHAVE, "Recarga:valor")
+        return expirada, await storage.get_state(CHAVE), await storage.get_data(CHAVE)
+
+    expirada, estado, dados = _executar(tmp_path, cenario, ttl_segundos=60)
+
+    assert expirada == (None, {})
+    assert estado == "Recarga:valor"
+    assert dados == {}
+
+
+def test_sem_ttl_nao_expira(tmp_path):
+    async def cenario(storage, db):
+        await storage.set_state(CHAVE, "Compra:email")
+        await _envelhecer(db, 10 * 365 * 24 * 3600)
+        return await storage.get_state(CHAVE)
+
+    assert _executar(tmp_path, cenario, ttl_segundos=None) == "Compra:email"
+
+
+def test_clear_apaga_a_sessao(tmp_path):
+    async def cenario(storage, db):
+        contexto = FSMContext(storage=storage, key=CHAVE)
+        await contexto.set_state("Compra:email")
+        await contexto.update_data(produto_id="42")
+        await contexto.clear()
+        linhas = await db.fetchall("SELECT chave FROM fsm_storage")
+        return await contexto.get_state(), await contexto.get_data(), linhas
+
+    estado, dados, linhas = _executar(tmp_path, cenario)
+
+    assert estado is None
+    assert dados == {}
+    assert linhas == []
+
+
+def test_redis_estado_dados_e_ttl(fake_redis):
+    pytest.importorskip("redis")
+
+    async def cenario():
+        storage = create_redis_storage(fake_redis, ttl_segundos=60)
+        contexto = FSMContext(storage=storage, key=CHAVE)
+        await contexto.set_state("Compra:email")
+        await contexto.update_data(produto_id="42")
+        ativa = (await contexto.get_state(), await contexto.get_data(), sorted(fake_redis.valores))
+
+        fake_redis.agora += 61
+        expirada = (await contexto.get_state(), await contexto.get_data())
+
+        await contexto.set_state("Recarga:valor")
+        await contexto.clear()
+        await storage.close()
+        return ativa, expirada, fake_redis.valores
+
+    (estado, dados, chaves), expirada, restantes = asyncio.run(cenario())
+
+    assert estado == "Compra:email"
+    assert dados == {"produto_id": "42"}
+    assert chaves == ["fsm:10:10:default:data", "fsm:10:10:default:state"]
+    assert expirada == (None, {})
+    assert restantes == {}
+
+
+def test_redis_sem_pacote_falha(monkeypatch):
+    monkeypatch.setattr(settings, "FSM_STORAGE", "redis")
+    # None em sys.modules faz o import falhar com ImportError
+    monkeypatch.setitem(sys.modules, "redis.asyncio", None)
+
+    with pytest.raises(RuntimeError):
+        create_fsm_storage()
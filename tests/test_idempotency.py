@@ -0,0 +1,81 @@
+import asyncio
+
+from services.idempotency import IdempotentResults, make_idempotency_key
+
+
+def test_make_idempotency_key():
+    assert make_idempotency_key("compra", 1, "abc") == "compra:1:abc"
+    assert make_idempotency_key("compra") != make_idempotency_key("compra")
+
+
+def test_pedidos_simultaneos_chamam_a_api_uma_vez():
+    resultados = IdempotentResults(ttl_segundos=60, max_entradas=10)
+    chamadas = []
+
+    async def factory():
+        chamadas.append(1)
+        await asyncio.sleep(0.01)
+        return {"sucesso": True}
+
+    async def cenario():
+        return await asyncio.gather(*(
+            resultados.run("compra:1", factory, definitivo=lambda r: True) for _ in range(5)
+        ))
+
+    respostas = asyncio.run(cenario())
+
+    assert len(chamadas) == 1
+    assert all(resposta == {"sucesso": True} for resposta in respostas)
+    assert resultados.repetidos == 4
+
+
+def test_resultado_definitivo_e_reutilizado():
+    resultados = IdempotentResults(ttl_segundos=60, max_entradas=10)
+    chamadas = []
+
+    async def factory():
+        chamadas.append(1)
+        return len(chamadas)
+
+    async def cenario():
+        primeiro = await resultados.run("compra:1", factory, definitivo=lambda r: True)
+        segundo = await resultados.run("compra:1", factory, definitivo=lambda r: True)
+        outra_chave = await resultados.run("compra:2", factory, definitivo=lambda r: True)
+        return primeiro, segundo, outra_chave
+
+    assert asyncio.run(cenario()) == (1, 1, 2)
+
+
+def test_resultado_indefinido_nao_fica_guardado():
+    resultados = IdempotentResults(ttl_segundos=60, max_entradas=10)
+    chamadas = []
+
+    async def factory():
+        chamadas.append(1)
+        return None  # ex: API offline
+
+    async def cenario():
+        for _ in range(2):
+            await resultados.run("compra:1", factory, definitivo=lambda r: r is not None)
+
+    asyncio.run(cenario())
+
+    assert len(chamadas) == 2
+    assert resultados.repetidos == 0
+
+
+def test_resultado_expira_depois_do_ttl():
+    resultados = IdempotentResults(ttl_segundos=0, max_entradas=10)
+    chamadas = []
+
+    async def factory():
+        chamadas.append(1)
+        return True
+
+    async def cenario():
+        for _ in range(2):
+            await resultados.run("compra:1", factory, definitivo=lambda r: True)
+
+    asyncio.run(cenario())
+
+    assert len(chamadas) == 2
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from services.api_client import api_client
+from services.local_db import local_db
+from services.recharge_poller import RechargePoller
+
+
+class FakeBot:
+    def __init__(self):
+        self.mensagens: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.mensagens.append((chat_id, text))
+
+
+def _novo_poller() -> tuple[RechargePoller, FakeBot]:
+    poller = RechargePoller(
+        tamanho_lote=10,
+        concorrencia=2,
+        intervalo_min=30.0,
+        intervalo_max=60.0,
+        margem_segundos=0.0,
+        status_pagos=["PAGO", "APROVADO"]
+    )
+    bot = FakeBot()
+    poller._bot = bot
+    return poller, bot
+
+
+async def _acompanhar(poller: RechargePoller, recargas: list[tuple[str, int, int | None]]) -> None:
+    await poller._garantir_schema()
+    await local_db.execute("DELETE FROM open_recharges")
+    for recarga_id, telegram_id, expiracao_minutos in recargas:
+        await poller.track(recarga_id, telegram_id, 10.0, expiracao_minutos)
+    # Verificação já vencida (sem esperar o intervalo mínimo)
+    await local_db.execute("UPDATE open_recharges SET proxima_verificacao = 0")
+
+
+def _pedidos(api) -> list[tuple[str, str]]:
+    return [(pedido.method, pedido.url.path.rsplit("/recargas", 1)[-1]) for pedido in api.pedidos]
+
+
+def test_consulta_em_lote_e_aviso_de_pagamento(fake_recharges_api):
+    fake_recharges_api.status = {
+        "r1": {"status_pagamento": "pago", "valor": 25},
+        "r2": {"status_pagamento": "PENDENTE"},
+    }
+    poller, bot = _novo_poller()
+
+    async def cenario():
+        await _acompanhar(poller, [("r1", 101, 30), ("r2", 102, 30)])
+        await poller._verificar_vencidas()
+        return await poller.em_aberto()
+
+    em_aberto = asyncio.run(cenario())
+
+    # Um único pedido por lote (a recarga pendente fica para depois do intervalo)
+    assert _pedidos(fake_recharges_api) == [("POST", "/status")]
+    assert [chat_id for chat_id, _ in bot.mensagens] == [101]
+    assert "R$ 25.00" in bot.mensagens[0][1]
+    assert em_aberto == 1
+
+
+@pytest.mark.parametrize("codigo", [404, 405])
+def test_sem_endpoint_em_lote_consulta_uma_a_uma(fake_recharges_api, codigo):
+    fake_recharges_api.status_lote = codigo
+    fake_recharges_api.status = {
+        "r1": {"status_pagamento": "APROVADO"},
+        "r2": {"status_pagamento": "FALHOU"},
+    }
+    poller, bot = _novo_poller()
+
+    async def cenario():
+        await _acompanhar(poller, [("r1", 101, 30), ("r2", 102, 30)])
+        await poller._verificar_vencidas()
+        # A API não tem o endpoint: as consultas seguintes já não o tentam
+        await _acompanhar(poller, [("r3", 103, 30)])
+        fake_recharges_api.status["r3"] = {"status_pagamento": "PENDENTE"}
+        await poller._verificar_vencidas()
+        return await poller.em_aberto()
+
+    em_aberto = asyncio.run(cenario())
+
+    assert sorted(_pedidos(fake_recharges_api)) == [
+        ("GET", "/r1"), ("GET", "/r2"), ("GET", "/r3"), ("POST", "/status")
+    ]
+    assert api_client._bulk_status_suportado is False
+    assert [chat_id for chat_id, _ in bot.mensagens] == [101]
+    assert em_aberto == 1
+
+
+def test_recarga_expirada_deixa_de_ser_acompanhada(fake_recharges_api):
+    fake_recharges_api.status = {
+        "r1": {"status_pagamento": "PENDENTE"},
+        "r2": {"status_pagamento": "PENDENTE", "expirado": True},
+        "r3": {"status_pagamento": "PENDENTE"},
+    }
+    poller, bot = _novo_poller()
+
+    async def cenario():
+        # r1: o prazo do PIX já passou; r2: a API indica que expirou
+        await _acompanhar(poller, [("r1", 101, -1), ("r2", 102, 30), ("r3", 103, 30)])
+        await poller._verificar_vencidas()
+        rows = await local_db.fetchall("SELECT recarga_id FROM open_recharges")
+        return [row["recarga_id"] for row in rows]
+
+    em_aberto = asyncio.run(cenario())
+
+    assert em_aberto == ["r3"]
+    assert bot.mensagens == []